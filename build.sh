@@ -16,6 +16,9 @@ python manage.py collectstatic --noinput
 # Run database migrations
 python manage.py migrate
 
+# Tables for the shared database cache (no-op when REDIS_URL is set)
+python manage.py createcachetable
+
 # Create superuser if it doesn't exist (for initial setup)
 echo "Creating superuser if needed..."
 python manage.py shell -c "
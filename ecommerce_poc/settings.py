@@ -43,6 +43,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'shop.middleware.CartMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -75,6 +76,8 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Concurrent writers wait for the lock instead of failing at once
+        'OPTIONS': {'timeout': 20},
     }
 }
 
@@ -122,4 +125,41 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.x/ref/settings/#default-auto-field
 
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+# Shop
+# Where anonymous visitors' carts live: 'db' (Cart/CartItem rows), 'cache'
+# (Django cache, keyed by a signed cookie) or 'cookie' (a signed cookie).
+# With 'cache' or 'cookie' nothing is written to the database until checkout.
+SHOP_ANONYMOUS_CART_BACKEND = 'db'
+SHOP_ANONYMOUS_CART_TIMEOUT = 60 * 60 * 24 * 14
+
+# Anonymous GETs of the home, product list and product pages are served from a
+# full-page cache for this many seconds (0 disables it); catalogue changes
+# retire cached pages immediately.
+SHOP_PAGE_CACHE_TIMEOUT = 60 * 5
+
+# Serve home, listing and product pages from an in-memory snapshot of the
+# catalogue in each worker (no catalogue SQL). It is rebuilt when the catalogue
+# version changes, and at least every SHOP_CATALOGUE_SNAPSHOT_MAX_AGE seconds
+# so stock levels stay fresh. `manage.py catalogue_snapshot` reports its size.
+SHOP_CATALOGUE_SNAPSHOT = False
+SHOP_CATALOGUE_SNAPSHOT_MAX_AGE = 60 * 5
+
+# Listing query results (product ids per page, counts, product rows) are cached
+# in their own cache so they can be bounded and evicted LRU without pushing
+# pages and carts out of 'default'. LocMemCache is per process, which is only
+# right for a single-process dev server: 'default' holds the catalogue version
+# every worker must agree on, so settings_production shares both caches (Redis
+# with maxmemory-policy allkeys-lru, or the database).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalogue': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shop-catalogue',
+        'TIMEOUT': 60 * 10,
+        'OPTIONS': {'MAX_ENTRIES': 20000, 'CULL_FREQUENCY': 10},
+    },
+}
+SHOP_QUERY_CACHE_ALIAS = 'catalogue'
@@ -76,6 +76,39 @@ else:
         }
     }
 
+# Caches shared by every gunicorn worker. The catalogue version that retires
+# cached fragments, pages, query results and snapshots lives in 'default', so a
+# per-process LocMemCache would let one worker's bump go unseen by the others.
+# Redis when REDIS_URL is set, otherwise the database (`createcachetable`).
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'default',
+        },
+        'catalogue': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'catalogue',
+            'TIMEOUT': 60 * 10,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'shop_cache',
+        },
+        'catalogue': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'shop_catalogue_cache',
+            'TIMEOUT': 60 * 10,
+            'OPTIONS': {'MAX_ENTRIES': 20000, 'CULL_FREQUENCY': 10},
+        },
+    }
+
 # Add WhiteNoise middleware for static files
 MIDDLEWARE.insert(1, 'whitenoise.middleware.WhiteNoiseMiddleware')
 
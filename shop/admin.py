@@ -1,11 +1,18 @@
 from django.contrib import admin, messages
 from django.contrib.admin import AdminSite
+from django.utils import timezone
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
 from django.db.models import Count, Sum, Q
 from django.contrib.admin import SimpleListFilter
 from .models import Category, Product, Order, OrderItem
+from .categories import with_product_counts
+from .dashboard import get_dashboard_stats
+from .exports import ORDER_COLUMNS, PRODUCT_COLUMNS, export_response
+from .fragments import invalidate_catalogue_fragments
+from .pagination import EstimatedCountPaginator
+from .rollups import change_order_status
 
 class IsActiveFilter(SimpleListFilter):
     title = 'Status'
@@ -43,7 +50,7 @@ class StockFilter(SimpleListFilter):
             return queryset.filter(stock=0)
 
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ['name', 'slug', 'product_count', 'is_active', 'created_at']
+    list_display = ['name', 'slug', 'product_count', 'active_product_count', 'is_active', 'created_at']
     list_filter = [IsActiveFilter, 'created_at']
     search_fields = ['name', 'description']
     prepopulated_fields = {'slug': ('name',)}
@@ -62,13 +69,26 @@ class CategoryAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        return with_product_counts(super().get_queryset(request))
+    
     def product_count(self, obj):
-        count = obj.products.count()
+        count = obj.product_total
         if count > 0:
             url = reverse('admin:shop_product_changelist') + f'?category__id__exact={obj.id}'
             return format_html('<a href="{}">{} products</a>', url, count)
         return '0 products'
     product_count.short_description = 'Products'
+    product_count.admin_order_field = 'product_total'
+    
+    def active_product_count(self, obj):
+        count = obj.active_product_count
+        if count > 0:
+            url = reverse('admin:shop_product_changelist') + f'?category__id__exact={obj.id}&is_active=active'
+            return format_html('<a href="{}">{} active</a>', url, count)
+        return '0 active'
+    active_product_count.short_description = 'Active'
+    active_product_count.admin_order_field = 'active_product_count'
 
 class ProductAdmin(admin.ModelAdmin):
     list_display = ['image_thumbnail', 'name', 'category', 'price', 'stock', 'stock_status', 'is_featured', 'is_active', 'edit_links', 'created_at']
@@ -78,7 +98,7 @@ class ProductAdmin(admin.ModelAdmin):
     list_editable = ['price', 'stock', 'is_featured', 'is_active']
     readonly_fields = ['created_at', 'updated_at', 'image_preview']
     list_per_page = 25
-    actions = ['make_featured', 'make_unfeatured', 'activate_products', 'deactivate_products']
+    actions = ['make_featured', 'make_unfeatured', 'activate_products', 'deactivate_products', 'export_csv', 'export_csv_gzip']
     
     fieldsets = (
         ('Basic Information', {
@@ -142,25 +162,38 @@ class ProductAdmin(admin.ModelAdmin):
     edit_links.allow_tags = True
     
     def make_featured(self, request, queryset):
-        updated = queryset.update(is_featured=True)
+        updated = queryset.update(is_featured=True, updated_at=timezone.now())
+        # update() sends no signals, so move the cached fragments on here
+        invalidate_catalogue_fragments()
         self.message_user(request, f'{updated} products were marked as featured.')
     make_featured.short_description = "Mark selected products as featured"
     
     def make_unfeatured(self, request, queryset):
-        updated = queryset.update(is_featured=False)
+        updated = queryset.update(is_featured=False, updated_at=timezone.now())
+        invalidate_catalogue_fragments()
         self.message_user(request, f'{updated} products were unmarked as featured.')
     make_unfeatured.short_description = "Mark selected products as not featured"
     
     def activate_products(self, request, queryset):
-        updated = queryset.update(is_active=True)
+        updated = queryset.update(is_active=True, updated_at=timezone.now())
+        invalidate_catalogue_fragments()
         self.message_user(request, f'{updated} products were activated.')
     activate_products.short_description = "Activate selected products"
     
     def deactivate_products(self, request, queryset):
-        updated = queryset.update(is_active=False)
+        updated = queryset.update(is_active=False, updated_at=timezone.now())
+        invalidate_catalogue_fragments()
         self.message_user(request, f'{updated} products were deactivated.')
     deactivate_products.short_description = "Deactivate selected products"
     
+    def export_csv(self, request, queryset):
+        return export_response(queryset, PRODUCT_COLUMNS, 'products')
+    export_csv.short_description = "Export selected products as CSV"
+    
+    def export_csv_gzip(self, request, queryset):
+        return export_response(queryset, PRODUCT_COLUMNS, 'products', compress=True)
+    export_csv_gzip.short_description = "Export selected products as gzipped CSV"
+    
     def save_model(self, request, obj, form, change):
         super().save_model(request, obj, form, change)
         if not change:  # New product
@@ -188,12 +221,18 @@ class OrderItemInline(admin.TabularInline):
         return False
 
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ['id', 'customer_name', 'email', 'status', 'total_cost', 'item_count', 'created_at', 'order_actions']
+    list_display = ['id', 'customer_name', 'email', 'status', 'subtotal', 'item_count', 'created_at', 'order_actions']
     list_filter = ['status', 'created_at', 'city']
     search_fields = ['first_name', 'last_name', 'email', 'id']
-    readonly_fields = ['user', 'first_name', 'last_name', 'email', 'address', 'postal_code', 'city', 'created_at', 'updated_at', 'total_cost', 'item_count']
+    readonly_fields = ['user', 'first_name', 'last_name', 'email', 'address', 'postal_code', 'city', 'created_at', 'updated_at', 'subtotal', 'item_count']
     list_per_page = 25
-    actions = ['mark_as_processing', 'mark_as_shipped', 'mark_as_delivered', 'mark_as_cancelled']
+    # Totals are stored on Order, so every column is a plain, sortable field
+    # and the page needs no per-row queries. At millions of orders the
+    # COUNT(*) queries are the remaining cost: use the planner's estimate
+    # for the unfiltered list and skip the second, unfiltered count.
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['mark_as_processing', 'mark_as_shipped', 'mark_as_delivered', 'mark_as_cancelled', 'export_csv', 'export_csv_gzip']
     
     # Use custom template for change form (order details view)
     change_form_template = 'admin/shop/order/change_form.html'
@@ -221,7 +260,7 @@ class OrderAdmin(admin.ModelAdmin):
             'fields': ('address', 'postal_code', 'city')
         }),
         ('Order Details', {
-            'fields': ('status', 'total_cost', 'created_at', 'updated_at')
+            'fields': ('status', 'subtotal', 'item_count', 'created_at', 'updated_at')
         }),
     )
     
@@ -241,10 +280,6 @@ class OrderAdmin(admin.ModelAdmin):
         return format_html('<span class="badge bg-{}">{}</span>', color, obj.get_status_display())
     status_badge.short_description = 'Status'
     
-    def item_count(self, obj):
-        return obj.items.count()
-    item_count.short_description = 'Items'
-    
     def order_actions(self, obj):
         if obj.pk:
             view_url = reverse('admin:shop_order_change', args=[obj.pk])
@@ -258,25 +293,33 @@ class OrderAdmin(admin.ModelAdmin):
     order_actions.allow_tags = True
     
     def mark_as_processing(self, request, queryset):
-        updated = queryset.update(status='processing')
+        updated = change_order_status(queryset, 'processing')
         self.message_user(request, f'{updated} orders were marked as processing.')
     mark_as_processing.short_description = "Mark selected orders as processing"
     
     def mark_as_shipped(self, request, queryset):
-        updated = queryset.update(status='shipped')
+        updated = change_order_status(queryset, 'shipped')
         self.message_user(request, f'{updated} orders were marked as shipped.')
     mark_as_shipped.short_description = "Mark selected orders as shipped"
     
     def mark_as_delivered(self, request, queryset):
-        updated = queryset.update(status='delivered')
+        updated = change_order_status(queryset, 'delivered')
         self.message_user(request, f'{updated} orders were marked as delivered.')
     mark_as_delivered.short_description = "Mark selected orders as delivered"
     
     def mark_as_cancelled(self, request, queryset):
-        updated = queryset.update(status='cancelled')
+        updated = change_order_status(queryset, 'cancelled')
         self.message_user(request, f'{updated} orders were marked as cancelled.')
     mark_as_cancelled.short_description = "Mark selected orders as cancelled"
     
+    def export_csv(self, request, queryset):
+        return export_response(queryset, ORDER_COLUMNS, 'orders')
+    export_csv.short_description = "Export selected orders as CSV"
+    
+    def export_csv_gzip(self, request, queryset):
+        return export_response(queryset, ORDER_COLUMNS, 'orders', compress=True)
+    export_csv_gzip.short_description = "Export selected orders as gzipped CSV"
+    
     def change_view(self, request, object_id, form_url='', extra_context=None):
         """Handle status updates from the custom template"""
         if request.method == 'POST' and 'status' in request.POST:
@@ -286,8 +329,8 @@ class OrderAdmin(admin.ModelAdmin):
                 new_status = request.POST['status']
                 
                 if new_status in ['pending', 'processing', 'shipped', 'delivered', 'cancelled']:
-                    order.status = new_status
-                    order.save()
+                    # Moves the order's sales in the daily rollup in the same transaction
+                    change_order_status(Order.objects.filter(pk=order.pk), new_status)
                     messages.success(request, f'Order #{order.id} status updated from {old_status.title()} to {new_status.title()}.')
                 else:
                     messages.error(request, 'Invalid status selected.')
@@ -342,6 +385,11 @@ class CustomAdminSite(AdminSite):
         self.login_template = 'admin/login.html'
         self.index_template = 'admin/index.html'
         self.app_index_template = 'admin/index.html'
+    
+    def index(self, request, extra_context=None):
+        """Dashboard with store statistics from the cached stats service"""
+        context = {**get_dashboard_stats(), **(extra_context or {})}
+        return super().index(request, extra_context=context)
 
 # Create custom admin site instance
 custom_admin_site = CustomAdminSite(name='custom_admin')
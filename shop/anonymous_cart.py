@@ -0,0 +1,282 @@
+"""
+Anonymous carts kept outside the database.
+
+With ``SHOP_ANONYMOUS_CART_BACKEND = 'cache'`` or ``'cookie'`` an anonymous
+visitor's cart lives in the Django cache (keyed by a signed cookie token) or
+entirely in a signed cookie. Nothing is written to ``Cart``/``CartItem``; the
+lines only reach the database as ``OrderItem`` rows when checkout places the
+order. Authenticated users always use model-backed carts.
+"""
+import json
+import secrets
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import CartItem, Product
+
+CART_COOKIE_NAME = 'shop_cart'
+CART_COOKIE_SALT = 'shop.anonymous_cart'
+# Keep signed-cookie carts comfortably below the 4KB cookie limit
+MAX_COOKIE_LINES = 50
+
+
+class CartFull(Exception):
+    """Raised when adding a new product would exceed the storage's line limit"""
+
+    def __init__(self, max_lines):
+        self.max_lines = max_lines
+        super().__init__(
+            f'Your cart can hold at most {max_lines} different products. '
+            'Remove something before adding another.'
+        )
+
+
+class AnonymousCartLine:
+    """One line of an anonymous cart, shaped like ``CartItem`` for templates"""
+
+    def __init__(self, product, quantity):
+        self.product = product
+        self.quantity = quantity
+
+    @property
+    def id(self):
+        # Lines are unique per product, so the product id identifies the line
+        return self.product.id
+
+    pk = id
+
+    @property
+    def total_price(self):
+        return self.quantity * self.product.price
+
+
+class AnonymousCartItems:
+    """The small subset of the ``cart.items`` manager API the views use"""
+
+    def __init__(self, cart):
+        self.cart = cart
+
+    def _lines(self):
+        return self.cart.lines()
+
+    def all(self):
+        return self
+
+    def select_related(self, *fields):
+        return self
+
+    def get(self, id):
+        for line in self._lines():
+            if str(line.id) == str(id):
+                return line
+        raise CartItem.DoesNotExist
+
+    def exists(self):
+        return bool(self.cart.quantities)
+
+    def count(self):
+        return len(self.cart.quantities)
+
+    def __iter__(self):
+        return iter(self._lines())
+
+    def __len__(self):
+        return len(self._lines())
+
+    def __bool__(self):
+        return self.exists()
+
+
+class AnonymousCart:
+    """A cart that quacks like ``Cart`` but is stored in the cache or a cookie
+
+    ``quantities`` and ``prices`` map product ids to the line quantity and
+    the unit price seen when the line last changed, so the nav badge and
+    AJAX totals never need a query.
+    """
+
+    pk = id = None
+    user = None
+
+    def __init__(self, storage, token=None, quantities=None, prices=None):
+        self.storage = storage
+        self.token = token
+        self.quantities = quantities or {}
+        self.prices = prices or {}
+        self.modified = False
+        self._lines = None
+
+    # -- Cart interface ---------------------------------------------------
+
+    @property
+    def items(self):
+        return AnonymousCartItems(self)
+
+    @property
+    def item_count(self):
+        return sum(self.quantities.values())
+
+    @property
+    def subtotal(self):
+        return sum(
+            (self.prices[product_id] * quantity for product_id, quantity in self.quantities.items()),
+            Decimal('0.00'),
+        )
+
+    @property
+    def totals(self):
+        return self.item_count, self.subtotal
+
+    @property
+    def total_items(self):
+        return self.item_count
+
+    @property
+    def total_price(self):
+        return self.subtotal
+
+    # -- Mutations (called through shop.cart services) --------------------
+
+    def add_item(self, product, quantity):
+        max_lines = getattr(self.storage, 'max_lines', None)
+        if max_lines is not None and product.id not in self.quantities and len(self.quantities) >= max_lines:
+            raise CartFull(max_lines)
+        self.quantities[product.id] = self.quantities.get(product.id, 0) + quantity
+        self.prices[product.id] = product.price
+        self._changed()
+
+    def set_item_quantity(self, cart_item, quantity):
+        if quantity > 0:
+            self.quantities[cart_item.product.id] = quantity
+            self.prices[cart_item.product.id] = cart_item.product.price
+            cart_item.quantity = quantity
+        else:
+            self.remove_item(cart_item)
+            return
+        self._changed()
+
+    def remove_item(self, cart_item):
+        self.quantities.pop(cart_item.product.id, None)
+        self.prices.pop(cart_item.product.id, None)
+        self._changed()
+
+    def clear(self):
+        self.quantities, self.prices = {}, {}
+        self._changed()
+
+    def _changed(self):
+        self.modified = True
+        self._lines = None
+
+    # -- Hydration ----------------------------------------------------------
+
+    def lines(self):
+        """Lines with live products; refreshes prices and drops dead products"""
+        if self._lines is None:
+            products = Product.objects.filter(is_active=True).in_bulk(list(self.quantities))
+            for product_id in list(self.quantities):
+                product = products.get(product_id)
+                if product is None:
+                    self.quantities.pop(product_id)
+                    self.prices.pop(product_id, None)
+                    self.modified = True
+                elif self.prices.get(product_id) != product.price:
+                    self.prices[product_id] = product.price
+                    self.modified = True
+            self._lines = [
+                AnonymousCartLine(products[product_id], quantity)
+                for product_id, quantity in self.quantities.items()
+            ]
+        return self._lines
+
+    # -- Serialization ------------------------------------------------------
+
+    def to_dict(self):
+        return {
+            str(product_id): [quantity, str(self.prices[product_id])]
+            for product_id, quantity in self.quantities.items()
+        }
+
+    @classmethod
+    def from_dict(cls, storage, data, token=None):
+        quantities, prices = {}, {}
+        try:
+            for product_id, (quantity, price) in data.items():
+                quantities[int(product_id)] = int(quantity)
+                prices[int(product_id)] = Decimal(price)
+        except (TypeError, ValueError, ArithmeticError):
+            return None
+        return cls(storage, token=token, quantities=quantities, prices=prices)
+
+
+class CacheCartStorage:
+    """Cart lines in the Django cache, found through a signed cookie token"""
+
+    def _key(self, token):
+        return f'shop:anonymous-cart:{token}'
+
+    def timeout(self):
+        return getattr(settings, 'SHOP_ANONYMOUS_CART_TIMEOUT', 60 * 60 * 24 * 14)
+
+    def load(self, request):
+        token = request.get_signed_cookie(CART_COOKIE_NAME, default=None, salt=CART_COOKIE_SALT)
+        if not token:
+            return None
+        data = cache.get(self._key(token))
+        if data is None:
+            return None
+        return AnonymousCart.from_dict(self, data, token=token)
+
+    def new_cart(self):
+        return AnonymousCart(self, token=secrets.token_urlsafe(16))
+
+    def save(self, cart, response):
+        cache.set(self._key(cart.token), cart.to_dict(), self.timeout())
+        response.set_signed_cookie(
+            CART_COOKIE_NAME, cart.token, salt=CART_COOKIE_SALT,
+            max_age=self.timeout(), httponly=True, samesite='Lax',
+        )
+
+
+class SignedCookieCartStorage:
+    """Cart lines serialized straight into a signed cookie"""
+
+    max_lines = MAX_COOKIE_LINES
+
+    def timeout(self):
+        return getattr(settings, 'SHOP_ANONYMOUS_CART_TIMEOUT', 60 * 60 * 24 * 14)
+
+    def load(self, request):
+        value = request.get_signed_cookie(CART_COOKIE_NAME, default=None, salt=CART_COOKIE_SALT)
+        if not value:
+            return None
+        try:
+            data = json.loads(value)
+        except ValueError:
+            return None
+        return AnonymousCart.from_dict(self, data)
+
+    def new_cart(self):
+        return AnonymousCart(self)
+
+    def save(self, cart, response):
+        response.set_signed_cookie(
+            CART_COOKIE_NAME, json.dumps(cart.to_dict(), separators=(',', ':')), salt=CART_COOKIE_SALT,
+            max_age=self.timeout(), httponly=True, samesite='Lax',
+        )
+
+
+ANONYMOUS_CART_STORAGES = {
+    'cache': CacheCartStorage,
+    'cookie': SignedCookieCartStorage,
+}
+
+
+def get_anonymous_cart_storage():
+    """Storage for anonymous carts, or None when they use Cart/CartItem rows"""
+    backend = getattr(settings, 'SHOP_ANONYMOUS_CART_BACKEND', 'db')
+    if backend == 'db':
+        return None
+    return ANONYMOUS_CART_STORAGES[backend]()
@@ -0,0 +1,392 @@
+"""
+Benchmark scenarios run by ``python manage.py benchmark <scenario>``.
+
+Every scenario runs against a throwaway database created next to the
+configured one, so benchmarks never touch real data.
+"""
+import csv
+import gc
+import io
+import os
+import random
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from .exports import ORDER_COLUMNS, PRODUCT_COLUMNS, export_stream
+from .fragments import catalogue_version
+from .models import Category, Order, Product
+from .pagination import KeysetPaginator, SORT_ORDERINGS
+from .search import get_search_backend, search_products
+from .snapshot import CatalogueSnapshot, clear_catalogue_snapshot, measure_memory
+
+SCENARIOS = {}
+
+WORDS = [
+    'wireless', 'bluetooth', 'headphones', 'cotton', 'shirt', 'denim', 'jeans',
+    'coffee', 'maker', 'garden', 'tools', 'yoga', 'mat', 'running', 'shoes',
+    'programming', 'guide', 'cookbook', 'smart', 'watch', 'winter', 'jacket',
+    'laptop', 'phone', 'camera', 'leather', 'wallet', 'kitchen', 'knife',
+    'ceramic', 'mug', 'travel', 'backpack', 'water', 'bottle', 'desk', 'lamp',
+    'premium', 'classic', 'lightweight', 'durable', 'organic', 'portable',
+]
+
+# Synthetic filler words so real terms are as selective as in a real catalogue
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'ze', 'por', 'lin', 'dak', 'mer', 'tos', 'bel', 'gra', 'fen', 'qui', 'hal', 'jor']
+VOCABULARY = WORDS + [a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES]
+
+
+def scenario(name):
+    """Register a benchmark scenario under ``name``"""
+    def decorator(func):
+        SCENARIOS[name] = func
+        return func
+    return decorator
+
+
+@contextmanager
+def benchmark_database(verbosity=0):
+    """Create, migrate and finally destroy a dedicated benchmark database"""
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    original_test_name = test_settings.get('NAME')
+    if connection.vendor == 'sqlite' and not original_test_name:
+        # Use a real file so timings include disk I/O like the dev database
+        test_settings['NAME'] = os.path.join(tempfile.gettempdir(), 'shop_benchmark.sqlite3')
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        test_settings['NAME'] = original_test_name
+
+
+def timed(func, repeat):
+    """Run ``func`` ``repeat`` times and return the median wall time in ms"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def random_text(rng, words):
+    return ' '.join(rng.choice(VOCABULARY) for _ in range(words))
+
+
+def seed_catalogue(size, categories=20, batch_size=5000, seed=42):
+    """Bulk insert ``size`` synthetic products spread over ``categories``"""
+    rng = random.Random(seed)
+    category_objs = Category.objects.bulk_create([
+        Category(name=f'Category {i}', slug=f'category-{i}') for i in range(categories)
+    ])
+    batch = []
+    for i in range(size):
+        batch.append(Product(
+            name=f'{random_text(rng, 3).title()} {i}',
+            slug=f'product-{i}',
+            description=random_text(rng, 40),
+            short_description=random_text(rng, 8),
+            price=Decimal(rng.randint(100, 100000)) / 100,
+            category=category_objs[i % categories],
+            stock=rng.randint(0, 100),
+            is_featured=rng.random() < 0.05,
+            is_active=rng.random() < 0.95,
+        ))
+        if len(batch) >= batch_size:
+            Product.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        Product.objects.bulk_create(batch)
+    # bulk_create skips post_save, so populate the search index in one pass
+    get_search_backend().rebuild()
+    return category_objs
+
+
+def is_write(sql):
+    return sql.lstrip().split(None, 1)[0].upper() in ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+def measure_request(make_request, repeat):
+    """Median latency in ms and DB writes per call of ``make_request``"""
+    samples, writes = [], 0
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            make_request()
+            samples.append((time.perf_counter() - start) * 1000)
+        writes += sum(1 for query in queries.captured_queries if is_write(query['sql']))
+    return statistics.median(samples), writes / repeat
+
+
+def legacy_search(queryset, query):
+    return queryset.filter(
+        Q(name__icontains=query) |
+        Q(description__icontains=query) |
+        Q(short_description__icontains=query)
+    )
+
+
+@scenario('search')
+def bench_search(stdout, sizes, repeat):
+    """Triple icontains scan vs the full-text search backend"""
+    queries = ['headphones', 'leather wallet', 'organic cotton shirt']
+    stdout.write(f'backend: {get_search_backend().__class__.__name__}')
+    stdout.write(f'{"products":>10} {"query":<22} {"icontains ms":>13} {"fulltext ms":>12}')
+    for size in sizes:
+        with benchmark_database():
+            seed_catalogue(size)
+            base = Product.objects.filter(is_active=True)
+            for query in queries:
+                def run_legacy():
+                    qs = legacy_search(base, query).order_by('name')
+                    qs.count()
+                    list(qs[:12])
+
+                def run_fulltext():
+                    qs = search_products(base, query).order_by('-search_rank', 'name')
+                    qs.count()
+                    list(qs[:12])
+
+                legacy_ms = timed(run_legacy, repeat)
+                fulltext_ms = timed(run_fulltext, repeat)
+                stdout.write(f'{size:>10} {query:<22} {legacy_ms:>13.2f} {fulltext_ms:>12.2f}')
+
+
+@scenario('pagination')
+def bench_pagination(stdout, sizes, repeat, per_page=12):
+    """COUNT + OFFSET pages vs keyset cursors at increasing depth"""
+    stdout.write(f'{"products":>10} {"sort":<11} {"page":>8} {"offset ms":>10} {"keyset ms":>10}')
+    for size in sizes:
+        with benchmark_database():
+            seed_catalogue(size)
+            base = Product.objects.filter(is_active=True)
+            num_pages = max(1, base.count() // per_page)
+            for sort, ordering in SORT_ORDERINGS.items():
+                keyset = KeysetPaginator(base, per_page, sort)
+                for depth in (0.0, 0.1, 0.5, 0.9):
+                    page_number = max(1, int(num_pages * depth))
+                    # Cursor pointing at the last row of the previous page
+                    token = None
+                    if page_number > 1:
+                        anchor = base.order_by(*ordering)[(page_number - 1) * per_page - 1]
+                        token = keyset.encode_cursor(anchor, 'next')
+                    offset_ms = timed(
+                        lambda: list(Paginator(base.order_by(*ordering), per_page).get_page(page_number)),
+                        repeat,
+                    )
+                    keyset_ms = timed(lambda: list(keyset.get_page(token)), repeat)
+                    stdout.write(f'{size:>10} {sort:<11} {page_number:>8} {offset_ms:>10.2f} {keyset_ms:>10.2f}')
+
+
+@scenario('anonymous_writes')
+def bench_anonymous_writes(stdout, sizes, repeat):
+    """DB writes and latency per anonymous (cookieless) page view"""
+    stdout.write(f'{"products":>10} {"request":<28} {"ms":>8} {"writes/req":>11}')
+    for size in sizes:
+        with benchmark_database(), override_settings(ALLOWED_HOSTS=['*']):
+            seed_catalogue(size)
+            product = Product.objects.filter(is_active=True).first()
+            pages = {
+                'GET home': reverse('shop:home'),
+                'GET product_list': reverse('shop:product_list'),
+                'GET product_detail': product.get_absolute_url(),
+                'GET cart': reverse('shop:cart'),
+            }
+            # A fresh client per request behaves like a crawler without cookies
+            for label, url in pages.items():
+                ms, writes = measure_request(lambda: Client().get(url), repeat)
+                stdout.write(f'{size:>10} {label:<28} {ms:>8.2f} {writes:>11.1f}')
+            ms, writes = measure_request(
+                lambda: Client().post(reverse('shop:add_to_cart'), {'product_id': product.id, 'quantity': 1}),
+                repeat,
+            )
+            stdout.write(f'{size:>10} {"POST add_to_cart (first)":<28} {ms:>8.2f} {writes:>11.1f}')
+
+
+@scenario('anonymous_carts')
+def bench_anonymous_carts(stdout, sizes, repeat):
+    """Add-to-cart latency and DB writes for each anonymous cart backend"""
+    stdout.write(f'{"products":>10} {"backend":<8} {"request":<28} {"ms":>8} {"writes/req":>11}')
+    for size in sizes:
+        with benchmark_database(), override_settings(ALLOWED_HOSTS=['*']):
+            seed_catalogue(size)
+            products = list(Product.objects.filter(is_active=True)[:50])
+            for backend in ('db', 'cache', 'cookie'):
+                with override_settings(SHOP_ANONYMOUS_CART_BACKEND=backend):
+                    client = Client()
+                    picks = iter(products * repeat)
+                    ms, writes = measure_request(
+                        lambda: client.post(
+                            reverse('shop:add_to_cart'),
+                            {'product_id': next(picks).id, 'quantity': 1},
+                            HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+                        ),
+                        repeat,
+                    )
+                    stdout.write(f'{size:>10} {backend:<8} {"POST add_to_cart":<28} {ms:>8.2f} {writes:>11.1f}')
+                    ms, writes = measure_request(lambda: client.get(reverse('shop:cart')), repeat)
+                    stdout.write(f'{size:>10} {backend:<8} {"GET cart":<28} {ms:>8.2f} {writes:>11.1f}')
+
+
+@scenario('page_cache')
+def bench_page_cache(stdout, sizes, repeat):
+    """Anonymous page latency: full render, page-cache hit and 304 revalidation"""
+    stdout.write(f'{"products":>10} {"page":<16} {"mode":<12} {"ms":>8} {"queries/req":>12}')
+    for size in sizes:
+        with benchmark_database(), override_settings(ALLOWED_HOSTS=['*']):
+            seed_catalogue(size)
+            product = Product.objects.filter(is_active=True).first()
+            pages = {
+                'home': reverse('shop:home'),
+                'product_list': reverse('shop:product_list') + '?sort=price_low&page=2',
+                'product_detail': product.get_absolute_url(),
+            }
+            for label, url in pages.items():
+                modes = [
+                    ('full render', override_settings(SHOP_PAGE_CACHE_TIMEOUT=0)),
+                    ('cache hit', override_settings(SHOP_PAGE_CACHE_TIMEOUT=300)),
+                ]
+                for mode, settings_override in modes:
+                    with settings_override:
+                        client = Client()
+                        client.get(url)
+                        with CaptureQueriesContext(connection) as queries:
+                            ms = timed(lambda: client.get(url), repeat)
+                        per_request = len(queries.captured_queries) / repeat
+                        stdout.write(f'{size:>10} {label:<16} {mode:<12} {ms:>8.2f} {per_request:>12.1f}')
+                etag = Client().get(url).get('ETag')
+                if etag:
+                    client = Client()
+                    with CaptureQueriesContext(connection) as queries:
+                        ms = timed(lambda: client.get(url, HTTP_IF_NONE_MATCH=etag), repeat)
+                    per_request = len(queries.captured_queries) / repeat
+                    stdout.write(f'{size:>10} {label:<16} {"304":<12} {ms:>8.2f} {per_request:>12.1f}')
+
+
+@scenario('catalogue_snapshot')
+def bench_catalogue_snapshot(stdout, sizes, repeat):
+    """Snapshot build cost per worker, and page latency with and without it"""
+    stdout.write(f'{"products":>10} {"build s":>8} {"MB":>8} {"bytes/product":>14}')
+    rows = []
+    for size in sizes:
+        with benchmark_database(), override_settings(
+            ALLOWED_HOSTS=['*'], SHOP_PAGE_CACHE_TIMEOUT=0, SHOP_CATALOGUE_SNAPSHOT=True,
+        ):
+            seed_catalogue(size)
+            clear_catalogue_snapshot()
+            snapshot, retained, _, seconds = measure_memory(
+                lambda: CatalogueSnapshot.load(catalogue_version())
+            )
+            per_product = retained / max(len(snapshot.products_by_slug), 1)
+            stdout.write(f'{size:>10} {seconds:>8.2f} {retained / 1024 / 1024:>8.1f} {per_product:>14.0f}')
+            product = Product.objects.filter(is_active=True).first()
+            pages = {
+                'home': reverse('shop:home'),
+                'product_list': reverse('shop:product_list') + '?sort=price_low&min_price=100',
+                'product_detail': product.get_absolute_url(),
+            }
+            for label, url in pages.items():
+                for mode, enabled in (('database', False), ('snapshot', True)):
+                    with override_settings(SHOP_CATALOGUE_SNAPSHOT=enabled):
+                        client = Client()
+                        client.get(url)
+                        with CaptureQueriesContext(connection) as queries:
+                            ms = timed(lambda: client.get(url), repeat)
+                        rows.append((size, label, mode, ms, len(queries.captured_queries) / repeat))
+            clear_catalogue_snapshot()
+    stdout.write(f'{"products":>10} {"page":<16} {"mode":<10} {"ms":>8} {"queries/req":>12}')
+    for size, label, mode, ms, per_request in rows:
+        stdout.write(f'{size:>10} {label:<16} {mode:<10} {ms:>8.2f} {per_request:>12.1f}')
+
+
+def seed_orders(size, batch_size=5000, seed=42):
+    """Bulk insert ``size`` synthetic orders with stored totals"""
+    rng = random.Random(seed)
+    statuses = [choice for choice, _ in Order.ORDER_STATUS_CHOICES]
+    batch = []
+    for i in range(size):
+        batch.append(Order(
+            first_name=f'First{i}', last_name=f'Last{i}', email=f'customer{i}@example.com',
+            address=f'{rng.randint(1, 9999)} {random_text(rng, 2).title()} Street',
+            postal_code=f'{rng.randint(10000, 99999)}', city=random_text(rng, 1).title(),
+            status=rng.choice(statuses), item_count=rng.randint(1, 5),
+            subtotal=Decimal(rng.randint(100, 100000)) / 100,
+        ))
+        if len(batch) >= batch_size:
+            Order.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        Order.objects.bulk_create(batch)
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB (peak RSS where /proc is missing)"""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def naive_export(queryset, columns):
+    """The pre-streaming approach: build the whole CSV in memory"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([header for header, _ in columns])
+    for obj in list(queryset.select_related()):
+        row = []
+        for _, lookup in columns:
+            value = obj
+            for attr in lookup.split('__'):
+                value = getattr(value, attr, None) if value is not None else None
+            row.append(value)
+        writer.writerow(row)
+    return [buffer.getvalue().encode()]
+
+
+@scenario('export')
+def bench_export(stdout, sizes, repeat):
+    """Rows/sec and peak RSS of the streaming CSV export against an in-memory build"""
+    stdout.write(f'{"rows":>10} {"dataset":<9} {"method":<14} {"rows/s":>10} {"peak RSS MB":>12} {"+RSS MB":>8} {"out MB":>8}')
+    for size in sizes:
+        with benchmark_database():
+            seed_catalogue(size)
+            seed_orders(size)
+            gc.collect()
+            datasets = [('products', Product.objects.all(), PRODUCT_COLUMNS), ('orders', Order.objects.all(), ORDER_COLUMNS)]
+            methods = [
+                ('naive', naive_export),
+                ('stream', lambda qs, cols: export_stream(qs, cols)),
+                ('stream+gzip', lambda qs, cols: export_stream(qs, cols, compress=True)),
+            ]
+            for name, queryset, columns in datasets:
+                for label, run in methods:
+                    gc.collect()
+                    baseline = current_rss_mb()
+                    peak, written = baseline, 0
+                    start = time.perf_counter()
+                    for index, chunk in enumerate(run(queryset, columns)):
+                        written += len(chunk)
+                        if index % 16 == 0:
+                            peak = max(peak, current_rss_mb())
+                    peak = max(peak, current_rss_mb())
+                    elapsed = time.perf_counter() - start
+                    stdout.write(
+                        f'{size:>10} {name:<9} {label:<14} {size / elapsed:>10.0f} {peak:>12.1f} '
+                        f'{peak - baseline:>8.1f} {written / 1e6:>8.2f}'
+                    )
@@ -0,0 +1,193 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .anonymous_cart import AnonymousCart, get_anonymous_cart_storage
+from .models import Cart, CartItem
+
+_UNRESOLVED = object()
+
+
+class RequestCart:
+    """The current visitor's cart, looked up at most once per request
+
+    ``CartMiddleware`` attaches one of these to every request as
+    ``request.cart`` so views, the context processor and the JSON endpoints
+    all share a single lookup. Totals are stored on the Cart row, so the
+    lookup is the only query needed.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self._cart = _UNRESOLVED
+        self._storage = _UNRESOLVED
+
+    @property
+    def anonymous_storage(self):
+        """Cache/cookie storage for anonymous carts, or None for model carts"""
+        if self._storage is _UNRESOLVED:
+            self._storage = None
+            if not self.request.user.is_authenticated:
+                self._storage = get_anonymous_cart_storage()
+        return self._storage
+
+    def _lookup(self):
+        if self.request.user.is_authenticated:
+            return Cart.objects.filter(user=self.request.user).first()
+        if self.anonymous_storage is not None:
+            return self.anonymous_storage.load(self.request)
+        cart_id = self.request.session.get('cart_id')
+        if cart_id:
+            return Cart.objects.filter(id=cart_id).first()
+        return None
+
+    def get(self):
+        """The existing cart, or None; never writes to the database"""
+        if self._cart is _UNRESOLVED:
+            self._cart = self._lookup()
+        return self._cart
+
+    def get_or_create(self):
+        """The existing cart, creating it (and the session) if needed"""
+        cart = self.get()
+        if cart is None:
+            if self.request.user.is_authenticated:
+                cart, created = Cart.objects.get_or_create(user=self.request.user)
+            elif self.anonymous_storage is not None:
+                cart = self.anonymous_storage.new_cart()
+            else:
+                # Ensure session is initialized
+                if not self.request.session.session_key:
+                    self.request.session.create()
+                cart = Cart.objects.create(session_key=self.request.session.session_key)
+                self.request.session['cart_id'] = cart.id
+            self._cart = cart
+        return cart
+
+    def totals(self):
+        """(item count, total price) for the visitor's cart"""
+        cart = self.get()
+        if cart is None:
+            return 0, Decimal('0.00')
+        return cart.totals
+
+    def save(self, response):
+        """Write a modified anonymous cart back to its cache entry or cookie"""
+        cart = self._cart
+        if isinstance(cart, AnonymousCart) and cart.modified:
+            cart.storage.save(cart, response)
+            cart.modified = False
+
+
+def get_request_cart(request):
+    """The request's ``RequestCart``, attaching one if the middleware did not"""
+    if not isinstance(getattr(request, 'cart', None), RequestCart):
+        request.cart = RequestCart(request)
+    return request.cart
+
+
+def recalculate_cart_totals(carts):
+    """Rewrite ``item_count``/``subtotal`` for a Cart queryset in one UPDATE"""
+    lines = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+    return carts.update(
+        item_count=Coalesce(
+            Subquery(lines.annotate(count=Sum('quantity')).values('count')),
+            0,
+        ),
+        subtotal=Coalesce(
+            Subquery(lines.annotate(total=Sum(F('quantity') * F('product__price'))).values('total')),
+            Value(Decimal('0.00')),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    )
+
+
+def _sync_totals(cart):
+    recalculate_cart_totals(Cart.objects.filter(pk=cart.pk))
+    cart.refresh_from_db(fields=['item_count', 'subtotal'])
+
+
+def _upsert_item(cart, product, quantity):
+    """Insert the line or add to its quantity in one statement"""
+    table = CartItem._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (cart_id, product_id, quantity, created_at) '
+            f'VALUES (%s, %s, %s, %s) '
+            f'ON CONFLICT (cart_id, product_id) '
+            f'DO UPDATE SET quantity = {table}.quantity + excluded.quantity',
+            [cart.pk, product.pk, quantity, timezone.now()],
+        )
+
+
+def _increment_item(cart, product, quantity):
+    """Portable fallback: F() increment, inserting only when no line exists"""
+    updated = CartItem.objects.filter(cart=cart, product=product).update(
+        quantity=F('quantity') + quantity
+    )
+    if not updated:
+        try:
+            with transaction.atomic():
+                CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+        except IntegrityError:
+            # Lost the race to a concurrent insert; the line exists now
+            CartItem.objects.filter(cart=cart, product=product).update(
+                quantity=F('quantity') + quantity
+            )
+
+
+def add_item(cart, product, quantity):
+    """Add ``quantity`` of ``product`` to the cart and update its totals
+
+    The unique (cart, product) constraint plus an atomic increment means
+    concurrent adds can never create duplicate lines or lose quantity.
+    Raises ValueError for a quantity below 1: cache and cookie carts have no
+    database constraint to refuse it.
+    """
+    if quantity < 1:
+        raise ValueError(f'quantity must be at least 1, not {quantity}')
+    if isinstance(cart, AnonymousCart):
+        return cart.add_item(product, quantity)
+    with transaction.atomic():
+        if connection.features.supports_update_conflicts_with_target:
+            _upsert_item(cart, product, quantity)
+        else:
+            _increment_item(cart, product, quantity)
+        _sync_totals(cart)
+
+
+def set_item_quantity(cart, cart_item, quantity):
+    """Change a line's quantity, removing it when ``quantity`` drops below 1"""
+    if isinstance(cart, AnonymousCart):
+        cart.set_item_quantity(cart_item, quantity)
+        return cart_item
+    with transaction.atomic():
+        if quantity > 0:
+            cart_item.quantity = quantity
+            cart_item.save()
+        else:
+            cart_item.delete()
+        _sync_totals(cart)
+    return cart_item
+
+
+def remove_item(cart, cart_item):
+    """Remove a line from the cart and update its totals"""
+    if isinstance(cart, AnonymousCart):
+        return cart.remove_item(cart_item)
+    with transaction.atomic():
+        cart_item.delete()
+        _sync_totals(cart)
+
+
+def clear_cart(cart):
+    """Empty the cart and zero its totals"""
+    if isinstance(cart, AnonymousCart):
+        return cart.clear()
+    with transaction.atomic():
+        cart.items.all().delete()
+        Cart.objects.filter(pk=cart.pk).update(item_count=0, subtotal=Decimal('0.00'))
+        cart.item_count, cart.subtotal = 0, Decimal('0.00')
@@ -0,0 +1,224 @@
+"""
+Bulk product import from supplier feeds.
+
+Records are streamed from CSV or JSON Lines (optionally gzipped), validated
+against an in-memory category map, and upserted by ``slug`` a batch at a
+time: one ``INSERT ... ON CONFLICT (slug) DO UPDATE`` per batch where the
+database supports it, otherwise one ``bulk_update`` plus one
+``bulk_create``. Each batch commits on its own, so a large feed never holds
+one long transaction.
+"""
+import csv
+import gzip
+import io
+import json
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .cart import recalculate_cart_totals
+from .fragments import invalidate_catalogue_fragments
+from .models import Cart, Category, Product
+from .search import get_search_backend
+
+# Fields an import may set; everything else keeps its model default
+IMPORT_FIELDS = [
+    'name', 'description', 'short_description', 'price', 'category',
+    'stock', 'is_featured', 'is_active',
+]
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'f', ''}
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+def open_feed(path):
+    """A text stream for ``path``, transparently gunzipping ``*.gz`` files"""
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path), encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def feed_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith('.jsonl') or name.endswith('.ndjson'):
+        return 'jsonl'
+    return 'csv'
+
+
+def read_records(stream, fmt):
+    """Yield ``(line_number, dict)`` for every record in the feed"""
+    if fmt == 'jsonl':
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as exc:
+                yield line_number, InvalidRecord(f'invalid JSON: {exc}')
+                continue
+            yield line_number, record
+    else:
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+
+
+def parse_bool(value, default):
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise InvalidRecord(f'not a boolean: {value!r}')
+
+
+def clean_record(record, categories):
+    """Validate one feed record into ``Product`` field values"""
+    if isinstance(record, Exception):
+        raise record
+    name = (record.get('name') or '').strip()
+    slug = (record.get('slug') or '').strip() or slugify(name)
+    if not name or not slug:
+        raise InvalidRecord('name and slug are required')
+    if len(name) > 255 or len(slug) > 50:
+        raise InvalidRecord('name or slug is too long')
+    category_slug = (record.get('category') or record.get('category_slug') or '').strip()
+    category_id = categories.get(category_slug)
+    if category_id is None:
+        raise InvalidRecord(f'unknown category {category_slug!r}')
+    try:
+        price = Decimal(str(record.get('price'))).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        raise InvalidRecord(f'invalid price {record.get("price")!r}')
+    if price < 0 or price >= Decimal('100000000'):
+        raise InvalidRecord(f'price out of range: {price}')
+    try:
+        stock = int(record.get('stock') or 0)
+    except (TypeError, ValueError):
+        raise InvalidRecord(f'invalid stock {record.get("stock")!r}')
+    if stock < 0:
+        raise InvalidRecord('stock cannot be negative')
+    return {
+        'slug': slug,
+        'name': name,
+        'description': record.get('description') or '',
+        'short_description': (record.get('short_description') or '')[:255],
+        'price': price,
+        'category_id': category_id,
+        'stock': stock,
+        'is_featured': parse_bool(record.get('is_featured'), False),
+        'is_active': parse_bool(record.get('is_active'), True),
+    }
+
+
+class ImportStats:
+    def __init__(self):
+        self.rows = self.created = self.updated = self.invalid = 0
+        self.errors = []
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rate(self):
+        return self.rows / self.elapsed if self.elapsed else 0
+
+
+class ProductImporter:
+    """Upsert products keyed by ``slug`` from a stream of feed records"""
+
+    def __init__(self, batch_size=1000, dry_run=False, create_categories=False, max_errors=50):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.create_categories = create_categories
+        self.max_errors = max_errors
+        self.categories = dict(Category.objects.values_list('slug', 'id'))
+        self.stats = ImportStats()
+
+    def _category_for(self, record):
+        """Create categories named in the feed on first sight, if allowed"""
+        if isinstance(record, Exception):
+            return
+        category_slug = (record.get('category') or record.get('category_slug') or '').strip()
+        if category_slug and category_slug not in self.categories:
+            if self.dry_run:
+                self.categories[category_slug] = 0
+            else:
+                category, _ = Category.objects.get_or_create(
+                    slug=category_slug,
+                    defaults={'name': category_slug.replace('-', ' ').title()},
+                )
+                self.categories[category_slug] = category.id
+
+    def run(self, records, progress=None):
+        batch = {}
+        for line_number, record in records:
+            if self.create_categories:
+                self._category_for(record)
+            try:
+                values = clean_record(record, self.categories)
+            except InvalidRecord as exc:
+                self.stats.invalid += 1
+                if len(self.stats.errors) < self.max_errors:
+                    self.stats.errors.append((line_number, str(exc)))
+                continue
+            # A slug repeated within a batch keeps its last record
+            batch[values['slug']] = values
+            if len(batch) >= self.batch_size:
+                self.write_batch(batch)
+                batch = {}
+                if progress:
+                    progress(self.stats)
+        if batch:
+            self.write_batch(batch)
+            if progress:
+                progress(self.stats)
+        if not self.dry_run and self.stats.rows:
+            invalidate_catalogue_fragments()
+        return self.stats
+
+    def write_batch(self, batch):
+        existing = dict(Product.objects.filter(slug__in=list(batch)).values_list('slug', 'id'))
+        self.stats.rows += len(batch)
+        self.stats.updated += len(existing)
+        self.stats.created += len(batch) - len(existing)
+        if self.dry_run:
+            return
+        now = timezone.now()
+        products = [Product(updated_at=now, **values) for values in batch.values()]
+        with transaction.atomic():
+            if connection.features.supports_update_conflicts_with_target:
+                Product.objects.bulk_create(
+                    products,
+                    update_conflicts=True,
+                    unique_fields=['slug'],
+                    update_fields=IMPORT_FIELDS + ['updated_at'],
+                )
+            else:
+                to_update = []
+                for product in products:
+                    if product.slug in existing:
+                        product.pk = existing[product.slug]
+                        to_update.append(product)
+                Product.objects.bulk_update(to_update, IMPORT_FIELDS + ['updated_at'])
+                Product.objects.bulk_create([p for p in products if p.slug not in existing])
+            # Bulk writes skip post_save, so index the batch's rows as the
+            # signal would have; the rest of the index is left alone
+            get_search_backend().index_products(
+                Product.objects.filter(slug__in=list(batch)).values_list('id', flat=True)
+            )
+            if existing:
+                # Repriced products change the stored totals of carts holding them
+                recalculate_cart_totals(Cart.objects.filter(items__product_id__in=list(existing.values())))
@@ -0,0 +1,31 @@
+from django.db.models import Count, Q
+
+from .fragments import cached_fragment
+from .models import Category
+
+NAV_CATEGORY_LIMIT = 6
+
+
+def with_product_counts(queryset):
+    """Annotate categories with ``product_total`` and ``active_product_count``
+
+    Both counts come from one GROUP BY over ``shop_product``, so a list of
+    categories costs one query however many rows it shows.
+    """
+    return queryset.annotate(
+        product_total=Count('products'),
+        active_product_count=Count('products', filter=Q(products__is_active=True)),
+    )
+
+
+def nav_categories():
+    """Active categories for the storefront nav, with active product counts
+
+    Cached as plain dicts under the catalogue version (see ``shop.fragments``),
+    so most requests render the nav without a query.
+    """
+    return cached_fragment('nav-categories', lambda: list(
+        with_product_counts(Category.objects.filter(is_active=True))
+        .order_by('id')
+        .values('id', 'name', 'slug', 'active_product_count')[:NAV_CATEGORY_LIMIT]
+    ))
@@ -0,0 +1,172 @@
+import uuid
+from decimal import Decimal
+
+from django.core import signing
+from django.db import IntegrityError, OperationalError, transaction
+from django.db.models import (
+    Case, Count, DecimalField, F, OuterRef, PositiveIntegerField, Q, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .anonymous_cart import AnonymousCart
+from .cart import clear_cart
+from .dashboard import record_order
+from .fragments import invalidate_catalogue_fragments
+from .models import Order, OrderItem, Product
+from .rollups import record_order_sales
+
+ORDER_FIELDS = ('first_name', 'last_name', 'email', 'address', 'postal_code', 'city')
+CHECKOUT_TOKEN_SALT = 'shop.checkout.token'
+
+
+class InsufficientStock(Exception):
+    """Raised when some cart lines cannot be fulfilled; nothing is written"""
+
+    def __init__(self, products):
+        self.products = products
+        super().__init__(', '.join(product.name for product in products))
+
+
+class EmptyCart(Exception):
+    """Raised when the cart has nothing (left) to order; nothing is written"""
+
+
+class CheckoutConflict(Exception):
+    """Raised when a concurrent checkout held the rows we needed; nothing is
+    written and the same submission can simply be retried"""
+
+
+def issue_checkout_token():
+    """A signed, single-use token to embed in a freshly rendered checkout form"""
+    return signing.dumps(uuid.uuid4().hex, salt=CHECKOUT_TOKEN_SALT)
+
+
+def read_checkout_token(signed_token):
+    """The raw token behind a signed one, or None if it was not issued by us"""
+    try:
+        return signing.loads(signed_token or '', salt=CHECKOUT_TOKEN_SALT)
+    except signing.BadSignature:
+        return None
+
+
+def replayed_order(signed_token):
+    """The Order an earlier submission of this checkout form already placed"""
+    token = read_checkout_token(signed_token)
+    if token is None:
+        return None
+    return Order.objects.filter(checkout_token=token).first()
+
+
+def recalculate_order_totals(orders):
+    """Rewrite ``subtotal``/``item_count`` for an Order queryset in one UPDATE"""
+    lines = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order')
+    return orders.update(
+        item_count=Coalesce(
+            Subquery(lines.annotate(count=Count('id')).values('count')),
+            0,
+        ),
+        subtotal=Coalesce(
+            Subquery(lines.annotate(total=Sum(F('quantity') * F('price'))).values('total')),
+            Value(Decimal('0.00')),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    )
+
+
+def cart_quantities(cart):
+    """{product_id: quantity} for every line of the cart, in one query"""
+    if isinstance(cart, AnonymousCart):
+        return dict(cart.quantities)
+    return dict(cart.items.values_list('product_id', 'quantity'))
+
+
+def place_order(cart, details, user=None, checkout_token=None):
+    """Turn the cart into an Order in one transaction and return the Order
+
+    The cart's products are locked and validated with a single
+    ``SELECT ... FOR UPDATE``, the items are bulk-inserted, and stock is
+    decremented by one conditional ``UPDATE``, so the number of queries does
+    not grow with the number of lines. If any product is inactive or short
+    of stock, ``InsufficientStock`` names those products; if nothing is left
+    to order, ``EmptyCart`` is raised. Lines with a quantity below 1 are
+    ignored. If the database gives up waiting for a lock held by a
+    concurrent checkout (SQLite's "database is locked", a Postgres deadlock),
+    ``CheckoutConflict`` is raised. In every case the transaction is rolled
+    back, leaving the cart untouched.
+
+    ``checkout_token`` is stored on the Order under a unique constraint, so
+    when two submissions of the same form race, the loser's transaction is
+    rolled back and the winner's Order is returned instead.
+    """
+    try:
+        return _place_order(cart, details, user, checkout_token)
+    except OperationalError as exc:
+        raise CheckoutConflict() from exc
+    except IntegrityError:
+        existing = checkout_token and Order.objects.filter(checkout_token=checkout_token).first()
+        if not existing:
+            raise
+        return existing
+
+
+def _place_order(cart, details, user, checkout_token):
+    with transaction.atomic():
+        # Read inside the transaction so the stock check covers what is ordered
+        quantities = {pk: quantity for pk, quantity in cart_quantities(cart).items() if quantity > 0}
+        products = Product.objects.select_for_update().in_bulk(list(quantities))
+        # Lines whose product has since been deleted are dropped
+        quantities = {pk: quantity for pk, quantity in quantities.items() if pk in products}
+        unavailable = [
+            product for product_id, product in products.items()
+            if not product.is_active or product.stock < quantities[product_id]
+        ]
+        if not quantities:
+            raise EmptyCart()
+        if unavailable:
+            raise InsufficientStock(unavailable)
+
+        order = Order.objects.create(
+            user=user, checkout_token=checkout_token,
+            subtotal=sum(
+                (products[product_id].price * quantity for product_id, quantity in quantities.items()),
+                Decimal('0.00'),
+            ),
+            item_count=len(quantities),
+            **{field: details[field] for field in ORDER_FIELDS}
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, price=product.price, quantity=quantities[product_id])
+            for product_id, product in products.items()
+        ])
+        record_order_sales(order, [
+            (product, quantities[product_id], product.price) for product_id, product in products.items()
+        ])
+
+        # The stock guard repeats the check above inside the UPDATE itself, so
+        # even databases where FOR UPDATE is a no-op (SQLite) cannot oversell.
+        in_stock = Q()
+        for product_id, quantity in quantities.items():
+            in_stock |= Q(pk=product_id, stock__gte=quantity)
+        now = timezone.now()
+        decremented = Product.objects.filter(in_stock).update(
+            stock=Case(
+                *[When(pk=product_id, then=F('stock') - quantity) for product_id, quantity in quantities.items()],
+                default=F('stock'),
+                output_field=PositiveIntegerField(),
+            ),
+            # Product pages show the stock level, so their ETag moves too
+            updated_at=now,
+        )
+        if decremented != len(quantities):
+            # Stock moved since the check above: the rows the guard skipped
+            # (still without our timestamp) are exactly the short ones
+            short = Product.objects.filter(pk__in=list(quantities)).exclude(updated_at=now)
+            raise InsufficientStock(list(short.order_by('name')))
+        if any(products[product_id].stock == quantity for product_id, quantity in quantities.items()):
+            # A product just sold out; its cached "In Stock" badge must go
+            invalidate_catalogue_fragments()
+
+        record_order(order)
+        clear_cart(cart)
+    return order
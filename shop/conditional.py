@@ -0,0 +1,117 @@
+"""
+Conditional GET (weak ETags) for catalogue pages.
+
+ETags start from ``Product.updated_at``. A product page uses its own row
+and a listing uses the newest row in the catalogue (an index lookup, or no
+query at all when the catalogue snapshot is on). They are computed before
+the view, so a matching ``If-None-Match`` gets a 304 without any rendering.
+
+Pages also show per-visitor state: the cart badge and the "My Orders"
+link. They also show catalogue-wide state, such as the nav and related
+products. The weak ETag therefore also covers the catalogue version, the
+user and the cart count, so a revalidation never keeps a stale badge. No
+``Last-Modified`` is sent: a date cannot cover those, and ``If-Modified-Since``
+alone would answer 304 over them. A pending flash message disables the
+ETag for that request so the message is always rendered.
+"""
+import hashlib
+from functools import wraps
+
+from django.contrib.messages import get_messages
+from django.db.models import Max
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .cart import get_request_cart
+from .fragments import catalogue_version
+from .models import Product
+from .page_cache import normalized_query
+from .snapshot import catalogue_snapshot
+
+
+def _visitor_state(request):
+    try:
+        cart_count = get_request_cart(request).totals()[0]
+    except Exception:
+        cart_count = 0
+    return f'{request.user.pk or 0}:{cart_count}'
+
+
+def _weak_etag(*parts):
+    digest = hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+    return f'W/"{digest}"'
+
+
+def _validators_allowed(request):
+    return not len(get_messages(request))
+
+
+def _memoized(request, name, compute):
+    """``compute()`` once per request, however often the ETag is asked for"""
+    memo = request.__dict__.setdefault('_conditional_get', {})
+    if name not in memo:
+        memo[name] = compute()
+    return memo[name]
+
+
+def _product_updated_at(slug):
+    snapshot = catalogue_snapshot()
+    if snapshot is not None:
+        product = snapshot.product(slug)
+        return product.updated_at if product else None
+    return Product.objects.filter(slug=slug, is_active=True).values_list('updated_at', flat=True).first()
+
+
+def _catalogue_updated_at():
+    snapshot = catalogue_snapshot()
+    if snapshot is not None:
+        return snapshot.last_modified
+    return Product.objects.aggregate(last_modified=Max('updated_at'))['last_modified']
+
+
+def product_last_modified(request, slug):
+    if not _validators_allowed(request):
+        return None
+    return _memoized(request, 'product', lambda: _product_updated_at(slug))
+
+
+def product_etag(request, slug):
+    updated_at = product_last_modified(request, slug)
+    if updated_at is None:
+        return None
+    return _weak_etag(slug, updated_at.isoformat(), catalogue_version(), _visitor_state(request))
+
+
+def catalogue_last_modified(request, *args, **kwargs):
+    """When any product last changed; inactive rows count, so deactivations show"""
+    if not _validators_allowed(request):
+        return None
+    return _memoized(request, 'catalogue', _catalogue_updated_at)
+
+
+def listing_etag(request, *args, **kwargs):
+    last_modified = catalogue_last_modified(request)
+    if last_modified is None:
+        return None
+    return _weak_etag(
+        request.path, normalized_query(request), last_modified.isoformat(),
+        catalogue_version(), _visitor_state(request),
+    )
+
+
+def conditional_page(etag_func):
+    """``condition()`` on the ETag alone, plus ``Cache-Control: private, no-cache``
+
+    The pages carry per-visitor values, so shared caches must not store
+    them, and browsers must revalidate on each use (which is cheap now).
+    """
+    def decorator(view):
+        conditional_view = condition(etag_func=etag_func)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
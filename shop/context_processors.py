@@ -1,40 +1,33 @@
-from .models import Cart
+from .cart import get_request_cart
+from .categories import nav_categories
+from .page_cache import CART_COUNT_HOLE, CSRF_HOLE
+from .snapshot import catalogue_snapshot
 
 def cart_context(request):
     """Add cart information to all templates"""
     cart_items_count = 0
     categories = []
     
+    # Shared page-cache renders leave placeholders for per-visitor values
+    page_cache_holes = getattr(request, 'page_cache_holes', False)
+    
+    # Shares the request's cart lookup with the view: one aggregate query at most
     try:
-        if request.user.is_authenticated:
-            cart, created = Cart.objects.get_or_create(user=request.user)
-        else:
-            # Ensure session is initialized
-            if not request.session.session_key:
-                request.session.create()
-            
-            cart_id = request.session.get('cart_id')
-            if cart_id:
-                try:
-                    cart = Cart.objects.get(id=cart_id)
-                except Cart.DoesNotExist:
-                    cart = None
-            else:
-                cart = None
-        
-        if cart:
-            cart_items_count = cart.total_items
-    except:
+        cart_items_count = CART_COUNT_HOLE if page_cache_holes else get_request_cart(request).totals()[0]
+    except Exception:
         cart_items_count = 0
     
-    # Get active categories for navigation
-    from .models import Category
+    # Active categories for navigation, cached with their product counts
     try:
-        categories = Category.objects.filter(is_active=True)[:6]
+        snapshot = catalogue_snapshot()
+        categories = snapshot.nav_categories if snapshot else nav_categories()
     except:
         categories = []
     
-    return {
+    context = {
         'cart_items_count': cart_items_count,
-        'categories': categories,
+        'nav_categories': categories,
     }
+    if page_cache_holes:
+        context['csrf_token'] = CSRF_HOLE
+    return context
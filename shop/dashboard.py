@@ -0,0 +1,132 @@
+"""
+Admin dashboard statistics in constant time.
+
+Order and revenue totals are running counters bumped by checkout (revenue
+excludes cancelled orders, see ``change_order_status``), recent revenue
+comes from the ``DailySales`` rollup, product counts come from the
+planner's estimate on large tables, and the low-stock count is an index
+range scan. The assembled stats are cached briefly; when
+the entry goes stale one request recomputes it under a lock while the rest
+keep serving the previous value, so an expiry never sends every admin
+request to the database at once.
+"""
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import DailySales, Order, OrderItem, Product, StatCounter
+from .pagination import EstimatedCountPaginator, estimated_row_count
+
+COUNTER_SHARDS = 8
+LOW_STOCK_THRESHOLD = 10
+RECENT_SALES_DAYS = 30
+
+STATS_CACHE_KEY = 'shop:dashboard-stats'
+STATS_LOCK_KEY = 'shop:dashboard-stats:lock'
+# Stats are refreshed after STATS_TTL seconds but a stale copy is kept (and
+# served while one request refreshes it) for STATS_STALE_TTL
+STATS_TTL = 30
+STATS_STALE_TTL = 60 * 10
+STATS_LOCK_TIMEOUT = 30
+
+
+def increment_counter(name, amount=1):
+    """Add ``amount`` to a random shard of the counter ``name``
+
+    Shards are normally created up front (migration 0008, ``rebuild_counters``)
+    so this is one UPDATE; a missing shard is created on first use.
+    """
+    shard = random.randrange(COUNTER_SHARDS)
+    updated = StatCounter.objects.filter(name=name, shard=shard).update(value=F('value') + amount)
+    if not updated:
+        try:
+            with transaction.atomic():
+                StatCounter.objects.create(name=name, shard=shard, value=amount)
+        except IntegrityError:
+            # A concurrent increment created the shard first
+            StatCounter.objects.filter(name=name, shard=shard).update(value=F('value') + amount)
+
+
+def counter_values():
+    """{name: value} for every counter, summed over its shards in one query"""
+    rows = StatCounter.objects.order_by().values('name').annotate(total=Sum('value'))
+    return {row['name']: row['total'] for row in rows}
+
+
+def record_order(order):
+    """Count a newly placed order towards the dashboard totals"""
+    increment_counter('orders', 1)
+    increment_counter('revenue', order.subtotal)
+
+
+def rebuild_counters():
+    """Recompute the counters from the orders tables (full scan; run offline)"""
+    revenue = OrderItem.objects.filter(order__status__in=Order.SALE_STATUSES).aggregate(
+        total=Sum(F('price') * F('quantity'))
+    )['total']
+    totals = {'orders': Order.objects.count(), 'revenue': revenue or Decimal('0.00')}
+    with transaction.atomic():
+        StatCounter.objects.filter(name__in=list(totals)).delete()
+        StatCounter.objects.bulk_create([
+            StatCounter(name=name, shard=shard, value=total if shard == 0 else 0)
+            for name, total in totals.items()
+            for shard in range(COUNTER_SHARDS)
+        ])
+    invalidate_dashboard_stats()
+
+
+def product_count():
+    """Exact below ``EstimatedCountPaginator.estimate_threshold`` rows, estimated above"""
+    estimate = estimated_row_count(Product.objects.all())
+    if estimate is not None and estimate >= EstimatedCountPaginator.estimate_threshold:
+        return estimate
+    return Product.objects.count()
+
+
+def recent_revenue(days=RECENT_SALES_DAYS):
+    """Revenue of non-cancelled orders over the last ``days`` days, from the rollup"""
+    today = timezone.localdate()
+    revenue = DailySales.objects.filter(
+        date__gt=today - timedelta(days=days), status__in=Order.SALE_STATUSES
+    ).aggregate(total=Sum('revenue'))['total']
+    return revenue or Decimal('0.00')
+
+
+def compute_dashboard_stats():
+    counters = counter_values()
+    return {
+        'total_products': product_count(),
+        'total_orders': int(counters.get('orders', 0)),
+        'total_revenue': counters.get('revenue', Decimal('0.00')),
+        # Served by the index on stock
+        'low_stock_count': Product.objects.filter(stock__gt=0, stock__lte=LOW_STOCK_THRESHOLD).count(),
+        'recent_revenue': recent_revenue(),
+    }
+
+
+def get_dashboard_stats():
+    """The dashboard stats, recomputed by at most one request at a time"""
+    entry = cache.get(STATS_CACHE_KEY)
+    if entry is not None and entry['expires'] > time.time():
+        return entry['stats']
+    locked = cache.add(STATS_LOCK_KEY, True, STATS_LOCK_TIMEOUT)
+    if not locked and entry is not None:
+        # Someone else is refreshing; the stale copy is good enough
+        return entry['stats']
+    try:
+        stats = compute_dashboard_stats()
+        cache.set(STATS_CACHE_KEY, {'stats': stats, 'expires': time.time() + STATS_TTL}, STATS_STALE_TTL)
+    finally:
+        if locked:
+            cache.delete(STATS_LOCK_KEY)
+    return stats
+
+
+def invalidate_dashboard_stats():
+    cache.delete(STATS_CACHE_KEY)
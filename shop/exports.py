@@ -0,0 +1,113 @@
+"""
+Streaming CSV exports.
+
+Rows are read with ``values_list(...).iterator(chunk_size=...)``, joined
+columns (``user__username``, ``category__name``) come from the same query,
+and output is produced in ~64KB chunks, optionally gzip-compressed on the
+fly. Memory use therefore stays flat however many rows are exported.
+"""
+import csv
+import io
+import zlib
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .models import DailySales, Order, Product
+
+CHUNK_SIZE = 2000
+# Flush the CSV buffer once it holds this many bytes
+BUFFER_SIZE = 64 * 1024
+
+ORDER_COLUMNS = [
+    ('id', 'id'),
+    ('created_at', 'created_at'),
+    ('status', 'status'),
+    ('username', 'user__username'),
+    ('first_name', 'first_name'),
+    ('last_name', 'last_name'),
+    ('email', 'email'),
+    ('address', 'address'),
+    ('postal_code', 'postal_code'),
+    ('city', 'city'),
+    ('item_count', 'item_count'),
+    ('subtotal', 'subtotal'),
+]
+
+PRODUCT_COLUMNS = [
+    ('id', 'id'),
+    ('name', 'name'),
+    ('slug', 'slug'),
+    ('category', 'category__name'),
+    ('price', 'price'),
+    ('stock', 'stock'),
+    ('is_active', 'is_active'),
+    ('is_featured', 'is_featured'),
+    ('created_at', 'created_at'),
+]
+
+DAILY_SALES_COLUMNS = [
+    ('date', 'date'),
+    ('product_id', 'product_id'),
+    ('product', 'product__name'),
+    ('category', 'category__name'),
+    ('status', 'status'),
+    ('quantity', 'quantity'),
+    ('revenue', 'revenue'),
+    ('lines', 'line_count'),
+]
+
+# name -> (base queryset, columns) for the export_csv command
+EXPORTS = {
+    'orders': (lambda: Order.objects.all(), ORDER_COLUMNS),
+    'products': (lambda: Product.objects.all(), PRODUCT_COLUMNS),
+    'daily_sales': (lambda: DailySales.objects.all(), DAILY_SALES_COLUMNS),
+}
+
+
+def iter_rows(queryset, columns, chunk_size=CHUNK_SIZE):
+    """Value tuples for ``columns``, fetched ``chunk_size`` rows at a time in pk order"""
+    lookups = [lookup for _, lookup in columns]
+    return queryset.order_by('pk').values_list(*lookups).iterator(chunk_size=chunk_size)
+
+
+def iter_csv(queryset, columns, chunk_size=CHUNK_SIZE):
+    """The export as a stream of UTF-8 encoded CSV chunks"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([header for header, _ in columns])
+    for row in iter_rows(queryset, columns, chunk_size):
+        writer.writerow(row)
+        if buffer.tell() >= BUFFER_SIZE:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def gzip_stream(chunks):
+    """Compress a byte stream into a gzip stream, chunk by chunk"""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_stream(queryset, columns, compress=False, chunk_size=CHUNK_SIZE):
+    chunks = iter_csv(queryset, columns, chunk_size)
+    return gzip_stream(chunks) if compress else chunks
+
+
+def export_response(queryset, columns, name, compress=False):
+    """A ``StreamingHttpResponse`` downloading the export as ``<name>-<date>.csv[.gz]``"""
+    filename = f'{name}-{timezone.localdate():%Y%m%d}.csv'
+    if compress:
+        filename += '.gz'
+    response = StreamingHttpResponse(
+        export_stream(queryset, columns, compress),
+        content_type='application/gzip' if compress else 'text/csv',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
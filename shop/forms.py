@@ -1,4 +1,5 @@
 from django import forms
+from .checkout import issue_checkout_token, read_checkout_token
 from .models import Product
 
 class AddToCartForm(forms.Form):
@@ -89,13 +90,23 @@ class CheckoutForm(forms.Form):
             'required': True
         })
     )
+    # Server-issued and signed; lets a retried submission find its order
+    checkout_token = forms.CharField(widget=forms.HiddenInput())
     
     def __init__(self, *args, **kwargs):
         user = kwargs.pop('user', None)
         super().__init__(*args, **kwargs)
+        if not self.is_bound:
+            self.fields['checkout_token'].initial = issue_checkout_token()
         
         # Pre-fill form with user data if available
         if user and user.is_authenticated:
             self.fields['first_name'].initial = user.first_name or ''
             self.fields['last_name'].initial = user.last_name or ''
             self.fields['email'].initial = user.email or ''
+
+    def clean_checkout_token(self):
+        token = read_checkout_token(self.cleaned_data.get('checkout_token'))
+        if token is None:
+            raise forms.ValidationError('This checkout form has expired. Please reload the page.')
+        return token
@@ -0,0 +1,72 @@
+"""
+Versioned cache for catalogue fragments (home page sections, nav).
+
+Every fragment key embeds the current catalogue version, a counter kept in
+the shared cache. A catalogue write bumps the version once its transaction
+commits, and all fragments move to new keys at once; the old entries are
+never read again and simply expire. Nothing has to enumerate or delete
+keys, and every worker sharing the cache sees the new version together.
+The ``default`` cache must therefore be shared by all workers (Redis or the
+database in settings_production); with a per-process cache a bump in one
+worker would never reach the others.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Category, Product
+
+CATALOGUE_VERSION_KEY = 'shop:catalogue-version'
+# Bumps replace entries; the timeout only bounds staleness from writes that
+# bypass them (raw SQL, other processes' bulk updates)
+FRAGMENT_TIMEOUT = 60 * 10
+HOME_FEATURED_LIMIT = 6
+HOME_CATEGORY_LIMIT = 6
+
+
+def catalogue_version():
+    version = cache.get(CATALOGUE_VERSION_KEY)
+    if version is None:
+        # Seed from the clock so an evicted counter never revisits old keys
+        cache.add(CATALOGUE_VERSION_KEY, int(time.time()), None)
+        version = cache.get(CATALOGUE_VERSION_KEY, int(time.time()))
+    return version
+
+
+def bump_catalogue_version():
+    try:
+        cache.incr(CATALOGUE_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOGUE_VERSION_KEY, int(time.time()), None)
+
+
+def invalidate_catalogue_fragments():
+    """Bump the version after the current transaction commits
+
+    Bumping earlier would let another request rebuild a fragment from the
+    not-yet-committed (old) rows and cache it under the new version.
+    """
+    transaction.on_commit(bump_catalogue_version)
+
+
+def cached_fragment(name, build, timeout=FRAGMENT_TIMEOUT):
+    """``build()``'s result, cached under ``name`` for the current catalogue version"""
+    key = f'shop:fragment:{name}:v{catalogue_version()}'
+    value = cache.get(key)
+    if value is None:
+        value = build()
+        cache.set(key, value, timeout)
+    return value
+
+
+def home_featured_products():
+    return cached_fragment('home-featured', lambda: list(
+        Product.objects.filter(is_featured=True, is_active=True)[:HOME_FEATURED_LIMIT]
+    ))
+
+
+def home_categories():
+    return cached_fragment('home-categories', lambda: list(
+        Category.objects.filter(is_active=True)[:HOME_CATEGORY_LIMIT]
+    ))
@@ -0,0 +1,158 @@
+"""
+Set-based data-integrity checks for carts, orders and stock.
+
+Each check is a filter that finds violating rows inside a primary-key
+range, so a full run is a sequence of bounded range scans done by the
+database. No rows are loaded into Python except the ids of the violations
+found. Checks that have a safe repair apply it per batch with one
+``UPDATE``, in a short transaction.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Max, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Abs, Coalesce
+
+from .cart import recalculate_cart_totals
+from .checkout import recalculate_order_totals
+from .models import Cart, CartItem, Order, OrderItem, Product
+
+# Stored decimal totals differing by less than this are rounding, not drift
+TOLERANCE = Decimal('0.005')
+
+
+def drifted_carts(carts):
+    """Carts in ``carts`` whose stored totals disagree with their items"""
+    return carts.annotate(
+        live_count=Coalesce(Sum('items__quantity'), 0),
+        live_subtotal=Coalesce(
+            Sum(F('items__quantity') * F('items__product__price')),
+            Decimal('0.00'),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    ).annotate(
+        subtotal_drift=Abs(F('subtotal') - F('live_subtotal')),
+    ).filter(
+        ~Q(item_count=F('live_count')) | Q(subtotal_drift__gte=TOLERANCE)
+    )
+
+
+def drifted_orders(orders):
+    """Orders in ``orders`` whose stored ``subtotal``/``item_count`` disagree with their lines"""
+    return orders.annotate(
+        live_count=Count('items'),
+        live_subtotal=Coalesce(
+            Sum(F('items__quantity') * F('items__price')),
+            Decimal('0.00'),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    ).annotate(
+        subtotal_drift=Abs(F('subtotal') - F('live_subtotal')),
+    ).filter(
+        ~Q(item_count=F('live_count')) | Q(subtotal_drift__gte=TOLERANCE)
+    )
+
+
+def invalid_order_items(items):
+    """Order lines missing a price or with no quantity (pre-validation legacy rows)"""
+    return items.filter(Q(price__isnull=True) | Q(quantity__isnull=True) | Q(quantity__lt=1))
+
+
+def repair_order_items(items):
+    """Copy the product's price into priceless lines and default quantities to 1
+
+    Two UPDATE statements; returns the ids of the orders whose lines changed,
+    so their stored totals can be recalculated.
+    """
+    order_ids = set(invalid_order_items(items).values_list('order_id', flat=True))
+    items.filter(price__isnull=True).update(
+        price=Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('price')[:1])
+    )
+    items.filter(Q(quantity__isnull=True) | Q(quantity__lt=1)).update(quantity=1)
+    return order_ids
+
+
+def repair_order_items_and_totals(items):
+    order_ids = repair_order_items(items)
+    if order_ids:
+        recalculate_order_totals(Order.objects.filter(id__in=order_ids))
+
+
+class Check:
+    """One integrity rule: ``find`` narrows a queryset of ``model`` to violations"""
+
+    def __init__(self, name, model, description, find, repair=None):
+        self.name = name
+        self.model = model
+        self.description = description
+        self.find = find
+        self.repair = repair
+
+    def violations(self, start, end):
+        """Ids of violating rows with ``start < pk <= end``"""
+        rows = self.model.objects.filter(pk__gt=start, pk__lte=end)
+        return list(self.find(rows).order_by('pk').values_list('pk', flat=True))
+
+
+CHECKS = [
+    Check(
+        'order_items', OrderItem, 'order lines without a price or quantity',
+        invalid_order_items, repair_order_items_and_totals,
+    ),
+    Check(
+        'order_totals', Order, 'orders whose stored totals disagree with their lines',
+        drifted_orders, recalculate_order_totals,
+    ),
+    Check(
+        'empty_orders', Order, 'orders without any lines',
+        lambda orders: orders.filter(items__isnull=True),
+    ),
+    Check(
+        'cart_totals', Cart, 'carts whose stored totals disagree with their items',
+        drifted_carts, recalculate_cart_totals,
+    ),
+    Check(
+        'cart_items', CartItem, 'cart lines with a non-positive quantity',
+        lambda items: items.filter(quantity__lt=1),
+    ),
+    Check(
+        'cart_over_stock', CartItem, 'cart lines asking for more than the product has in stock',
+        lambda items: items.filter(quantity__gt=F('product__stock')),
+    ),
+    Check(
+        'negative_stock', Product, 'products with negative stock',
+        lambda products: products.filter(stock__lt=0),
+    ),
+]
+CHECKS_BY_NAME = {check.name: check for check in CHECKS}
+
+
+class CheckResult:
+    def __init__(self, check):
+        self.check = check
+        self.last_pk = 0
+        self.violations = 0
+        self.repaired = 0
+        self.sample = []
+
+
+def run_check(check, batch_size=5000, repair=False, progress=None, sample_size=10):
+    """Scan ``check.model`` in pk ranges of ``batch_size`` and optionally repair"""
+    result = CheckResult(check)
+    max_pk = check.model.objects.aggregate(max_pk=Max('pk'))['max_pk'] or 0
+    start = 0
+    while start < max_pk:
+        end = start + batch_size
+        ids = check.violations(start, end)
+        result.violations += len(ids)
+        result.sample.extend(ids[:sample_size - len(result.sample)])
+        if ids and repair and check.repair:
+            # One short transaction per batch keeps locks brief on live tables
+            with transaction.atomic():
+                check.repair(check.model.objects.filter(pk__in=ids))
+            result.repaired += len(ids)
+        result.last_pk = min(end, max_pk)
+        if progress:
+            progress(result, max_pk)
+        start = end
+    return result
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from shop.checkout import recalculate_order_totals
+from shop.models import Order
+
+class Command(BaseCommand):
+    help = 'Populate the stored subtotal/item_count of existing orders in id-ordered chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Orders updated per transaction')
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Recalculate every order, not just those without stored totals'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        orders = Order.objects.all() if options['all'] else Order.objects.filter(item_count=0)
+        updated = 0
+        last_id = 0
+        while True:
+            batch_ids = list(
+                orders.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not batch_ids:
+                break
+            last_id = batch_ids[-1]
+            # Short transactions keep row locks brief on a live orders table
+            with transaction.atomic():
+                updated += recalculate_order_totals(Order.objects.filter(id__in=batch_ids))
+            self.stdout.write(f'Updated {updated} orders (up to id {last_id})')
+
+        self.stdout.write(self.style.SUCCESS(f'Backfilled totals for {updated} orders.'))
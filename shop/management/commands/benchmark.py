@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from shop.benchmarks import SCENARIOS
+
+class Command(BaseCommand):
+    help = 'Run a performance benchmark scenario against a throwaway database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(SCENARIOS), help='Benchmark scenario to run')
+        parser.add_argument(
+            '--sizes', nargs='+', type=int, default=[10000],
+            help='Dataset sizes to benchmark, e.g. --sizes 10000 100000 1000000'
+        )
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per measurement (median is reported)')
+
+    def handle(self, *args, **options):
+        bench = SCENARIOS[options['scenario']]
+        self.stdout.write(f'Running "{options["scenario"]}" benchmark: {bench.__doc__}')
+        bench(self.stdout, options['sizes'], options['repeat'])
+        self.stdout.write(self.style.SUCCESS('Benchmark complete.'))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from shop.fragments import catalogue_version
+from shop.models import Product
+from shop.snapshot import CatalogueSnapshot, measure_memory
+
+
+def _mb(size):
+    return f'{size / (1024 * 1024):.1f} MB'
+
+
+class Command(BaseCommand):
+    help = 'Build the in-memory catalogue snapshot and report what it costs each worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--compare-orm', action='store_true',
+            help='Also measure the same products loaded as ORM instances',
+        )
+
+    def handle(self, *args, **options):
+        snapshot, retained, peak, seconds = measure_memory(lambda: CatalogueSnapshot.load(catalogue_version()))
+        products = len(snapshot.products_by_slug)
+        per_product = retained / products if products else 0
+        self.stdout.write(f'{"Products:":<19}{products}')
+        self.stdout.write(f'{"Categories:":<19}{len(snapshot.categories_by_slug)}')
+        self.stdout.write(f'{"Build time:":<19}{seconds:.2f}s')
+        self.stdout.write(f'{"Peak during build:":<19}{_mb(peak)}')
+        self.stdout.write(f'{"Retained:":<19}{_mb(retained)} ({per_product:.0f} bytes/product)')
+
+        if options['compare_orm']:
+            _, orm_retained, _, orm_seconds = measure_memory(
+                lambda: list(Product.objects.filter(is_active=True).select_related('category'))
+            )
+            orm_per_product = orm_retained / products if products else 0
+            self.stdout.write(
+                f'{"ORM instances:":<19}{_mb(orm_retained)} ({orm_per_product:.0f} bytes/product, '
+                f'{orm_seconds:.2f}s, one sort order and no indexes)'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Each worker holds about {_mb(retained)} for the snapshot.'))
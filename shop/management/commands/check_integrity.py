@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from shop.integrity import CHECKS, CHECKS_BY_NAME, run_check
+
+class Command(BaseCommand):
+    help = 'Check carts, orders and stock for inconsistent data in bounded SQL batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'checks', nargs='*', metavar='check',
+            help=f'Checks to run (default: all of {", ".join(CHECKS_BY_NAME)})'
+        )
+        parser.add_argument('--batch-size', type=int, default=10000, help='Primary keys scanned per batch')
+        parser.add_argument('--repair', action='store_true', help='Apply the repair of checks that have one')
+        parser.add_argument('--verbose-progress', action='store_true', help='Report after every batch')
+
+    def handle(self, *args, **options):
+        unknown = set(options['checks']) - set(CHECKS_BY_NAME)
+        if unknown:
+            raise CommandError(f'Unknown check(s): {", ".join(sorted(unknown))}')
+        checks = [CHECKS_BY_NAME[name] for name in options['checks']] or CHECKS
+        failed = 0
+
+        def progress(result, max_pk):
+            if options['verbose_progress']:
+                self.stdout.write(f'  {result.check.name}: scanned up to id {result.last_pk} of {max_pk}')
+
+        for check in checks:
+            result = run_check(check, batch_size=options['batch_size'], repair=options['repair'], progress=progress)
+            if not result.violations:
+                self.stdout.write(f'{check.name}: OK')
+                continue
+            sample = ', '.join(str(pk) for pk in result.sample)
+            message = f'{check.name}: {result.violations} {check.description} (e.g. ids {sample})'
+            if result.repaired:
+                self.stdout.write(self.style.SUCCESS(f'{message}; repaired'))
+            else:
+                failed += 1
+                self.stdout.write(self.style.WARNING(message))
+
+        if failed:
+            raise CommandError(f'{failed} integrity check(s) found problems.')
+        self.stdout.write(self.style.SUCCESS('Data integrity checks passed.'))
@@ -1,5 +1,8 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
+from shop.checkout import recalculate_order_totals
+from shop.dashboard import rebuild_counters
+from shop.rollups import rebuild_daily_sales
 from shop.models import Order, OrderItem, Product, Cart, CartItem
 import random
 
@@ -58,9 +61,13 @@ class Command(BaseCommand):
                     price=product.price,
                     quantity=quantity
                 )
+            recalculate_order_totals(Order.objects.filter(pk=order.pk))
             
             self.stdout.write(f'Created order #{order.id} with {order.items.count()} items')
 
+        # These orders bypass checkout, so recount the dashboard totals
+        rebuild_counters()
+        rebuild_daily_sales()
         self.stdout.write(self.style.SUCCESS(f'Successfully created {Order.objects.count()} test orders!'))
         self.stdout.write(f'Total orders: {Order.objects.count()}')
         self.stdout.write(f'Total order items: {OrderItem.objects.count()}')
@@ -0,0 +1,94 @@
+import re
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from shop.models import Category, Product, Cart, CartItem, Order
+from shop.pagination import KeysetPaginator, SORT_ORDERINGS
+
+# Plan lines that mean a hot table is read end to end
+FULL_SCAN_PATTERNS = [
+    re.compile(r'\bSCAN (shop_product|shop_order|shop_orderitem|shop_cartitem)\b(?! USING)'),
+    re.compile(r'Seq Scan on (shop_product|shop_order|shop_orderitem|shop_cartitem)\b'),
+]
+# Sorting an already index-filtered subset is fine, but worth pointing out
+SORT_PATTERNS = [
+    re.compile(r'USE TEMP B-TREE FOR ORDER BY'),
+    re.compile(r'^\s*(->\s*)?Sort\b', re.MULTILINE),
+]
+
+
+def keyset_page(queryset, sort, deep=False):
+    """The query a catalogue listing runs for the first or a later page"""
+    paginator = KeysetPaginator(queryset, 12, sort)
+    token = None
+    if deep:
+        anchor = Product(
+            id=1000, name='m', price=Decimal('50.00'),
+            created_at=datetime(2024, 1, 1, tzinfo=timezone.utc),
+        )
+        token = paginator.encode_cursor(anchor, 'next')
+    return paginator.page_queryset(token)
+
+
+def query_shapes():
+    """(view, description, queryset) for every hot storefront and admin query"""
+    active = Product.objects.filter(is_active=True)
+    shapes = [
+        ('home', 'featured products', Product.objects.filter(is_featured=True, is_active=True)[:6]),
+        ('home', 'nav categories', Category.objects.filter(is_active=True)[:6]),
+    ]
+    for sort in SORT_ORDERINGS:
+        shapes.append(('product_list', f'sort={sort}, first page', keyset_page(active, sort)))
+        shapes.append(('product_list', f'sort={sort}, later page', keyset_page(active, sort, deep=True)))
+    shapes += [
+        ('product_list', 'category + price range, sort=price_low',
+         keyset_page(active.filter(category__slug='books', price__gte=10, price__lte=100), 'price_low')),
+        ('product_list_by_category', 'sort=newest',
+         keyset_page(active.filter(category_id=1), 'newest')),
+        ('product_detail', 'product by slug', Product.objects.filter(slug='product', is_active=True)),
+        ('product_detail', 'related products',
+         active.filter(category_id=1).exclude(id=1)[:4]),
+        ('cart', 'cart items', CartItem.objects.filter(cart_id=1)),
+        ('add_to_cart', 'cart line for product', CartItem.objects.filter(cart_id=1, product_id=1)),
+        ('cart_context', 'user cart', Cart.objects.filter(user_id=1)),
+        ('order_history', 'orders for user', Order.objects.filter(user_id=1).order_by('-created_at')),
+        ('admin StockFilter', 'low stock', Product.objects.filter(stock__lte=10, stock__gt=0)),
+        ('admin StockFilter', 'out of stock', Product.objects.filter(stock=0)),
+    ]
+    return shapes
+
+
+class Command(BaseCommand):
+    help = 'Print EXPLAIN plans for the queries behind each storefront view'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--strict', action='store_true',
+            help='Exit with an error if any plan full-scans a hot table'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Database backend: {connection.vendor}')
+        regressions = []
+        for view, description, queryset in query_shapes():
+            plan = queryset.explain()
+            header = f'[{view}] {description}'
+            if any(pattern.search(plan) for pattern in FULL_SCAN_PATTERNS):
+                regressions.append(header)
+                self.stdout.write(self.style.ERROR(f'\n{header}  <-- full table scan'))
+            elif any(pattern.search(plan) for pattern in SORT_PATTERNS):
+                self.stdout.write(self.style.WARNING(f'\n{header}  (sorts filtered rows)'))
+            else:
+                self.stdout.write(self.style.MIGRATE_HEADING(f'\n{header}'))
+            self.stdout.write(plan)
+
+        self.stdout.write('')
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS('All queries are served by indexes.'))
+            return
+        message = f'{len(regressions)} queries full-scan a hot table:\n  ' + '\n  '.join(regressions)
+        if options['strict']:
+            raise CommandError(message)
+        self.stdout.write(self.style.WARNING(message))
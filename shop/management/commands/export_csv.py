@@ -0,0 +1,29 @@
+import sys
+
+from django.core.management.base import BaseCommand
+from shop.exports import CHUNK_SIZE, EXPORTS, export_stream
+
+class Command(BaseCommand):
+    help = 'Stream orders, products or daily sales as CSV (optionally gzipped)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(EXPORTS))
+        parser.add_argument('--output', '-o', default='-', help='File to write, or - for stdout')
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows fetched per query')
+
+    def handle(self, *args, **options):
+        make_queryset, columns = EXPORTS[options['dataset']]
+        chunks = export_stream(
+            make_queryset(), columns, compress=options['gzip'], chunk_size=options['chunk_size']
+        )
+        if options['output'] == '-':
+            out = sys.stdout.buffer
+            for chunk in chunks:
+                out.write(chunk)
+            out.flush()
+            return
+        with open(options['output'], 'wb') as out:
+            for chunk in chunks:
+                out.write(chunk)
+        self.stderr.write(self.style.SUCCESS(f'Wrote {options["dataset"]} to {options["output"]}'))
@@ -1,38 +1,31 @@
 from django.core.management.base import BaseCommand
-from django.db import models
-from shop.models import OrderItem
+from shop.integrity import CHECKS_BY_NAME, run_check
 
 class Command(BaseCommand):
     help = 'Fix OrderItem records with None price or quantity values'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='Order item ids scanned per batch')
+        parser.add_argument('--dry-run', action='store_true', help='Count broken items without fixing them')
+
     def handle(self, *args, **options):
         self.stdout.write('Checking for OrderItem records with None values...')
-        
-        # Find OrderItems with None price
-        none_price_items = OrderItem.objects.filter(price__isnull=True)
-        if none_price_items.exists():
-            self.stdout.write(f'Found {none_price_items.count()} items with None price')
-            for item in none_price_items:
-                if item.product:
-                    item.price = item.product.price
-                    item.save()
-                    self.stdout.write(f'Fixed OrderItem {item.id}: set price to {item.price}')
-        
-        # Find OrderItems with None quantity
-        none_quantity_items = OrderItem.objects.filter(quantity__isnull=True)
-        if none_quantity_items.exists():
-            self.stdout.write(f'Found {none_quantity_items.count()} items with None quantity')
-            for item in none_quantity_items:
-                item.quantity = 1  # Default quantity
-                item.save()
-                self.stdout.write(f'Fixed OrderItem {item.id}: set quantity to {item.quantity}')
-        
-        # Check for any remaining issues
-        problematic_items = OrderItem.objects.filter(
-            models.Q(price__isnull=True) | models.Q(quantity__isnull=True)
+
+        def progress(result, max_pk):
+            self.stdout.write(f'Scanned items up to id {result.last_pk} of {max_pk}: {result.violations} broken so far')
+
+        # Prices are copied from the product and quantities default to 1 in two
+        # UPDATEs per batch, then the affected orders' totals are recalculated
+        result = run_check(
+            CHECKS_BY_NAME['order_items'],
+            batch_size=options['batch_size'],
+            repair=not options['dry_run'],
+            progress=progress,
         )
-        
-        if problematic_items.exists():
-            self.stdout.write(self.style.ERROR(f'Still have {problematic_items.count()} problematic items'))
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'Dry run: {result.violations} items need fixing.'))
+        elif result.violations:
+            self.stdout.write(self.style.SUCCESS(f'Fixed {result.repaired} items; all OrderItem records are now valid!'))
         else:
             self.stdout.write(self.style.SUCCESS('All OrderItem records are now valid!'))
@@ -0,0 +1,57 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from shop.synthetic import DatasetGenerator, delete_synthetic_data, synthetic_data_exists
+
+class Command(BaseCommand):
+    help = 'Generate a reproducible synthetic dataset (categories, products, users, carts, orders) for load tests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--products', type=int, default=10000)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--carts', type=int, default=500)
+        parser.add_argument('--orders', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=42, help='Same seed and sizes give the same dataset')
+        parser.add_argument('--days', type=int, default=365, help='Spread orders over this many days')
+        parser.add_argument(
+            '--end-date', type=date.fromisoformat,
+            help='Date of the newest orders (YYYY-MM-DD); pin it to compare runs made on different days'
+        )
+        parser.add_argument('--zipf-exponent', type=float, default=1.1, help='Skew of product popularity')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk insert')
+        parser.add_argument(
+            '--replace', action='store_true',
+            help='Delete a previously generated synthetic dataset first'
+        )
+
+    def handle(self, *args, **options):
+        if options['categories'] < 1 or (options['orders'] and options['products'] < 1):
+            raise CommandError('Orders need at least one category and one product.')
+        if synthetic_data_exists():
+            if not options['replace']:
+                raise CommandError('A synthetic dataset already exists; pass --replace to regenerate it.')
+            self.stdout.write('Deleting the previous synthetic dataset...')
+            delete_synthetic_data()
+
+        generator = DatasetGenerator(
+            categories=options['categories'],
+            products=options['products'],
+            users=options['users'],
+            carts=options['carts'],
+            orders=options['orders'],
+            seed=options['seed'],
+            days=options['days'],
+            end_date=options['end_date'],
+            batch_size=options['batch_size'],
+            zipf_exponent=options['zipf_exponent'],
+        )
+
+        def progress(name, stats):
+            self.stdout.write(f'{stats.counts[name]} {name} ({stats.rows / stats.elapsed:.0f} rows/s)')
+
+        stats = generator.run(progress)
+        summary = ', '.join(f'{count} {name}' for name, count in stats.counts.items())
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {summary} in {stats.elapsed:.1f}s (seed {options["seed"]}).'
+        ))
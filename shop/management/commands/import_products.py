@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from shop.catalogue_import import ProductImporter, feed_format, open_feed, read_records
+
+class Command(BaseCommand):
+    help = 'Bulk upsert products (keyed by slug) from a CSV or JSON Lines feed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Feed file: .csv or .jsonl, optionally .gz')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Override the format guessed from the file name')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Products written per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Validate the feed without writing anything')
+        parser.add_argument(
+            '--create-categories', action='store_true',
+            help='Create categories named in the feed that do not exist yet'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        importer = ProductImporter(
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+            create_categories=options['create_categories'],
+        )
+
+        def progress(stats):
+            self.stdout.write(f'{stats.rows} products processed ({stats.rate:.0f} rows/s)')
+
+        try:
+            with open_feed(path) as stream:
+                stats = importer.run(read_records(stream, options['format'] or feed_format(path)), progress)
+        except OSError as exc:
+            raise CommandError(f'Cannot read {path}: {exc}')
+
+        for line_number, message in stats.errors:
+            self.stdout.write(self.style.WARNING(f'Line {line_number}: {message}'))
+        timing = f'in {stats.elapsed:.1f}s ({stats.rate:.0f} rows/s)'
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(
+                f'Dry run: {stats.created} to create, {stats.updated} to update, '
+                f'{stats.invalid} invalid {timing}.'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Imported {stats.created} new and {stats.updated} updated products, '
+                f'skipped {stats.invalid} invalid {timing}.'
+            ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from shop.query_cache import query_cache_stats, reset_query_cache_stats
+
+class Command(BaseCommand):
+    help = 'Show hit/miss counters of the product listing query cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Zero the counters after printing them')
+
+    def handle(self, *args, **options):
+        stats = query_cache_stats()
+        for kind in ('page', 'product'):
+            self.stdout.write(
+                f"{kind:<8} hits {stats[f'{kind}_hits']:>8}  misses {stats[f'{kind}_misses']:>8}  "
+                f"hit ratio {stats[f'{kind}_hit_ratio']:.1%}"
+            )
+        if options['reset']:
+            reset_query_cache_stats()
+            self.stdout.write(self.style.SUCCESS('Counters reset.'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from shop.rollups import rebuild_daily_sales
+
+class Command(BaseCommand):
+    help = 'Recompute the DailySales rollup from all orders, a chunk of orders at a time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Orders aggregated per chunk')
+
+    def handle(self, *args, **options):
+        def progress(processed, last_id):
+            self.stdout.write(f'Rolled up {processed} orders (up to id {last_id})')
+
+        processed = rebuild_daily_sales(options['batch_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt daily sales from {processed} orders.'))
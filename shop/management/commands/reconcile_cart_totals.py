@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from shop.cart import recalculate_cart_totals
+from shop.integrity import drifted_carts
+from shop.models import Cart
+
+class Command(BaseCommand):
+    help = 'Find carts whose stored item_count/subtotal drifted from their items and repair them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Carts checked per batch')
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without repairing it')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        checked = repaired = 0
+        last_id = 0
+        while True:
+            batch_ids = list(
+                Cart.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not batch_ids:
+                break
+            last_id = batch_ids[-1]
+            checked += len(batch_ids)
+            drifted_ids = list(
+                drifted_carts(Cart.objects.filter(id__in=batch_ids)).values_list('id', flat=True)
+            )
+            if drifted_ids and not options['dry_run']:
+                with transaction.atomic():
+                    recalculate_cart_totals(Cart.objects.filter(id__in=drifted_ids))
+            repaired += len(drifted_ids)
+            self.stdout.write(f'Checked {checked} carts, {repaired} drifted so far')
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'Dry run: {repaired} of {checked} carts have drifted totals.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Repaired {repaired} of {checked} carts.'))
@@ -0,0 +1,16 @@
+from .cart import RequestCart
+
+
+class CartMiddleware:
+    """Attach a lazily resolved ``RequestCart`` to every request as ``request.cart``"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.cart = RequestCart(request)
+        response = self.get_response(request)
+        # Anonymous carts kept in the cache or a cookie are persisted here,
+        # after the view has made all of its changes
+        request.cart.save(response)
+        return response
@@ -0,0 +1,56 @@
+from django.db import migrations
+
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS shop_product_fts USING fts5("
+    "name, short_description, description, tokenize='porter unicode61')",
+    "INSERT INTO shop_product_fts (rowid, name, short_description, description) "
+    "SELECT id, name, short_description, description FROM shop_product",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TABLE IF EXISTS shop_product_fts",
+]
+
+POSTGRES_FORWARD = [
+    "ALTER TABLE shop_product ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(short_description, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'C')"
+    ") STORED",
+    "CREATE INDEX shop_product_search_vector_gin ON shop_product USING GIN (search_vector)",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS shop_product_search_vector_gin",
+    "ALTER TABLE shop_product DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def run_for_vendor(sqlite_statements, postgres_statements):
+    def operation(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        if vendor == 'sqlite':
+            statements = sqlite_statements
+        elif vendor == 'postgresql':
+            statements = postgres_statements
+        else:
+            # Other backends fall back to icontains search
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor(SQLITE_FORWARD, POSTGRES_FORWARD),
+            run_for_vendor(SQLITE_BACKWARD, POSTGRES_BACKWARD),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.30 on 2026-10-16 22:37
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_cart_items(apps, schema_editor):
+    """Fold duplicate (cart, product) lines into the oldest one"""
+    CartItem = apps.get_model('shop', 'CartItem')
+    duplicates = (
+        CartItem.objects.values('cart_id', 'product_id')
+        .annotate(lines=Count('id'), keep_id=Min('id'), quantity=Sum('quantity'))
+        .filter(lines__gt=1)
+        .order_by()
+    )
+    for group in list(duplicates):
+        CartItem.objects.filter(id=group['keep_id']).update(quantity=group['quantity'])
+        CartItem.objects.filter(
+            cart_id=group['cart_id'], product_id=group['product_id']
+        ).exclude(id=group['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_cart_totals'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_cart_items, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='cartitem',
+            name='shop_cartitem_cart_prod_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'product'), name='shop_cartitem_unique_cart_product'),
+        ),
+    ]
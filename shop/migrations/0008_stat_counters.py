@@ -0,0 +1,44 @@
+# Generated by Django 4.2.30 on 2026-10-16 22:47
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+
+def seed_counters(apps, schema_editor):
+    StatCounter = apps.get_model('shop', 'StatCounter')
+    Order = apps.get_model('shop', 'Order')
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    revenue = OrderItem.objects.aggregate(total=Sum(F('price') * F('quantity')))['total']
+    totals = {'orders': Order.objects.count(), 'revenue': revenue or Decimal('0.00')}
+    # Every shard exists up front so an increment is always a single UPDATE
+    StatCounter.objects.bulk_create([
+        StatCounter(name=name, shard=shard, value=total if shard == 0 else 0)
+        for name, total in totals.items()
+        for shard in range(8)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_order_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='statcounter',
+            constraint=models.UniqueConstraint(fields=('name', 'shard'), name='shop_statcounter_unique_name_shard'),
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0009_daily_sales'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['updated_at'], name='shop_prod_updated_idx'),
+        ),
+    ]
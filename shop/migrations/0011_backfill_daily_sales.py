@@ -0,0 +1,62 @@
+from django.db import migrations
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import TruncDate
+
+BATCH_SIZE = 1000
+
+
+def backfill_daily_sales(apps, schema_editor):
+    """Roll up orders placed before 0009 created DailySales
+
+    Skipped when the rollup already has rows (e.g. ``rebuild_daily_sales``
+    was run by hand after 0009), so it never double counts.
+    """
+    DailySales = apps.get_model('shop', 'DailySales')
+    Order = apps.get_model('shop', 'Order')
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    if DailySales.objects.exists():
+        return
+    totals = {}
+    last_id = 0
+    while True:
+        batch_ids = list(
+            Order.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:BATCH_SIZE]
+        )
+        if not batch_ids:
+            break
+        last_id = batch_ids[-1]
+        rows = (
+            OrderItem.objects.filter(order_id__in=batch_ids)
+            .annotate(day=TruncDate('order__created_at'))
+            .values('day', 'product_id', 'product__category_id', 'order__status')
+            .annotate(
+                quantity_total=Sum('quantity'),
+                revenue_total=Sum(F('price') * F('quantity'), output_field=DecimalField(max_digits=14, decimal_places=2)),
+                lines=Count('id'),
+            )
+            .order_by()
+        )
+        for row in rows:
+            # Orders of one day can span batches, so merge before inserting
+            key = (row['day'], row['product_id'], row['order__status'])
+            sales = totals.get(key)
+            if sales is None:
+                sales = totals[key] = DailySales(
+                    date=row['day'], product_id=row['product_id'], status=row['order__status'],
+                    category_id=row['product__category_id'], quantity=0, revenue=0, line_count=0,
+                )
+            sales.quantity += row['quantity_total']
+            sales.revenue += row['revenue_total']
+            sales.line_count += row['lines']
+    DailySales.objects.bulk_create(totals.values(), batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0010_product_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_daily_sales, migrations.RunPython.noop),
+    ]
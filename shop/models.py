@@ -35,6 +35,19 @@ class Product(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Storefront listings: active products in each keyset sort order
+            models.Index(fields=['name', 'id'], condition=models.Q(is_active=True), name='shop_prod_active_name_idx'),
+            models.Index(fields=['price', 'id'], condition=models.Q(is_active=True), name='shop_prod_active_price_idx'),
+            models.Index(fields=['-created_at', '-id'], condition=models.Q(is_active=True), name='shop_prod_active_newest_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], condition=models.Q(is_active=True), name='shop_prod_active_cat_idx'),
+            # Home page featured products
+            models.Index(fields=['-created_at'], condition=models.Q(is_active=True, is_featured=True), name='shop_prod_featured_idx'),
+            # Admin StockFilter ranges
+            models.Index(fields=['stock'], name='shop_prod_stock_idx'),
+            # Listing ETags: MAX(updated_at) as an index lookup
+            models.Index(fields=['updated_at'], name='shop_prod_updated_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -49,6 +62,9 @@ class Product(models.Model):
 class Cart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     session_key = models.CharField(max_length=40, null=True, blank=True)
+    # Denormalized totals, rewritten in the same transaction as every item change
+    item_count = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -57,13 +73,17 @@ class Cart(models.Model):
             return f"Cart for {self.user.username}"
         return f"Cart {self.session_key}"
 
+    @property
+    def totals(self):
+        return self.item_count, self.subtotal
+
     @property
     def total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        return self.item_count
 
     @property
     def total_price(self):
-        return sum(item.total_price for item in self.items.all())
+        return self.subtotal
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, related_name='items', on_delete=models.CASCADE)
@@ -71,6 +91,12 @@ class CartItem(models.Model):
     quantity = models.PositiveIntegerField(default=1)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            # One line per product per cart; add_item upserts against this
+            models.UniqueConstraint(fields=['cart', 'product'], name='shop_cartitem_unique_cart_product'),
+        ]
+
     def __str__(self):
         return f"{self.quantity} x {self.product.name}"
 
@@ -86,6 +112,8 @@ class Order(models.Model):
         ('delivered', 'Delivered'),
         ('cancelled', 'Cancelled'),
     ]
+    # Statuses that count as sales in reports and the dashboard revenue
+    SALE_STATUSES = ['pending', 'processing', 'shipped', 'delivered']
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     first_name = models.CharField(max_length=50)
@@ -95,18 +123,28 @@ class Order(models.Model):
     postal_code = models.CharField(max_length=20)
     city = models.CharField(max_length=100)
     status = models.CharField(max_length=20, choices=ORDER_STATUS_CHOICES, default='pending')
+    # Idempotency key from the checkout form; a replayed POST finds this order
+    checkout_token = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
+    # Written at checkout; orders are immutable once placed. item_count is
+    # the number of lines, as shown in the admin "Items" column.
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # order_history
+            models.Index(fields=['user', '-created_at'], name='shop_order_user_created_idx'),
+        ]
 
     def __str__(self):
         return f'Order {self.id}'
 
     @property
     def total_cost(self):
-        return sum(item.get_cost() for item in self.items.all())
+        return self.subtotal
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
@@ -129,4 +167,51 @@ class OrderItem(models.Model):
     def get_cost(self):
         if self.price is None or self.quantity is None:
             return 0
-        return self.price * self.quantity
\ No newline at end of file
+        return self.price * self.quantity
+
+
+class StatCounter(models.Model):
+    """A sharded running total for the admin dashboard (see shop.dashboard)
+
+    Each counter is spread over several rows so concurrent checkouts rarely
+    wait on the same row lock; its value is the sum of its shards.
+    """
+    name = models.CharField(max_length=50)
+    shard = models.PositiveSmallIntegerField()
+    value = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'shard'], name='shop_statcounter_unique_name_shard'),
+        ]
+
+    def __str__(self):
+        return f'{self.name}[{self.shard}] = {self.value}'
+
+
+class DailySales(models.Model):
+    """Sales per (day, product, order status), maintained by shop.rollups
+
+    Reports and the dashboard read this instead of aggregating the
+    Order x OrderItem join. ``category`` is the product's category when the
+    row was last written, so reports by category need no join either.
+    """
+    date = models.DateField()
+    product = models.ForeignKey(Product, related_name='daily_sales', on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, related_name='daily_sales', on_delete=models.CASCADE)
+    status = models.CharField(max_length=20, choices=Order.ORDER_STATUS_CHOICES)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    line_count = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Daily sales"
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product', 'status'], name='shop_dailysales_unique_key'),
+        ]
+        indexes = [
+            models.Index(fields=['category', 'date'], name='shop_dailysales_cat_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.date} {self.product_id} {self.status}'
@@ -0,0 +1,105 @@
+"""
+Full-page cache for anonymous catalogue GETs.
+
+Anonymous visitors see the same catalogue HTML, except for two per-visitor
+values: the cart badge and the CSRF token in the add-to-cart forms. Pages
+are therefore rendered with placeholders ("holes") for both and cached
+under the catalogue version (see ``shop.fragments``) plus the normalized
+query string. Each response, hit or miss, fills the holes with the
+visitor's own values. A catalogue change moves the version on, which
+retires every cached page at once.
+"""
+import hashlib
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+
+from .cart import get_request_cart
+from .fragments import catalogue_version
+
+CSRF_HOLE = 'page-cache-csrf-hole'
+CART_COUNT_HOLE = 'page-cache-cart-count-hole'
+# Query parameters that never change the rendered page
+IGNORED_PARAMS = {'fbclid', 'gclid', 'msclkid'}
+IGNORED_PARAM_PREFIXES = ('utm_',)
+
+
+def page_cache_timeout():
+    return getattr(settings, 'SHOP_PAGE_CACHE_TIMEOUT', 60 * 5)
+
+
+def normalized_query(request):
+    """The query string sorted, without blanks or tracking parameters"""
+    params = sorted(
+        (name, value)
+        for name, values in request.GET.lists()
+        for value in values
+        if value and name not in IGNORED_PARAMS and not name.startswith(IGNORED_PARAM_PREFIXES)
+    )
+    return urlencode(params)
+
+
+def page_cache_key(request):
+    url = f'{request.path}?{normalized_query(request)}'
+    digest = hashlib.md5(url.encode()).hexdigest()
+    return f'shop:page:v{catalogue_version()}:{digest}'
+
+
+def is_cacheable_request(request):
+    if request.method not in ('GET', 'HEAD') or not page_cache_timeout():
+        return False
+    if request.user.is_authenticated:
+        return False
+    # A queued flash message is per visitor and is consumed by the render
+    return not len(get_messages(request))
+
+
+def fill_holes(content, request):
+    try:
+        cart_count = get_request_cart(request).totals()[0]
+    except Exception:
+        cart_count = 0
+    return (
+        content
+        .replace(CSRF_HOLE.encode(), get_token(request).encode())
+        .replace(CART_COUNT_HOLE.encode(), str(cart_count).encode())
+    )
+
+
+def cache_anonymous_page(view):
+    """Serve ``view`` from the page cache for anonymous GETs
+
+    ``request.page_cache_holes`` tells ``cart_context`` to render
+    placeholders instead of the visitor's own values.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not is_cacheable_request(request):
+            return view(request, *args, **kwargs)
+        key = page_cache_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            content_type, content = cached
+            response = HttpResponse(fill_holes(content, request), content_type=content_type)
+            response['X-Page-Cache'] = 'hit'
+            return response
+
+        request.page_cache_holes = True
+        try:
+            response = view(request, *args, **kwargs)
+        finally:
+            # Error pages rendered after an exception must show real values
+            request.page_cache_holes = False
+        if response.streaming:
+            return response
+        if response.status_code == 200:
+            cache.set(key, (response['Content-Type'], response.content), page_cache_timeout())
+            response['X-Page-Cache'] = 'miss'
+        response.content = fill_holes(response.content, request)
+        return response
+    return wrapper
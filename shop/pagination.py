@@ -0,0 +1,233 @@
+import hashlib
+
+from django.core import signing
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+# Keyset orderings for the catalogue sort options. The trailing id column is
+# the tiebreak that makes every ordering total, so cursors never skip rows.
+SORT_ORDERINGS = {
+    'name': ('name', 'id'),
+    'price_low': ('price', 'id'),
+    'price_high': ('-price', '-id'),
+    'newest': ('-created_at', '-id'),
+}
+
+CURSOR_SALT = 'shop.pagination.cursor'
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPage:
+    """One page of a keyset-paginated queryset
+
+    Mirrors the parts of ``django.core.paginator.Page`` the templates use, but
+    navigation is by opaque ``next_token``/``previous_token`` instead of page
+    numbers.
+    """
+
+    is_keyset = True
+
+    def __init__(self, object_list, paginator, next_token=None, previous_token=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_token = next_token
+        self.previous_token = previous_token
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_token is not None
+
+    def has_previous(self):
+        return self.previous_token is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """Cursor-based paginator that never issues OFFSET queries
+
+    Each page is a single ``WHERE (sort_key, id) > cursor ORDER BY ... LIMIT``
+    query, so page latency is flat however deep the client walks. The total
+    count is optional: when requested it is cached for ``count_timeout``
+    seconds and is therefore approximate.
+    """
+
+    def __init__(self, queryset, per_page, sort, count_timeout=60):
+        if sort not in SORT_ORDERINGS:
+            raise ValueError(f'Unsupported keyset sort: {sort}')
+        self.queryset = queryset
+        self.per_page = per_page
+        self.sort = sort
+        self.ordering = SORT_ORDERINGS[sort]
+        self.count_timeout = count_timeout
+        # Set by callers that already know the count (see shop.query_cache)
+        self.known_count = None
+
+    @property
+    def count(self):
+        if self.known_count is not None:
+            return self.known_count
+        if self.queryset.query.is_empty():
+            # .none() has no SQL to hash (str() raises EmptyResultSet)
+            return 0
+        query_hash = hashlib.md5(str(self.queryset.query).encode()).hexdigest()
+        return cache.get_or_set(
+            f'shop:keyset-count:{query_hash}', self.queryset.count, self.count_timeout
+        )
+
+    def _fields(self):
+        return [(name.lstrip('-'), name.startswith('-')) for name in self.ordering]
+
+    def _values_for(self, obj):
+        return [str(getattr(obj, name)) for name, _ in self._fields()]
+
+    def encode_cursor(self, obj, direction):
+        return signing.dumps(
+            {'s': self.sort, 'd': direction, 'v': self._values_for(obj)},
+            salt=CURSOR_SALT,
+            compress=True,
+        )
+
+    def decode_cursor(self, token):
+        try:
+            data = signing.loads(token, salt=CURSOR_SALT)
+        except signing.BadSignature:
+            raise InvalidCursor(token)
+        if data.get('s') != self.sort or data.get('d') not in ('next', 'prev'):
+            raise InvalidCursor(token)
+        fields = self._fields()
+        if len(data.get('v') or []) != len(fields):
+            raise InvalidCursor(token)
+        model = self.queryset.model
+        try:
+            values = [
+                model._meta.get_field(name).to_python(value)
+                for (name, _), value in zip(fields, data['v'])
+            ]
+        except ValidationError:
+            raise InvalidCursor(token)
+        return data['d'], values
+
+    def _after(self, values, reverse=False):
+        """Rows strictly after ``values`` in the (optionally reversed) ordering"""
+        fields = self._fields()
+        condition = Q()
+        equal_prefix = Q()
+        for (name, descending), value in zip(fields, values):
+            lookup = 'lt' if descending != reverse else 'gt'
+            condition |= equal_prefix & Q(**{f'{name}__{lookup}': value})
+            equal_prefix &= Q(**{name: value})
+        # A plain range on the leading column lets the database seek an index
+        # instead of evaluating the OR expansion against every row.
+        (lead_name, lead_descending), lead_value = fields[0], values[0]
+        lead_lookup = 'lte' if lead_descending != reverse else 'gte'
+        return Q(**{f'{lead_name}__{lead_lookup}': lead_value}) & condition
+
+    def _decode_or_first(self, token):
+        if token:
+            try:
+                return self.decode_cursor(token)
+            except InvalidCursor:
+                pass
+        return 'next', None
+
+    def page_queryset(self, token=None):
+        """The single LIMIT query that fetches the page addressed by ``token``
+
+        One extra row is fetched so the page knows whether there is more.
+        Previous pages come back in reversed order.
+        """
+        direction, values = self._decode_or_first(token)
+        if direction == 'prev':
+            reversed_ordering = [
+                name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering
+            ]
+            return (
+                self.queryset.filter(self._after(values, reverse=True))
+                .order_by(*reversed_ordering)[:self.per_page + 1]
+            )
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(self._after(values))
+        return queryset.order_by(*self.ordering)[:self.per_page + 1]
+
+    def get_page(self, token=None):
+        """Return the page addressed by ``token``; bad tokens give the first page"""
+        direction, values = self._decode_or_first(token)
+        rows = list(self.page_queryset(token))
+        if direction == 'prev':
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            has_next = True
+        else:
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_previous = values is not None
+
+        next_token = self.encode_cursor(rows[-1], 'next') if rows and has_next else None
+        previous_token = self.encode_cursor(rows[0], 'prev') if rows and has_previous else None
+        return KeysetPage(rows, self, next_token=next_token, previous_token=previous_token)
+
+
+def estimated_row_count(queryset):
+    """The planner's row estimate for an unfiltered queryset, or None
+
+    Postgres keeps one in ``pg_class.reltuples``; SQLite only has one after
+    ``ANALYZE`` has filled ``sqlite_stat1``. Filtered querysets always return
+    None because the table estimate says nothing about them.
+    """
+    if queryset.query.where:
+        return None
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql, params = 'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table]
+    elif connection.vendor == 'sqlite':
+        sql, params = 'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table]
+    else:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if not row or row[0] is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    # reltuples is -1 (or 0) until the table has been vacuumed or analyzed
+    return estimate if estimate > 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that skips COUNT(*) on big unfiltered tables
+
+    When the table is at least ``estimate_threshold`` rows according to the
+    planner statistics, the estimate is used as the count. Smaller tables and
+    filtered querysets are counted exactly, as usual.
+    """
+
+    estimate_threshold = 100000
+
+    @cached_property
+    def count(self):
+        estimate = estimated_row_count(self.object_list)
+        if estimate is not None and estimate >= self.estimate_threshold:
+            return estimate
+        return super().count
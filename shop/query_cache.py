@@ -0,0 +1,183 @@
+"""
+Query-result cache for product listings.
+
+A listing page is fully determined by a few request parameters. These are
+canonicalized: the search text is reduced to its lowercased terms
+(matching is case-insensitive on every search backend), prices are parsed
+as decimals, and bad cursors and page numbers resolve to the page they
+would show. The canonical form keys a cache entry that holds only the
+ordered product ids of the page and its cursors. The total count is cached
+once per filter combination and shared by all its pages and sort orders.
+Product rows are hydrated from a per-product cache with one ``get_many``,
+and only missing rows go to the database.
+
+All keys embed the catalogue version (``shop.fragments``), so a catalogue
+change retires every cached result at once. Entries live in the
+``SHOP_QUERY_CACHE_ALIAS`` cache, which should evict least-recently-used
+entries: LocMemCache does beyond ``MAX_ENTRIES``, and Redis does with
+``maxmemory-policy allkeys-lru``. Hit/miss counters are kept in the same
+cache so every worker contributes to them.
+"""
+import hashlib
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+
+from .fragments import catalogue_version
+from .models import Product
+from .pagination import InvalidCursor, KeysetPage, KeysetPaginator
+from .search import search_terms
+
+QUERY_CACHE_TIMEOUT = 60 * 10
+PRODUCT_CACHE_TIMEOUT = 60 * 60
+STAT_NAMES = ('page_hits', 'page_misses', 'product_hits', 'product_misses')
+
+
+def query_cache():
+    return caches[getattr(settings, 'SHOP_QUERY_CACHE_ALIAS', 'default')]
+
+
+def clean_price(value):
+    """A non-negative price as a ``Decimal`` with two places, or None"""
+    try:
+        price = Decimal(str(value).strip()).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        return None
+    return price if price.is_finite() and price >= 0 else None
+
+
+def normalize_search(value):
+    """Search text reduced to what every backend matches on: its terms, lowercased"""
+    return ' '.join(search_terms(value)).lower()
+
+
+def canonical_listing_params(q=None, category=None, min_price=None, max_price=None, sort=None):
+    """The filters a view applied, as sorted pairs; equal pairs mean equal rows"""
+    params = {
+        # A query without any terms still differs from no query at all
+        'q': normalize_search(q) or q,
+        'category': (category or '').strip(),
+        'min_price': min_price,
+        'max_price': max_price,
+        'sort': sort,
+    }
+    return tuple(sorted((name, str(value)) for name, value in params.items() if value not in (None, '')))
+
+
+def _key(kind, parts):
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return f'shop:query-cache:{kind}:v{catalogue_version()}:{digest}'
+
+
+def record(**amounts):
+    """Add to the shared hit/miss counters"""
+    cache = query_cache()
+    for name, amount in amounts.items():
+        if not amount:
+            continue
+        key = f'shop:query-cache:stats:{name}'
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            if not cache.add(key, amount, None):
+                cache.incr(key, amount)
+
+
+def query_cache_stats():
+    """{counter: value} plus ``page_hit_ratio`` and ``product_hit_ratio``"""
+    keys = {f'shop:query-cache:stats:{name}': name for name in STAT_NAMES}
+    values = query_cache().get_many(list(keys))
+    stats = {name: values.get(key, 0) for key, name in keys.items()}
+    for kind in ('page', 'product'):
+        lookups = stats[f'{kind}_hits'] + stats[f'{kind}_misses']
+        stats[f'{kind}_hit_ratio'] = stats[f'{kind}_hits'] / lookups if lookups else 0.0
+    return stats
+
+
+def reset_query_cache_stats():
+    query_cache().delete_many([f'shop:query-cache:stats:{name}' for name in STAT_NAMES])
+
+
+def _product_key(pk, version):
+    return f'shop:query-cache:product:v{version}:{pk}'
+
+
+def remember_products(products):
+    version = catalogue_version()
+    query_cache().set_many(
+        {_product_key(product.pk, version): product for product in products}, PRODUCT_CACHE_TIMEOUT
+    )
+
+
+def hydrate_products(ids):
+    """Products for ``ids`` in order, from the per-product cache where possible"""
+    version = catalogue_version()
+    cache = query_cache()
+    cached = cache.get_many([_product_key(pk, version) for pk in ids])
+    products = {product.pk: product for product in cached.values()}
+    missing = [pk for pk in ids if pk not in products]
+    if missing:
+        fetched = Product.objects.in_bulk(missing)
+        remember_products(fetched.values())
+        products.update(fetched)
+    record(product_hits=len(ids) - len(missing), product_misses=len(missing))
+    return [products[pk] for pk in ids if pk in products]
+
+
+def cached_count(params, queryset):
+    """Row count shared by every page and sort order of one filter combination"""
+    filters = tuple(pair for pair in params if pair[0] != 'sort')
+    return query_cache().get_or_set(_key('count', filters), queryset.count, QUERY_CACHE_TIMEOUT)
+
+
+def cached_keyset_page(params, queryset, per_page, sort, token=None):
+    """A ``KeysetPage`` whose ids, cursors and count come from the cache when warm"""
+    paginator = KeysetPaginator(queryset, per_page, sort)
+    if token:
+        try:
+            paginator.decode_cursor(token)
+        except InvalidCursor:
+            # Every bad cursor means "first page": share that entry
+            token = None
+    cache = query_cache()
+    key = _key('keyset', (params, token))
+    entry = cache.get(key)
+    if entry is None:
+        page = paginator.get_page(token)
+        rows = page.object_list
+        entry = {'ids': [product.pk for product in rows], 'next': page.next_token, 'previous': page.previous_token}
+        cache.set(key, entry, QUERY_CACHE_TIMEOUT)
+        remember_products(rows)
+        record(page_misses=1)
+    else:
+        rows = hydrate_products(entry['ids'])
+        record(page_hits=1)
+    paginator.known_count = cached_count(params, queryset)
+    return KeysetPage(rows, paginator, next_token=entry['next'], previous_token=entry['previous'])
+
+
+def cached_numbered_page(params, queryset, per_page, number=None):
+    """A numbered ``Page`` (relevance-ranked search) served like ``cached_keyset_page``"""
+    paginator = Paginator(queryset, per_page)
+    paginator.count = cached_count(params, queryset)
+    try:
+        number = paginator.validate_number(number)
+    except PageNotAnInteger:
+        number = 1
+    except EmptyPage:
+        number = paginator.num_pages
+    cache = query_cache()
+    key = _key('page', (params, number))
+    ids = cache.get(key)
+    if ids is None:
+        bottom = (number - 1) * per_page
+        rows = list(queryset[bottom:bottom + per_page])
+        cache.set(key, [product.pk for product in rows], QUERY_CACHE_TIMEOUT)
+        remember_products(rows)
+        record(page_misses=1)
+    else:
+        rows = hydrate_products(ids)
+        record(page_hits=1)
+    return paginator._get_page(rows, number, paginator)
@@ -0,0 +1,210 @@
+"""
+Incrementally maintained sales rollups.
+
+``DailySales`` holds quantity, revenue and line count per (day, product,
+order status). Checkout adds a new order's lines under 'pending', and
+``change_order_status`` moves an order's lines from the old status to the
+new one, both in the same transaction as the order write. The
+``rebuild_daily_sales`` command recomputes the table from scratch.
+"""
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .dashboard import increment_counter
+from .models import DailySales, Order, OrderItem
+
+SALE_STATUSES = Order.SALE_STATUSES
+
+
+def _upsert_rows(rows):
+    """Add ``(date, product_id, category_id, status, quantity, revenue, lines)`` deltas"""
+    table = DailySales._meta.db_table
+    ops = connection.ops
+    params = []
+    for date, product_id, category_id, status, quantity, revenue, lines in rows:
+        params += [
+            ops.adapt_datefield_value(date), product_id, category_id, status,
+            quantity, ops.adapt_decimalfield_value(revenue, 14, 2), lines,
+        ]
+    values = ', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(rows))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (date, product_id, category_id, status, quantity, revenue, line_count) '
+            f'VALUES {values} '
+            f'ON CONFLICT (date, product_id, status) DO UPDATE SET '
+            f'category_id = excluded.category_id, '
+            f'quantity = {table}.quantity + excluded.quantity, '
+            f'revenue = {table}.revenue + excluded.revenue, '
+            f'line_count = {table}.line_count + excluded.line_count',
+            params,
+        )
+
+
+def _increment_rows(rows):
+    """Portable fallback for ``_upsert_rows``: one UPDATE (or INSERT) per row"""
+    for date, product_id, category_id, status, quantity, revenue, lines in rows:
+        updated = DailySales.objects.filter(date=date, product_id=product_id, status=status).update(
+            category_id=category_id,
+            quantity=F('quantity') + quantity,
+            revenue=F('revenue') + revenue,
+            line_count=F('line_count') + lines,
+        )
+        if not updated:
+            DailySales.objects.create(
+                date=date, product_id=product_id, category_id=category_id, status=status,
+                quantity=quantity, revenue=revenue, line_count=lines,
+            )
+
+
+def merge_deltas(rows):
+    """Sum deltas sharing a ``(date, product_id, status)`` key into one row each
+
+    A bulk status change can produce several deltas for the same new-status
+    row (orders moving from different old statuses), and Postgres refuses an
+    ``INSERT ... ON CONFLICT`` that touches one row twice.
+    """
+    merged = {}
+    for date, product_id, category_id, status, quantity, revenue, lines in rows:
+        key = (date, product_id, status)
+        if key in merged:
+            _, _, _, _, total_quantity, total_revenue, total_lines = merged[key]
+            quantity, revenue, lines = total_quantity + quantity, total_revenue + revenue, total_lines + lines
+        merged[key] = (date, product_id, category_id, status, quantity, revenue, lines)
+    return list(merged.values())
+
+
+def apply_deltas(rows):
+    """Add a batch of deltas to the rollup in one statement where supported"""
+    rows = merge_deltas(rows)
+    if not rows:
+        return
+    if connection.features.supports_update_conflicts_with_target:
+        _upsert_rows(rows)
+    else:
+        _increment_rows(rows)
+
+
+def record_order_sales(order, lines):
+    """Roll up a new order; ``lines`` are the ``(product, quantity, price)`` it was placed with"""
+    date = timezone.localdate(order.created_at)
+    apply_deltas(
+        (date, product.id, product.category_id, order.status, quantity, price * quantity, 1)
+        for product, quantity, price in lines
+    )
+
+
+def order_sales(orders):
+    """Rollup rows for the items of ``orders``, grouped in SQL"""
+    return (
+        OrderItem.objects.filter(order__in=orders)
+        .annotate(day=TruncDate('order__created_at'))
+        .values('day', 'product_id', 'product__category_id', 'order__status')
+        .annotate(
+            quantity_total=Sum('quantity'),
+            revenue_total=Sum(F('price') * F('quantity'), output_field=DecimalField(max_digits=14, decimal_places=2)),
+            lines=Count('id'),
+        )
+        .order_by()
+    )
+
+
+def change_order_status(orders, status):
+    """Set ``status`` on an Order queryset and move their sales in the rollup
+
+    Cancelling an order takes its revenue off the dashboard's running total,
+    and un-cancelling puts it back. Returns the number of orders whose status
+    actually changed.
+    """
+    with transaction.atomic():
+        order_ids = list(
+            orders.exclude(status=status).select_for_update().values_list('id', flat=True)
+        )
+        if not order_ids:
+            return 0
+        moving = Order.objects.filter(id__in=order_ids)
+        deltas = []
+        revenue = 0
+        for row in order_sales(moving):
+            key = (row['day'], row['product_id'], row['product__category_id'])
+            amounts = (row['quantity_total'], row['revenue_total'], row['lines'])
+            deltas.append(key + (row['order__status'],) + tuple(-amount for amount in amounts))
+            deltas.append(key + (status,) + amounts)
+            was_sale = row['order__status'] in SALE_STATUSES
+            if was_sale != (status in SALE_STATUSES):
+                revenue += -row['revenue_total'] if was_sale else row['revenue_total']
+        apply_deltas(deltas)
+        if revenue:
+            increment_counter('revenue', revenue)
+        return moving.update(status=status, updated_at=timezone.now())
+
+
+def _lock_rollup_table():
+    """Hold off checkouts' and status changes' rollup writes until we commit"""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f'LOCK TABLE {DailySales._meta.db_table} IN EXCLUSIVE MODE')
+
+
+def rebuild_daily_sales(batch_size=1000, progress=None):
+    """Recompute ``DailySales`` from all orders, ``batch_size`` orders at a time
+
+    The whole rebuild is one transaction that locks the rollup table (SQLite
+    locks the database for any write anyway). Checkouts and status changes
+    wait for it. Committing per batch would let them add deltas for orders
+    the rebuild has not reached yet, which it would then count a second time.
+    Batches bound the size of each aggregate query, not the lock time.
+    """
+    with transaction.atomic():
+        _lock_rollup_table()
+        DailySales.objects.all().delete()
+        last_id = 0
+        processed = 0
+        while True:
+            batch_ids = list(
+                Order.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not batch_ids:
+                break
+            last_id = batch_ids[-1]
+            apply_deltas(
+                (row['day'], row['product_id'], row['product__category_id'], row['order__status'],
+                 row['quantity_total'], row['revenue_total'], row['lines'])
+                for row in order_sales(Order.objects.filter(id__in=batch_ids))
+            )
+            processed += len(batch_ids)
+            if progress:
+                progress(processed, last_id)
+    return processed
+
+
+def sales_by_day(start, end, statuses=SALE_STATUSES):
+    """[{date, quantity, revenue}] for each day in [start, end]"""
+    return list(
+        DailySales.objects.filter(date__range=(start, end), status__in=statuses)
+        .values('date')
+        .annotate(quantity=Sum('quantity'), revenue=Sum('revenue'))
+        .order_by('date')
+    )
+
+
+def sales_by_category(start, end, statuses=SALE_STATUSES):
+    """[{category_id, category__name, quantity, revenue}], best-selling first"""
+    return list(
+        DailySales.objects.filter(date__range=(start, end), status__in=statuses)
+        .values('category_id', 'category__name')
+        .annotate(quantity=Sum('quantity'), revenue=Sum('revenue'))
+        .order_by('-revenue')
+    )
+
+
+def sales_by_product(start, end, statuses=SALE_STATUSES, limit=None):
+    """[{product_id, product__name, quantity, revenue}], best-selling first"""
+    rows = (
+        DailySales.objects.filter(date__range=(start, end), status__in=statuses)
+        .values('product_id', 'product__name')
+        .annotate(quantity=Sum('quantity'), revenue=Sum('revenue'))
+        .order_by('-revenue', 'product_id')
+    )
+    return list(rows[:limit] if limit else rows)
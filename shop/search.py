@@ -0,0 +1,177 @@
+import re
+
+from django.db import connection, transaction
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+SQLITE_FTS_TABLE = 'shop_product_fts'
+
+# Relative weight of each indexed column when ranking results
+NAME_WEIGHT = 10.0
+SHORT_DESCRIPTION_WEIGHT = 5.0
+DESCRIPTION_WEIGHT = 1.0
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def search_terms(query):
+    """Split a free-text query into plain search terms"""
+    return _TERM_RE.findall(query or '')
+
+
+def no_results(queryset):
+    """An empty result that still has ``search_rank``, so it can be ordered by rank"""
+    return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+class IContainsSearchBackend:
+    """Fallback backend for databases without a full-text index"""
+
+    def search(self, queryset, query):
+        condition = Q()
+        for term in search_terms(query):
+            condition &= (
+                Q(name__icontains=term) |
+                Q(description__icontains=term) |
+                Q(short_description__icontains=term)
+            )
+        return queryset.filter(condition).annotate(
+            search_rank=RawSQL('0', [], output_field=FloatField())
+        )
+
+    def index_product(self, product):
+        pass
+
+    def index_products(self, product_ids):
+        pass
+
+    def remove_product(self, product_id):
+        pass
+
+    def rebuild(self):
+        return 0
+
+
+class SQLiteFTS5SearchBackend:
+    """Search backed by an FTS5 virtual table keyed by product id"""
+
+    def match_expression(self, query):
+        # Quote every term so user input can never be parsed as FTS5 syntax,
+        # and prefix-match it so partial words still find products.
+        return ' '.join('"%s"*' % term for term in search_terms(query))
+
+    def search(self, queryset, query):
+        match = self.match_expression(query)
+        if not match:
+            return no_results(queryset)
+        # Join the FTS table directly: bm25() is only cheap when evaluated
+        # inside the MATCH scan, not as a correlated per-row subquery.
+        return queryset.extra(
+            select={
+                'search_rank': f'-bm25({SQLITE_FTS_TABLE}, %s, %s, %s)',
+            },
+            select_params=[NAME_WEIGHT, SHORT_DESCRIPTION_WEIGHT, DESCRIPTION_WEIGHT],
+            tables=[SQLITE_FTS_TABLE],
+            where=[
+                f'{SQLITE_FTS_TABLE}.rowid = shop_product.id',
+                f'{SQLITE_FTS_TABLE} MATCH %s',
+            ],
+            params=[match],
+        )
+
+    def index_product(self, product):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SQLITE_FTS_TABLE} WHERE rowid = %s', [product.pk])
+            cursor.execute(
+                f'INSERT INTO {SQLITE_FTS_TABLE} (rowid, name, short_description, description) '
+                f'VALUES (%s, %s, %s, %s)',
+                [product.pk, product.name, product.short_description, product.description],
+            )
+
+    def index_products(self, product_ids):
+        """Reindex just these products, e.g. the rows a bulk write touched"""
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(product_ids))
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SQLITE_FTS_TABLE} WHERE rowid IN ({placeholders})', product_ids)
+            cursor.execute(
+                f'INSERT INTO {SQLITE_FTS_TABLE} (rowid, name, short_description, description) '
+                f'SELECT id, name, short_description, description FROM shop_product '
+                f'WHERE id IN ({placeholders})',
+                product_ids,
+            )
+
+    def remove_product(self, product_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SQLITE_FTS_TABLE} WHERE rowid = %s', [product_id])
+
+    def rebuild(self):
+        # One transaction: searches never see the emptied table, and a failed
+        # INSERT puts the old index back
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SQLITE_FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {SQLITE_FTS_TABLE} (rowid, name, short_description, description) '
+                f'SELECT id, name, short_description, description FROM shop_product'
+            )
+            return cursor.rowcount
+
+
+class PostgresSearchBackend:
+    """Search backed by the generated ``search_vector`` column and its GIN index"""
+
+    config = 'english'
+
+    def search(self, queryset, query):
+        terms = search_terms(query)
+        if not terms:
+            return no_results(queryset)
+        # Build a prefix tsquery from sanitised terms, e.g. 'red:* & shoe:*'
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        return queryset.filter(
+            id__in=RawSQL(
+                'SELECT id FROM shop_product WHERE search_vector @@ to_tsquery(%s, %s)',
+                [self.config, tsquery],
+            )
+        ).annotate(
+            search_rank=RawSQL(
+                'ts_rank(shop_product.search_vector, to_tsquery(%s, %s))',
+                [self.config, tsquery],
+                output_field=FloatField(),
+            )
+        )
+
+    # search_vector is a GENERATED column, so Postgres keeps it in sync itself
+    def index_product(self, product):
+        pass
+
+    def index_products(self, product_ids):
+        pass
+
+    def remove_product(self, product_id):
+        pass
+
+    def rebuild(self):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('REINDEX INDEX shop_product_search_vector_gin')
+            cursor.execute('SELECT COUNT(*) FROM shop_product')
+            return cursor.fetchone()[0]
+
+
+def get_search_backend():
+    """Return the search backend for the default database connection"""
+    if connection.vendor == 'sqlite':
+        return SQLiteFTS5SearchBackend()
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    return IContainsSearchBackend()
+
+
+def search_products(queryset, query):
+    """Filter a Product queryset by a search query and annotate ``search_rank``
+
+    Higher ``search_rank`` means a more relevant match on every backend.
+    """
+    return get_search_backend().search(queryset, query)
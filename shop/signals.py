@@ -0,0 +1,35 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cart import recalculate_cart_totals
+from .fragments import invalidate_catalogue_fragments
+from .models import Cart, Category, Product
+from .search import get_search_backend
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    """Keep the search index in sync when a product is saved"""
+    get_search_backend().index_product(instance)
+
+
+@receiver(post_save, sender=Product)
+def reprice_carts(sender, instance, created, **kwargs):
+    """Refresh stored subtotals of carts holding a product whose price may have changed"""
+    if not created:
+        recalculate_cart_totals(Cart.objects.filter(items__product=instance))
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    """Drop a deleted product from the search index"""
+    get_search_backend().remove_product(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def refresh_catalogue_fragments(sender, **kwargs):
+    """Move the home page and nav fragments to a new catalogue version"""
+    invalidate_catalogue_fragments()
@@ -0,0 +1,325 @@
+"""
+In-process, read-only snapshot of the storefront catalogue.
+
+Catalogue pages read the same few thousand rows on every request, but those
+rows change only a few times a day. With ``SHOP_CATALOGUE_SNAPSHOT`` on, each
+worker keeps its active products and all categories in memory as compact
+``__slots__`` records. It also keeps them in every listing order (name,
+price and newest, overall and per category), so home, listing and product
+pages render without SQL.
+
+The snapshot is tagged with the catalogue version (see ``shop.fragments``),
+which catalogue writes bump on commit. The version lives in the cache all
+workers share, so a write handled by any worker retires every worker's
+snapshot on its next request. When a request sees a different version, or the snapshot is older than ``SHOP_CATALOGUE_SNAPSHOT_MAX_AGE``,
+one thread builds a new snapshot. It is swapped in with a single
+assignment; requests already holding the old one keep a consistent view.
+The max age bounds staleness for stock levels, which checkout changes
+without bumping the version. Search stays on the database, whose backends
+rank results.
+"""
+import threading
+import time
+import tracemalloc
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from itertools import islice
+from operator import attrgetter
+
+from django.conf import settings
+from django.db.models import Max
+from django.urls import reverse
+
+from .categories import NAV_CATEGORY_LIMIT
+from .fragments import catalogue_version
+from .models import Category, Product
+from .pagination import KeysetPage, KeysetPaginator
+
+# Stored orders, all ascending with the id tiebreak of SORT_ORDERINGS
+ORDER_KEYS = {
+    'name': attrgetter('name', 'id'),
+    'price': attrgetter('price', 'id'),
+    'newest': attrgetter('created_at', 'id'),
+}
+# Listing sort -> (stored order, walked in reverse)
+SORTS = {
+    'name': ('name', False),
+    'price_low': ('price', False),
+    'price_high': ('price', True),
+    'newest': ('newest', True),
+}
+PRODUCT_FIELDS = (
+    'id', 'name', 'slug', 'description', 'short_description', 'price', 'stock', 'image',
+    'is_featured', 'category_id', 'created_at', 'updated_at',
+)
+CATEGORY_FIELDS = ('id', 'name', 'slug', 'description', 'is_active')
+
+
+def snapshot_enabled():
+    return getattr(settings, 'SHOP_CATALOGUE_SNAPSHOT', False)
+
+
+def snapshot_max_age():
+    return getattr(settings, 'SHOP_CATALOGUE_SNAPSHOT_MAX_AGE', 60 * 5)
+
+
+class ImageRef:
+    """The two parts of an ``ImageFieldFile`` templates use"""
+
+    __slots__ = ('name', 'url')
+
+    def __init__(self, name, url):
+        self.name = name
+        self.url = url
+
+
+class CategoryRecord:
+    __slots__ = ('id', 'name', 'slug', 'description', 'is_active', 'active_product_count')
+
+    def __init__(self, id, name, slug, description, is_active):
+        self.id = id
+        self.name = name
+        self.slug = slug
+        self.description = description
+        self.is_active = is_active
+        self.active_product_count = 0
+
+    @property
+    def pk(self):
+        return self.id
+
+    def __str__(self):
+        return self.name
+
+    def get_absolute_url(self):
+        return reverse('shop:product_list_by_category', kwargs={'category_slug': self.slug})
+
+
+class ProductRecord:
+    """An active product as the storefront templates see it"""
+
+    __slots__ = (
+        'id', 'name', 'slug', 'description', 'short_description', 'price', 'stock', 'image',
+        'is_featured', 'category', 'created_at', 'updated_at',
+    )
+
+    def __init__(self, id, name, slug, description, short_description, price, stock, image,
+                 is_featured, category, created_at, updated_at):
+        self.id = id
+        self.name = name
+        self.slug = slug
+        self.description = description
+        self.short_description = short_description
+        self.price = price
+        self.stock = stock
+        self.image = image
+        self.is_featured = is_featured
+        self.category = category
+        self.created_at = created_at
+        self.updated_at = updated_at
+
+    @property
+    def pk(self):
+        return self.id
+
+    @property
+    def in_stock(self):
+        return self.stock > 0
+
+    def __str__(self):
+        return self.name
+
+    def get_absolute_url(self):
+        return reverse('shop:product_detail', kwargs={'slug': self.slug})
+
+
+class SnapshotPaginator(KeysetPaginator):
+    """``KeysetPaginator`` over an in-memory ordered tuple
+
+    Cursors are encoded and decoded by the parent, so links work whichever
+    side served the previous page. ``rows`` is ascending by ``key``.
+    ``reverse`` walks it from the end for descending sorts.
+    """
+
+    def __init__(self, rows, per_page, sort, key, reverse=False):
+        super().__init__(Product.objects.none(), per_page, sort)
+        self.rows = rows
+        self.key = key
+        self.reverse = reverse
+        self.known_count = len(rows)
+
+    def _row(self, index):
+        return self.rows[len(self.rows) - 1 - index if self.reverse else index]
+
+    def _bounds(self, values):
+        """(end of the rows before ``values``, start of the rows after it), in walk order"""
+        key = tuple(values)
+        low = bisect_left(self.rows, key, key=self.key)
+        high = bisect_right(self.rows, key, key=self.key)
+        if self.reverse:
+            return len(self.rows) - high, len(self.rows) - low
+        return low, high
+
+    def get_page(self, token=None):
+        direction, values = self._decode_or_first(token)
+        if direction == 'prev':
+            end = self._bounds(values)[0]
+            start = max(end - self.per_page, 0)
+            has_previous, has_next = start > 0, True
+        else:
+            start = 0 if values is None else self._bounds(values)[1]
+            end = min(start + self.per_page, len(self.rows))
+            has_previous, has_next = values is not None, end < len(self.rows)
+        rows = [self._row(index) for index in range(start, end)]
+
+        next_token = self.encode_cursor(rows[-1], 'next') if rows and has_next else None
+        previous_token = self.encode_cursor(rows[0], 'prev') if rows and has_previous else None
+        return KeysetPage(rows, self, next_token=next_token, previous_token=previous_token)
+
+
+class CatalogueSnapshot:
+    """Active products and all categories, indexed for the storefront pages
+
+    Everything is built once in ``load`` and never mutated afterwards, so
+    any number of threads can read it without locking.
+    """
+
+    def __init__(self, version, categories, products, last_modified):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.last_modified = last_modified
+        self.categories_by_slug = {category.slug: category for category in categories}
+        self.active_categories = tuple(category for category in categories if category.is_active)
+        self.products_by_slug = {product.slug: product for product in products}
+        self.orders = {name: tuple(sorted(products, key=key)) for name, key in ORDER_KEYS.items()}
+        self.featured = tuple(product for product in reversed(self.orders['newest']) if product.is_featured)
+
+        by_category = defaultdict(lambda: {name: [] for name in ORDER_KEYS})
+        for name, rows in self.orders.items():
+            for product in rows:
+                by_category[product.category.id][name].append(product)
+        self.category_orders = {
+            category_id: {name: tuple(rows) for name, rows in orders.items()}
+            for category_id, orders in by_category.items()
+        }
+        for category in categories:
+            category.active_product_count = len(self.category_orders.get(category.id, {}).get('name', ()))
+
+    @classmethod
+    def load(cls, version):
+        categories = [
+            CategoryRecord(*row)
+            for row in Category.objects.order_by('id').values_list(*CATEGORY_FIELDS)
+        ]
+        categories_by_id = {category.id: category for category in categories}
+        storage = Product._meta.get_field('image').storage
+        products = []
+        rows = Product.objects.filter(is_active=True).values_list(*PRODUCT_FIELDS).iterator(chunk_size=2000)
+        for row in rows:
+            fields = dict(zip(PRODUCT_FIELDS, row))
+            image = fields['image']
+            fields['image'] = ImageRef(image, storage.url(image)) if image else None
+            fields['category'] = categories_by_id[fields.pop('category_id')]
+            products.append(ProductRecord(**fields))
+        # Inactive rows count: a deactivation must move listings' ETag
+        last_modified = Product.objects.aggregate(last_modified=Max('updated_at'))['last_modified']
+        return cls(version, categories, products, last_modified)
+
+    def expired(self):
+        return time.monotonic() - self.built_at > snapshot_max_age()
+
+    def product(self, slug):
+        return self.products_by_slug.get(slug)
+
+    def category(self, slug):
+        return self.categories_by_slug.get(slug)
+
+    def ordered(self, order, category=None):
+        if category is None:
+            return self.orders[order]
+        return self.category_orders.get(category.id, {}).get(order, ())
+
+    def related_products(self, product, limit):
+        newest = reversed(self.ordered('newest', product.category))
+        return list(islice((other for other in newest if other.id != product.id), limit))
+
+    @property
+    def nav_categories(self):
+        return self.active_categories[:NAV_CATEGORY_LIMIT]
+
+    def listing_page(self, sort, per_page, token=None, category_slug=None, min_price=None, max_price=None):
+        """The ``KeysetPage`` ``product_list`` would show for these filters"""
+        order, reverse = SORTS[sort]
+        if category_slug:
+            # Like the ORM filter, an unknown slug matches nothing
+            category = self.category(category_slug)
+            rows = self.ordered(order, category) if category else ()
+        else:
+            rows = self.orders[order]
+        if min_price is not None or max_price is not None:
+            if order == 'price':
+                # Already in price order: the range is one slice
+                price = attrgetter('price')
+                start = bisect_left(rows, min_price, key=price) if min_price is not None else 0
+                end = bisect_right(rows, max_price, key=price) if max_price is not None else len(rows)
+                rows = rows[start:end]
+            else:
+                rows = tuple(
+                    product for product in rows
+                    if (min_price is None or product.price >= min_price)
+                    and (max_price is None or product.price <= max_price)
+                )
+        return SnapshotPaginator(rows, per_page, sort, ORDER_KEYS[order], reverse).get_page(token)
+
+
+_current = None
+_rebuild_lock = threading.Lock()
+
+
+def catalogue_snapshot():
+    """This worker's snapshot for the current catalogue version, or None when disabled
+
+    The version is read from the shared cache on every call (one cache hit,
+    no SQL), so writes made by other workers are seen straight away. A
+    single thread rebuilds an outdated snapshot; the others keep serving
+    the previous one until it is swapped in.
+    """
+    global _current
+    if not snapshot_enabled():
+        return None
+    version = catalogue_version()
+    snapshot = _current
+    if snapshot is not None and snapshot.version == version and not snapshot.expired():
+        return snapshot
+    if not _rebuild_lock.acquire(blocking=snapshot is None):
+        return snapshot
+    try:
+        snapshot = _current
+        if snapshot is None or snapshot.version != version or snapshot.expired():
+            snapshot = CatalogueSnapshot.load(version)
+            _current = snapshot
+        return snapshot
+    finally:
+        _rebuild_lock.release()
+
+
+def clear_catalogue_snapshot():
+    global _current
+    _current = None
+
+
+def measure_memory(build):
+    """Run ``build()`` under tracemalloc: (result, retained bytes, peak bytes, seconds)
+
+    Retained bytes are what ``build()``'s result still holds once it returns,
+    i.e. what one worker pays to keep it.
+    """
+    tracemalloc.start()
+    try:
+        started = time.perf_counter()
+        result = build()
+        seconds = time.perf_counter() - started
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, retained, peak, seconds
@@ -0,0 +1,370 @@
+"""
+Reproducible synthetic datasets for load tests and benchmarks.
+
+Everything is drawn from one ``random.Random(seed)`` and written with
+``bulk_create`` in batches, so the same arguments always produce the same
+catalogue, customers, carts and orders, and millions of rows can be
+generated without holding them all in memory. Product popularity follows a
+Zipf distribution (a few best sellers, a long tail), orders have several
+lines, and statuses and dates are spread the way a live shop's are.
+
+Generated rows are recognisable by ``SYNTHETIC_PREFIX`` in their slugs and
+usernames and by ``SYNTHETIC_EMAIL_DOMAIN``, so they can be removed again
+without touching real data.
+"""
+import bisect
+import itertools
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, time as datetime_time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.admin.models import LogEntry
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .dashboard import rebuild_counters
+from .fragments import invalidate_catalogue_fragments
+from .models import Cart, CartItem, Category, DailySales, Order, OrderItem, Product
+from .rollups import rebuild_daily_sales
+from .search import get_search_backend
+
+SYNTHETIC_PREFIX = 'synthetic-'
+SYNTHETIC_EMAIL_DOMAIN = 'synthetic.example.com'
+SYNTHETIC_PASSWORD = 'synthetic'
+
+ADJECTIVES = [
+    'wireless', 'organic', 'classic', 'premium', 'portable', 'lightweight',
+    'durable', 'smart', 'vintage', 'compact', 'ergonomic', 'waterproof',
+]
+NOUNS = [
+    'headphones', 'shirt', 'jeans', 'coffee maker', 'garden hose', 'yoga mat',
+    'running shoes', 'cookbook', 'watch', 'jacket', 'backpack', 'water bottle',
+    'desk lamp', 'kitchen knife', 'ceramic mug', 'camera', 'wallet', 'novel',
+]
+CITIES = ['New York', 'Los Angeles', 'Chicago', 'Houston', 'Phoenix', 'Seattle', 'Denver', 'Boston']
+FIRST_NAMES = ['Alex', 'Sam', 'Jordan', 'Taylor', 'Morgan', 'Casey', 'Riley', 'Jamie', 'Avery', 'Quinn']
+LAST_NAMES = ['Smith', 'Garcia', 'Chen', 'Patel', 'Kim', 'Novak', 'Okafor', 'Silva', 'Muller', 'Rossi']
+
+# Relative frequency of order statuses; the newest orders are mostly still open
+STATUS_WEIGHTS = {'delivered': 60, 'shipped': 12, 'processing': 8, 'pending': 8, 'cancelled': 12}
+OPEN_STATUS_WEIGHTS = {'pending': 50, 'processing': 30, 'shipped': 10, 'cancelled': 10}
+OPEN_ORDER_DAYS = 3
+# Lines per order: weights for 1, 2, 3, ... lines
+ORDER_LINE_WEIGHTS = [50, 25, 12, 6, 4, 3]
+QUANTITY_WEIGHTS = [80, 14, 4, 2]
+GUEST_ORDER_RATIO = 0.1
+
+
+class ZipfSampler:
+    """Draw items with probability proportional to ``1 / rank ** exponent``
+
+    The ranking is a seeded shuffle of ``items``, so popularity does not
+    simply follow insertion order.
+    """
+
+    def __init__(self, items, rng, exponent=1.1):
+        self.items = list(items)
+        rng.shuffle(self.items)
+        self.cum_weights = list(itertools.accumulate(
+            1 / rank ** exponent for rank in range(1, len(self.items) + 1)
+        ))
+        self.total = self.cum_weights[-1] if self.cum_weights else 0
+
+    def sample(self, rng):
+        return self.items[bisect.bisect(self.cum_weights, rng.random() * self.total)]
+
+    def sample_distinct(self, rng, count):
+        """Up to ``count`` distinct items (fewer if the catalogue is tiny)"""
+        count = min(count, len(self.items))
+        chosen = []
+        for _ in range(count * 10):
+            item = self.sample(rng)
+            if item not in chosen:
+                chosen.append(item)
+                if len(chosen) == count:
+                    break
+        return chosen
+
+
+def weighted_choice(rng, weights):
+    """A key of ``weights`` (dict) or an index of ``weights`` (list)"""
+    if isinstance(weights, dict):
+        return rng.choices(list(weights), weights=list(weights.values()))[0]
+    return rng.choices(range(len(weights)), weights=weights)[0]
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let ``bulk_create`` keep the ``created_at``/``updated_at`` values we set
+
+    ``auto_now``/``auto_now_add`` would otherwise stamp every row with the
+    current time, collapsing a year of orders into one day.
+    """
+    saved = []
+    for model in models:
+        for field in model._meta.concrete_fields:
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                saved.append((field, field.auto_now, field.auto_now_add))
+                field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def bulk_insert(model, objs, batch_size):
+    """``bulk_create`` that also fills in pks on backends that cannot return them"""
+    created = model.objects.bulk_create(objs, batch_size=batch_size)
+    if objs and objs[0].pk is None:
+        # Generation is single-writer, so the newest rows are the ones just inserted
+        ids = sorted(model.objects.order_by('-pk').values_list('pk', flat=True)[:len(objs)])
+        for obj, pk in zip(objs, ids):
+            obj.pk = pk
+    return created
+
+
+def synthetic_data_exists():
+    return (
+        Product.objects.filter(slug__startswith=SYNTHETIC_PREFIX).exists()
+        or User.objects.filter(username__startswith=SYNTHETIC_PREFIX).exists()
+    )
+
+
+def delete_synthetic_data():
+    """Remove everything a previous generation created
+
+    ``QuerySet.delete()`` would load every row to send the per-product
+    ``post_delete`` signals, which does not scale to millions of rows.
+    Instead each table gets one plain DELETE, children before parents
+    (covering what the cascades would have removed), and the search index
+    and catalogue version the signals maintain are refreshed once at the end.
+    Counters and rollups are rebuilt by the generation that follows.
+    """
+    users = User.objects.filter(username__startswith=SYNTHETIC_PREFIX)
+    categories = Category.objects.filter(slug__startswith=SYNTHETIC_PREFIX)
+    products = Product.objects.filter(Q(slug__startswith=SYNTHETIC_PREFIX) | Q(category__in=categories))
+    orders = Order.objects.filter(Q(email__endswith='@' + SYNTHETIC_EMAIL_DOMAIN) | Q(user__in=users))
+    carts = Cart.objects.filter(Q(session_key__startswith=SYNTHETIC_PREFIX) | Q(user__in=users))
+    with transaction.atomic():
+        for queryset in [
+            OrderItem.objects.filter(Q(order__in=orders) | Q(product__in=products)),
+            orders,
+            CartItem.objects.filter(Q(cart__in=carts) | Q(product__in=products)),
+            carts,
+            DailySales.objects.filter(Q(product__in=products) | Q(category__in=categories)),
+            LogEntry.objects.filter(user__in=users),
+            User.groups.through.objects.filter(user__in=users),
+            User.user_permissions.through.objects.filter(user__in=users),
+            users,
+            products,
+            categories,
+        ]:
+            queryset._raw_delete(queryset.db)
+        get_search_backend().rebuild()
+        invalidate_catalogue_fragments()
+
+
+class DatasetStats:
+    def __init__(self):
+        self.counts = dict.fromkeys(['categories', 'products', 'users', 'carts', 'orders', 'order_items'], 0)
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rows(self):
+        return sum(self.counts.values())
+
+
+class DatasetGenerator:
+    """Bulk insert a seeded synthetic shop of the requested size"""
+
+    def __init__(self, categories=20, products=10000, users=1000, carts=500, orders=10000,
+                 seed=42, days=365, end_date=None, batch_size=5000, zipf_exponent=1.1):
+        self.sizes = {
+            'categories': categories, 'products': products, 'users': users,
+            'carts': carts, 'orders': orders,
+        }
+        self.seed = seed
+        self.days = days
+        self.end_date = end_date or timezone.localdate()
+        self.batch_size = batch_size
+        self.zipf_exponent = zipf_exponent
+        self.rng = random.Random(seed)
+        self.stats = DatasetStats()
+
+    def run(self, progress=None):
+        self.progress = progress
+        category_ids = self.create_categories()
+        products = self.create_products(category_ids)
+        user_ids = self.create_users()
+        popularity = ZipfSampler(products, self.rng, self.zipf_exponent)
+        self.create_carts(user_ids, popularity)
+        self.create_orders(user_ids, popularity)
+        # bulk_create skips signals, so rebuild what they would have maintained
+        get_search_backend().rebuild()
+        rebuild_counters()
+        rebuild_daily_sales()
+        invalidate_catalogue_fragments()
+        return self.stats
+
+    def _report(self, name, count):
+        self.stats.counts[name] += count
+        if self.progress:
+            self.progress(name, self.stats)
+
+    def _batches(self, total):
+        for start in range(0, total, self.batch_size):
+            yield start, min(start + self.batch_size, total)
+
+    def _timestamp(self, day_offset):
+        """An aware datetime ``day_offset`` days before ``end_date`` at a random time of day"""
+        day = self.end_date - timedelta(days=day_offset)
+        moment = datetime.combine(day, datetime_time()) + timedelta(seconds=self.rng.randrange(86400))
+        return timezone.make_aware(moment) if settings.USE_TZ else moment
+
+    def create_categories(self):
+        now = timezone.now()
+        categories = [
+            Category(
+                name=f'Synthetic Category {i}', slug=f'{SYNTHETIC_PREFIX}category-{i}',
+                description=f'Generated category {i}', created_at=now,
+            )
+            for i in range(self.sizes['categories'])
+        ]
+        with explicit_timestamps(Category):
+            bulk_insert(Category, categories, self.batch_size)
+        self._report('categories', len(categories))
+        return [category.pk for category in categories]
+
+    def create_products(self, category_ids):
+        """Insert products and return ``(id, price)`` pairs for order generation"""
+        rng = self.rng
+        products = []
+        for start, end in self._batches(self.sizes['products']):
+            batch = []
+            for i in range(start, end):
+                name = f'{rng.choice(ADJECTIVES).title()} {rng.choice(NOUNS).title()} {i}'
+                # Log-normal prices: mostly under $100 with a tail of expensive items
+                price = Decimal(min(round(rng.lognormvariate(3.5, 1.0), 2), 99999)).quantize(Decimal('0.01'))
+                created = self._timestamp(rng.randrange(self.days + 365))
+                batch.append(Product(
+                    name=name,
+                    slug=f'{SYNTHETIC_PREFIX}product-{i}',
+                    description=f'{name}. ' + ' '.join(rng.choices(ADJECTIVES + NOUNS, k=20)),
+                    short_description=name,
+                    price=max(price, Decimal('0.99')),
+                    category_id=rng.choice(category_ids),
+                    stock=0 if rng.random() < 0.05 else rng.randint(1, 500),
+                    is_featured=rng.random() < 0.02,
+                    is_active=rng.random() < 0.95,
+                    created_at=created,
+                    updated_at=created,
+                ))
+            with explicit_timestamps(Product):
+                bulk_insert(Product, batch, self.batch_size)
+            products.extend((product.pk, product.price) for product in batch)
+            self._report('products', len(batch))
+        return products
+
+    def create_users(self):
+        # Hashing once keeps millions of users cheap; every user shares the password
+        password = make_password(SYNTHETIC_PASSWORD)
+        user_ids = []
+        for start, end in self._batches(self.sizes['users']):
+            batch = [
+                User(
+                    username=f'{SYNTHETIC_PREFIX}user-{i}',
+                    email=f'user{i}@{SYNTHETIC_EMAIL_DOMAIN}',
+                    first_name=self.rng.choice(FIRST_NAMES),
+                    last_name=self.rng.choice(LAST_NAMES),
+                    password=password,
+                )
+                for i in range(start, end)
+            ]
+            bulk_insert(User, batch, self.batch_size)
+            user_ids.extend(user.pk for user in batch)
+            self._report('users', len(batch))
+        return user_ids
+
+    def create_carts(self, user_ids, popularity):
+        """Open carts: half belong to users, the rest to anonymous sessions"""
+        rng = self.rng
+        cart_users = iter(rng.sample(user_ids, min(len(user_ids), self.sizes['carts'] // 2)))
+        for start, end in self._batches(self.sizes['carts']):
+            carts, lines = [], []
+            for i in range(start, end):
+                user_id = next(cart_users, None)
+                items = [
+                    (product, weighted_choice(rng, QUANTITY_WEIGHTS) + 1)
+                    for product in popularity.sample_distinct(rng, rng.randint(1, 4))
+                ]
+                updated = self._timestamp(rng.randrange(min(self.days, 30)))
+                carts.append(Cart(
+                    user_id=user_id,
+                    session_key=None if user_id else f'{SYNTHETIC_PREFIX}{self.seed}-{i}',
+                    item_count=sum(quantity for _, quantity in items),
+                    subtotal=sum((price * quantity for (_, price), quantity in items), Decimal('0.00')),
+                    created_at=updated,
+                    updated_at=updated,
+                ))
+                lines.append(items)
+            with transaction.atomic(), explicit_timestamps(Cart, CartItem):
+                bulk_insert(Cart, carts, self.batch_size)
+                CartItem.objects.bulk_create([
+                    CartItem(cart_id=cart.pk, product_id=product_id, quantity=quantity, created_at=cart.created_at)
+                    for cart, items in zip(carts, lines)
+                    for (product_id, _), quantity in items
+                ], batch_size=self.batch_size)
+            self._report('carts', len(carts))
+
+    def create_orders(self, user_ids, popularity):
+        """Orders spread evenly over ``days``, ids ascending with ``created_at``"""
+        rng = self.rng
+        total = self.sizes['orders']
+        for start, end in self._batches(total):
+            orders, lines = [], []
+            for i in range(start, end):
+                day_offset = self.days - 1 - (i * self.days // total) if total else 0
+                weights = OPEN_STATUS_WEIGHTS if day_offset < OPEN_ORDER_DAYS else STATUS_WEIGHTS
+                items = [
+                    (product, weighted_choice(rng, QUANTITY_WEIGHTS) + 1)
+                    for product in popularity.sample_distinct(rng, weighted_choice(rng, ORDER_LINE_WEIGHTS) + 1)
+                ]
+                guest = not user_ids or rng.random() < GUEST_ORDER_RATIO
+                created = self._timestamp(day_offset)
+                orders.append(Order(
+                    user_id=None if guest else rng.choice(user_ids),
+                    first_name=rng.choice(FIRST_NAMES),
+                    last_name=rng.choice(LAST_NAMES),
+                    email=f'customer{i}@{SYNTHETIC_EMAIL_DOMAIN}',
+                    address=f'{rng.randint(1, 9999)} Main Street',
+                    postal_code=f'{rng.randint(10000, 99999)}',
+                    city=rng.choice(CITIES),
+                    status=weighted_choice(rng, weights),
+                    item_count=len(items),
+                    subtotal=sum((price * quantity for (_, price), quantity in items), Decimal('0.00')),
+                    created_at=created,
+                    updated_at=created,
+                ))
+                lines.append(items)
+            with transaction.atomic(), explicit_timestamps(Order):
+                bulk_insert(Order, orders, self.batch_size)
+                items = [
+                    OrderItem(order_id=order.pk, product_id=product_id, price=price, quantity=quantity)
+                    for order, order_lines in zip(orders, lines)
+                    for (product_id, price), quantity in order_lines
+                ]
+                OrderItem.objects.bulk_create(items, batch_size=self.batch_size)
+            self._report('orders', len(orders))
+            self._report('order_items', len(items))
+
@@ -1,5 +1,48 @@
-from django.test import TestCase
-from .models import Product
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, OperationalError, connection
+from django.db.models import Count, Sum
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from . import checkout, fragments, rollups
+from .admin import OrderAdmin
+from .anonymous_cart import AnonymousCart, SignedCookieCartStorage
+from .benchmarks import is_write
+from .cart import add_item, clear_cart, remove_item, set_item_quantity
+from .checkout import EmptyCart, InsufficientStock, issue_checkout_token, place_order, recalculate_order_totals
+from .dashboard import (
+    STATS_CACHE_KEY, STATS_LOCK_KEY, compute_dashboard_stats, counter_values, get_dashboard_stats,
+    rebuild_counters, recent_revenue,
+)
+from .exports import PRODUCT_COLUMNS, export_stream
+from .fragments import bump_catalogue_version, catalogue_version
+from .models import Cart, CartItem, Category, DailySales, Order, OrderItem, Product, StatCounter
+from .pagination import EstimatedCountPaginator, KeysetPaginator, SORT_ORDERINGS, estimated_row_count
+from .query_cache import cached_keyset_page, canonical_listing_params, query_cache_stats
+from .rollups import change_order_status, sales_by_day, sales_by_product
+from .search import get_search_backend, search_products
+from .snapshot import catalogue_snapshot, clear_catalogue_snapshot
+from .synthetic import SYNTHETIC_PREFIX, DatasetGenerator, delete_synthetic_data, synthetic_data_exists
+from .views import PRODUCTS_PER_PAGE
+
 
 class ProductModelTest(TestCase):
 
@@ -18,4 +61,1579 @@ class ProductModelTest(TestCase):
         self.assertEqual(self.product.stock, 100)
 
     def test_product_str(self):
-        self.assertEqual(str(self.product), "Test Product")
\ No newline at end of file
+        self.assertEqual(str(self.product), "Test Product")
+
+class ProductSearchTest(TestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(name="Audio", slug="audio")
+        self.headphones = Product.objects.create(
+            name="Wireless Headphones",
+            slug="wireless-headphones",
+            description="Noise cancelling over-ear headphones.",
+            price=199.99,
+            category=self.category,
+        )
+        self.speaker = Product.objects.create(
+            name="Bluetooth Speaker",
+            slug="bluetooth-speaker",
+            description="Pairs with wireless headphones and phones.",
+            price=59.99,
+            category=self.category,
+        )
+
+    def test_search_ranks_name_matches_first(self):
+        results = list(search_products(Product.objects.all(), "headphones").order_by('-search_rank'))
+        self.assertEqual(results, [self.headphones, self.speaker])
+
+    def test_search_matches_word_prefixes(self):
+        results = search_products(Product.objects.all(), "speak")
+        self.assertEqual(list(results), [self.speaker])
+
+    def test_index_follows_save_and_delete(self):
+        self.speaker.name = "Bluetooth Soundbar"
+        self.speaker.save()
+        self.assertFalse(search_products(Product.objects.all(), "speaker").exists())
+        self.assertTrue(search_products(Product.objects.all(), "soundbar").exists())
+
+        self.headphones.delete()
+        self.assertEqual(list(search_products(Product.objects.all(), "headphones")), [self.speaker])
+
+    def test_failed_rebuild_keeps_the_old_index(self):
+        open_cursor = connection.cursor
+
+        def cursor_failing_inserts():
+            cursor = open_cursor()
+            execute = cursor.execute
+
+            def fail_on_insert(sql, params=None):
+                if sql.startswith('INSERT'):
+                    raise DatabaseError('disk I/O error')
+                return execute(sql, params)
+            cursor.execute = fail_on_insert
+            return cursor
+
+        with mock.patch.object(connection, 'cursor', cursor_failing_inserts):
+            with self.assertRaises(DatabaseError):
+                get_search_backend().rebuild()
+        self.assertEqual(search_products(Product.objects.all(), "headphones").count(), 2)
+        self.assertEqual(get_search_backend().rebuild(), 2)
+
+    def test_search_syntax_is_escaped(self):
+        results = search_products(Product.objects.all(), 'headphones" -(:')
+        self.assertEqual(results.count(), 2)
+        self.assertFalse(search_products(Product.objects.all(), '"*').exists())
+
+    def test_product_list_search_view(self):
+        response = self.client.get(reverse('shop:product_list'), {'q': 'headphones'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['products']), [self.headphones, self.speaker])
+
+        response = self.client.get(
+            reverse('shop:product_list_by_category', args=['audio']), {'q': 'speaker'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['products']), [self.speaker])
+
+    def test_category_page_lists_categories_in_filter(self):
+        cache.clear()
+        Category.objects.create(name="Video", slug="video")
+        response = self.client.get(reverse('shop:product_list_by_category', args=['audio']))
+        self.assertCountEqual([c.slug for c in response.context['categories']], ['audio', 'video'])
+        self.assertContains(response, '<option value="video"')
+
+        with override_settings(SHOP_CATALOGUE_SNAPSHOT=True):
+            clear_catalogue_snapshot()
+            response = self.client.get(reverse('shop:product_list_by_category', args=['audio']), {'sort': 'name'})
+            clear_catalogue_snapshot()
+        self.assertContains(response, '<option value="video"')
+
+    def test_query_without_terms_finds_nothing_on_relevance_sort(self):
+        cache.clear()
+        response = self.client.get(reverse('shop:product_list'), {'q': '!!!'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['products']), [])
+
+        response = self.client.get(
+            reverse('shop:product_list_by_category', args=['audio']), {'q': '%%'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['products']), [])
+
+
+class KeysetPaginationTest(TestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(name="Books", slug="books")
+        # Repeated prices and names exercise the id tiebreak
+        for i in range(30):
+            Product.objects.create(
+                name=f"Book {i % 7}",
+                slug=f"book-{i}",
+                description="A book.",
+                price=10 + (i % 4),
+                category=self.category,
+            )
+
+    def walk(self, sort):
+        paginator = KeysetPaginator(Product.objects.all(), 8, sort)
+        pages = [paginator.get_page()]
+        while pages[-1].has_next():
+            pages.append(paginator.get_page(pages[-1].next_token))
+        return paginator, pages
+
+    def test_forward_walk_matches_full_ordering(self):
+        for sort, ordering in SORT_ORDERINGS.items():
+            _, pages = self.walk(sort)
+            walked = [product.id for page in pages for product in page]
+            expected = list(Product.objects.order_by(*ordering).values_list('id', flat=True))
+            self.assertEqual(walked, expected, sort)
+            self.assertFalse(pages[0].has_previous())
+
+    def test_previous_token_returns_previous_page(self):
+        paginator, pages = self.walk('price_high')
+        for previous, current in zip(pages, pages[1:]):
+            back = paginator.get_page(current.previous_token)
+            self.assertEqual(list(back), list(previous))
+
+    def test_invalid_or_foreign_cursor_gives_first_page(self):
+        paginator, pages = self.walk('name')
+        first = [p.id for p in pages[0]]
+        self.assertEqual([p.id for p in paginator.get_page('garbage')], first)
+        other_sort = KeysetPaginator(Product.objects.all(), 8, 'price_low').get_page().next_token
+        self.assertEqual([p.id for p in paginator.get_page(other_sort)], first)
+
+    def test_empty_queryset_counts_zero(self):
+        paginator = KeysetPaginator(Product.objects.none(), 8, 'name')
+        self.assertEqual(paginator.count, 0)
+        self.assertEqual(list(paginator.get_page()), [])
+
+    def test_product_list_uses_cursor_without_offset(self):
+        response = self.client.get(reverse('shop:product_list'), {'sort': 'price_low'})
+        next_token = response.context['products'].next_token
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('shop:product_list'), {'sort': 'price_low', 'cursor': next_token}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['products']), min(PRODUCTS_PER_PAGE, 30 - PRODUCTS_PER_PAGE))
+        self.assertFalse(any('OFFSET' in q['sql'] for q in queries.captured_queries))
+
+
+class QueryPlanTest(TestCase):
+
+    def test_hot_queries_do_not_full_scan(self):
+        call_command('explain_queries', '--strict', stdout=StringIO())
+
+
+class RequestCartTest(TestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(name="Kitchen", slug="kitchen")
+        self.mug = Product.objects.create(
+            name="Mug", slug="mug", description="A mug.", price=Decimal('8.50'),
+            category=self.category, stock=20,
+        )
+        self.kettle = Product.objects.create(
+            name="Kettle", slug="kettle", description="A kettle.", price=Decimal('30.00'),
+            category=self.category, stock=20,
+        )
+
+    def add(self, product, quantity):
+        return self.client.post(
+            reverse('shop:add_to_cart'),
+            data=json.dumps({'product_id': product.id, 'quantity': quantity}),
+            content_type='application/json',
+        )
+
+    def cart_queries(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return [q['sql'] for q in queries.captured_queries if 'shop_cart' in q['sql']]
+
+    def test_add_to_cart_returns_sql_totals(self):
+        self.add(self.mug, 2)
+        data = self.add(self.kettle, 1).json()
+        self.assertTrue(data['success'])
+        self.assertEqual(data['cart_items_count'], 3)
+        self.assertEqual(Decimal(data['cart_total']), Decimal('47.00'))
+
+    def test_catalogue_page_resolves_cart_with_one_query(self):
+        self.add(self.mug, 2)
+        queries = self.cart_queries(reverse('shop:product_list'))
+        self.assertEqual(len(queries), 1)
+
+    def test_authenticated_catalogue_page_resolves_cart_with_one_query(self):
+        user = User.objects.create_user('shopper', password='secret-pass-123')
+        self.client.force_login(user)
+        self.add(self.kettle, 1)
+        queries = self.cart_queries(reverse('shop:home'))
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(self.client.get(reverse('shop:home')).context['cart_items_count'], 1)
+
+
+class CartTotalsTest(TestCase):
+
+    def setUp(self):
+        category = Category.objects.create(name="Garden", slug="garden")
+        self.spade = Product.objects.create(
+            name="Spade", slug="spade", description="A spade.", price=Decimal('12.25'),
+            category=category, stock=50,
+        )
+        self.hose = Product.objects.create(
+            name="Hose", slug="hose", description="A hose.", price=Decimal('20.00'),
+            category=category, stock=50,
+        )
+        self.cart = Cart.objects.create(session_key='test')
+
+    def test_totals_follow_every_item_change(self):
+        add_item(self.cart, self.spade, 2)
+        add_item(self.cart, self.hose, 1)
+        item = self.cart.items.get(product=self.hose)
+        self.assertEqual(self.cart.totals, (3, Decimal('44.50')))
+
+        set_item_quantity(self.cart, item, 3)
+        self.assertEqual(self.cart.totals, (5, Decimal('84.50')))
+
+        remove_item(self.cart, item)
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.totals, (2, Decimal('24.50')))
+
+        clear_cart(self.cart)
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.totals, (0, Decimal('0.00')))
+
+    def test_price_change_reprices_carts(self):
+        add_item(self.cart, self.spade, 2)
+        self.spade.price = Decimal('10.00')
+        self.spade.save()
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.subtotal, Decimal('20.00'))
+
+    def test_reconcile_repairs_drift(self):
+        add_item(self.cart, self.spade, 2)
+        Cart.objects.filter(pk=self.cart.pk).update(item_count=9, subtotal=Decimal('1.00'))
+
+        out = StringIO()
+        call_command('reconcile_cart_totals', '--dry-run', stdout=out)
+        self.assertIn('1 of 1 carts', out.getvalue())
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.item_count, 9)
+
+        call_command('reconcile_cart_totals', stdout=StringIO())
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.totals, (2, Decimal('24.50')))
+
+
+class ConcurrencyTestCase(TransactionTestCase):
+    """A TransactionTestCase whose threads can write to the database at once
+
+    The in-memory SQLite test database refuses concurrent writers outright,
+    so on SQLite the class runs against its own file-backed database (named
+    after the process, so parallel runs never share it) and switches back
+    to the in-memory one afterwards. Other databases are used as they are.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls._memory_database = None
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            # close() keeps in-memory connections open, so set it aside
+            # untouched, or the file database would be created inside it
+            cls._memory_database = (connection.settings_dict['NAME'], connection.connection)
+            connection.connection = None
+            connection.settings_dict['TEST']['NAME'] = os.path.join(
+                tempfile.gettempdir(), f'shop_concurrency_{os.getpid()}.sqlite3'
+            )
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if cls._memory_database is not None:
+            name, memory_connection = cls._memory_database
+            connection.creation.destroy_test_db(name, verbosity=0)
+            connection.settings_dict['TEST']['NAME'] = None
+            connection.connection = memory_connection
+
+
+class ConcurrentAddToCartTest(ConcurrencyTestCase):
+
+    threads = 8
+    adds_per_thread = 5
+
+    def setUp(self):
+        category = Category.objects.create(name="Toys", slug="toys")
+        self.product = Product.objects.create(
+            name="Yo-yo", slug="yo-yo", description="A yo-yo.", price=Decimal('3.00'),
+            category=category, stock=500,
+        )
+        self.user = User.objects.create_user('racer', password='secret-pass-123')
+        self.cart = Cart.objects.create(user=self.user)
+
+    def hammer(self, barrier, errors):
+        client = Client()
+        client.force_login(self.user)
+        barrier.wait()
+        try:
+            for _ in range(self.adds_per_thread):
+                response = client.post(
+                    reverse('shop:add_to_cart'),
+                    data=json.dumps({'product_id': self.product.id, 'quantity': 1}),
+                    content_type='application/json',
+                )
+                if not response.json().get('success'):
+                    errors.append(response.json())
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            connection.close()
+
+    def test_concurrent_adds_produce_one_line(self):
+        barrier = threading.Barrier(self.threads)
+        errors = []
+        workers = [
+            threading.Thread(target=self.hammer, args=(barrier, errors))
+            for _ in range(self.threads)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+        lines = CartItem.objects.filter(cart=self.cart, product=self.product)
+        self.assertEqual(lines.count(), 1)
+        self.assertEqual(lines.get().quantity, self.threads * self.adds_per_thread)
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.item_count, self.threads * self.adds_per_thread)
+
+
+class AnonymousBrowsingWritesTest(TestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(name="Lamps", slug="lamps")
+        self.lamp = Product.objects.create(
+            name="Desk Lamp", slug="desk-lamp", description="A lamp.", price=Decimal('25.00'),
+            category=self.category, stock=5, is_featured=True,
+        )
+
+    def test_read_only_pages_write_nothing(self):
+        pages = [
+            reverse('shop:home'),
+            reverse('shop:product_list'),
+            reverse('shop:product_list_by_category', args=['lamps']),
+            reverse('shop:product_detail', args=['desk-lamp']),
+            reverse('shop:cart'),
+            reverse('shop:checkout'),
+        ]
+        for page in pages:
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(page)
+            writes = [q['sql'] for q in queries.captured_queries if is_write(q['sql'])]
+            self.assertEqual(writes, [], page)
+        self.assertFalse(Session.objects.exists())
+        self.assertFalse(Cart.objects.exists())
+
+    def test_first_add_creates_session_and_cart(self):
+        self.client.post(reverse('shop:add_to_cart'), {'product_id': self.lamp.id, 'quantity': 1})
+        self.assertEqual(Session.objects.count(), 1)
+        self.assertEqual(Cart.objects.get().item_count, 1)
+        response = self.client.get(reverse('shop:home'))
+        self.assertEqual(response.context['cart_items_count'], 1)
+
+
+@override_settings(SHOP_ANONYMOUS_CART_BACKEND='cache')
+class AnonymousCartBackendTest(TestCase):
+
+    checkout_data = {
+        'first_name': 'Ada', 'last_name': 'Lovelace', 'email': 'ada@example.com',
+        'address': '1 Main St', 'postal_code': '12345', 'city': 'London',
+    }
+
+    def setUp(self):
+        category = Category.objects.create(name="Lamps", slug="lamps")
+        self.lamp = Product.objects.create(
+            name="Desk Lamp", slug="desk-lamp", description="A lamp.", price=Decimal('25.00'),
+            category=category, stock=5,
+        )
+        self.bulb = Product.objects.create(
+            name="Bulb", slug="bulb", description="A bulb.", price=Decimal('3.50'),
+            category=category, stock=50,
+        )
+
+    def add(self, product, quantity):
+        return self.client.post(
+            reverse('shop:add_to_cart'),
+            {'product_id': product.id, 'quantity': quantity},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+
+    def test_cart_mutations_write_nothing(self):
+        for backend in ('cache', 'cookie'):
+            with self.subTest(backend=backend), self.settings(SHOP_ANONYMOUS_CART_BACKEND=backend):
+                self.client = Client()
+                with CaptureQueriesContext(connection) as queries:
+                    self.add(self.lamp, 1)
+                    response = self.add(self.lamp, 2)
+                    self.add(self.bulb, 4)
+                    self.client.post(reverse('shop:update_cart_item', args=[self.bulb.id]), {'quantity': 2})
+                    page = self.client.get(reverse('shop:cart'))
+                writes = [q['sql'] for q in queries.captured_queries if is_write(q['sql'])]
+                self.assertEqual(writes, [])
+                self.assertEqual(json.loads(response.content)['cart_items_count'], 3)
+                self.assertEqual(page.context['cart'].total_price, Decimal('82.00'))
+                self.assertEqual(
+                    sorted((item.product.slug, item.quantity) for item in page.context['cart_items']),
+                    [('bulb', 2), ('desk-lamp', 3)],
+                )
+                self.assertFalse(Session.objects.exists())
+                self.assertFalse(Cart.objects.exists())
+
+    @override_settings(SHOP_ANONYMOUS_CART_BACKEND='cookie')
+    def test_full_cookie_cart_refuses_new_products_visibly(self):
+        fan = Product.objects.create(
+            name="Fan", slug="fan", description="A fan.", price=Decimal('9.00'),
+            category=self.lamp.category, stock=5,
+        )
+        with mock.patch.object(SignedCookieCartStorage, 'max_lines', 2):
+            self.add(self.lamp, 1)
+            self.add(self.bulb, 1)
+            refused = json.loads(self.add(fan, 1).content)
+            self.assertFalse(refused['success'])
+            self.assertIn('at most 2 different products', refused['message'])
+            # More of a product already in the cart is still fine
+            self.assertTrue(json.loads(self.add(self.lamp, 1).content)['success'])
+
+            response = self.client.post(reverse('shop:add_to_cart'), {'product_id': fan.id, 'quantity': 1}, follow=True)
+        self.assertContains(response, 'at most 2 different products')
+        self.assertEqual(
+            sorted((item.product.slug, item.quantity) for item in response.context['cart_items']),
+            [('bulb', 1), ('desk-lamp', 2)],
+        )
+
+    @override_settings(SHOP_ANONYMOUS_CART_BACKEND='cookie')
+    def test_non_positive_adds_are_refused(self):
+        self.add(self.lamp, 2)
+        for quantity in (-3, 0):
+            response = json.loads(self.add(self.bulb, quantity).content)
+            self.assertFalse(response['success'])
+        cart = self.client.get(reverse('shop:cart')).context['cart']
+        self.assertEqual((cart.total_items, cart.total_price), (2, Decimal('50.00')))
+        with self.assertRaises(ValueError):
+            add_item(Cart.objects.create(session_key='lamps'), self.lamp, -1)
+
+    def test_checkout_materializes_order(self):
+        self.add(self.lamp, 2)
+        self.add(self.bulb, 1)
+        response = self.client.post(
+            reverse('shop:checkout'), {**self.checkout_data, 'checkout_token': issue_checkout_token()}
+        )
+        order = Order.objects.get()
+        self.assertRedirects(response, reverse('shop:order_detail', args=[order.id]))
+        self.assertEqual(
+            sorted(order.items.values_list('product__slug', 'quantity', 'price')),
+            [('bulb', 1, Decimal('3.50')), ('desk-lamp', 2, Decimal('25.00'))],
+        )
+        self.assertFalse(Cart.objects.exists())
+        self.assertEqual(self.client.get(reverse('shop:cart')).context['cart_items_count'], 0)
+
+    def test_tampered_cookie_is_ignored(self):
+        self.client.cookies['shop_cart'] = 'forged'
+        response = self.client.get(reverse('shop:cart'))
+        self.assertEqual(response.context['cart'].total_items, 0)
+
+
+class CheckoutTest(TestCase):
+
+    details = AnonymousCartBackendTest.checkout_data
+
+    def setUp(self):
+        self.category = Category.objects.create(name="Mugs", slug="mugs")
+        self.user = User.objects.create_user('buyer', password='secret-pass-123')
+        self.cart = Cart.objects.create(user=self.user)
+
+    def make_product(self, index, stock=10):
+        return Product.objects.create(
+            name=f"Mug {index}", slug=f"mug-{index}", description="A mug.",
+            price=Decimal('4.00') + index, category=self.category, stock=stock,
+        )
+
+    def test_place_order_decrements_stock_and_clears_cart(self):
+        mug, jug = self.make_product(1), self.make_product(2, stock=3)
+        add_item(self.cart, mug, 2)
+        add_item(self.cart, jug, 3)
+        order = place_order(self.cart, self.details, user=self.user)
+        self.assertEqual(
+            sorted(order.items.values_list('product__slug', 'quantity', 'price')),
+            [('mug-1', 2, Decimal('5.00')), ('mug-2', 3, Decimal('6.00'))],
+        )
+        mug.refresh_from_db()
+        jug.refresh_from_db()
+        self.assertEqual((mug.stock, jug.stock), (8, 0))
+        self.assertFalse(self.cart.items.exists())
+        self.assertEqual((order.subtotal, order.item_count), (Decimal('28.00'), 2))
+
+    def test_query_count_does_not_grow_with_lines(self):
+        counts = []
+        for lines in (1, 8):
+            for index in range(lines):
+                add_item(self.cart, self.make_product(lines * 10 + index), 1)
+            with CaptureQueriesContext(connection) as queries:
+                place_order(self.cart, self.details, user=self.user)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_short_stock_rolls_back(self):
+        mug, jug = self.make_product(1), self.make_product(2, stock=1)
+        add_item(self.cart, mug, 1)
+        add_item(self.cart, jug, 2)
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('shop:checkout'), {**self.details, 'checkout_token': issue_checkout_token()}
+        )
+        self.assertRedirects(response, reverse('shop:cart'))
+        self.assertFalse(Order.objects.exists())
+        mug.refresh_from_db()
+        self.assertEqual(mug.stock, 10)
+        self.assertEqual(self.cart.items.count(), 2)
+
+    def test_guard_failure_names_only_the_short_products(self):
+        mug, jug = self.make_product(1), self.make_product(2, stock=2)
+        add_item(self.cart, mug, 1)
+        add_item(self.cart, jug, 2)
+        record_order_sales = checkout.record_order_sales
+
+        def sell_jug_elsewhere(*args):
+            # Another checkout takes the jug between the check and the guarded UPDATE
+            Product.objects.filter(pk=jug.pk).update(stock=1)
+            record_order_sales(*args)
+
+        with mock.patch.object(checkout, 'record_order_sales', sell_jug_elsewhere):
+            with self.assertRaises(InsufficientStock) as raised:
+                place_order(self.cart, self.details, user=self.user)
+        self.assertEqual(raised.exception.products, [jug])
+        self.assertEqual(str(raised.exception), 'Mug 2')
+
+    def test_empty_cart_is_not_a_stock_problem(self):
+        with self.assertRaises(EmptyCart):
+            place_order(self.cart, self.details, user=self.user)
+
+    def test_lines_below_one_are_not_ordered(self):
+        mug, jug = self.make_product(1), self.make_product(2)
+        add_item(self.cart, mug, 1)
+        CartItem.objects.create(cart=self.cart, product=jug, quantity=0)
+        order = place_order(self.cart, self.details, user=self.user)
+        self.assertEqual(list(order.items.values_list('product__slug', 'quantity')), [('mug-1', 1)])
+        jug.refresh_from_db()
+        self.assertEqual(jug.stock, 10)
+
+        negative = AnonymousCart(storage=None, quantities={jug.id: -3}, prices={jug.id: jug.price})
+        with self.assertRaises(EmptyCart):
+            place_order(negative, self.details)
+
+    def test_lock_timeout_asks_to_retry(self):
+        add_item(self.cart, self.make_product(1), 1)
+        self.client.force_login(self.user)
+        with mock.patch.object(checkout, '_place_order', side_effect=OperationalError('database is locked')):
+            response = self.client.post(
+                reverse('shop:checkout'), {**self.details, 'checkout_token': issue_checkout_token()}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Please try again')
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.cart.items.count(), 1)
+
+    def test_replayed_submission_returns_existing_order(self):
+        add_item(self.cart, self.make_product(1), 1)
+        self.client.force_login(self.user)
+        form = self.client.get(reverse('shop:checkout')).context['form']
+        data = {**self.details, 'checkout_token': form['checkout_token'].value()}
+        first = self.client.post(reverse('shop:checkout'), data)
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.post(reverse('shop:checkout'), data)
+        order = Order.objects.get()
+        self.assertRedirects(first, reverse('shop:order_detail', args=[order.id]))
+        self.assertRedirects(second, reverse('shop:order_detail', args=[order.id]), fetch_redirect_response=False)
+        self.assertEqual([q for q in queries.captured_queries if is_write(q['sql'])], [])
+        self.assertEqual(OrderItem.objects.count(), 1)
+
+    def test_racing_submission_gets_the_winning_order(self):
+        mug = self.make_product(1)
+        add_item(self.cart, mug, 1)
+        winner = place_order(self.cart, self.details, user=self.user, checkout_token='abc')
+        add_item(self.cart, mug, 1)
+        self.assertEqual(place_order(self.cart, self.details, user=self.user, checkout_token='abc'), winner)
+        mug.refresh_from_db()
+        self.assertEqual(mug.stock, 9)
+        self.assertEqual(self.cart.items.count(), 1)
+
+    def test_forged_token_is_rejected(self):
+        add_item(self.cart, self.make_product(1), 1)
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('shop:checkout'), {**self.details, 'checkout_token': 'forged'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('checkout_token', response.context['form'].errors)
+        self.assertFalse(Order.objects.exists())
+
+
+class ConcurrentCheckoutTest(ConcurrencyTestCase):
+
+    buyers = 6
+
+    def setUp(self):
+        category = Category.objects.create(name="Toys", slug="toys")
+        self.product = Product.objects.create(
+            name="Yo-yo", slug="yo-yo", description="A yo-yo.", price=Decimal('3.00'),
+            category=category, stock=2,
+        )
+        self.users = []
+        for index in range(self.buyers):
+            user = User.objects.create_user(f'buyer{index}', password='secret-pass-123')
+            add_item(Cart.objects.create(user=user), self.product, 1)
+            self.users.append(user)
+
+    def buy(self, user, barrier, outcomes, errors):
+        client = Client()
+        client.force_login(user)
+        barrier.wait()
+        try:
+            response = client.post(
+                reverse('shop:checkout'),
+                {**AnonymousCartBackendTest.checkout_data, 'checkout_token': issue_checkout_token()},
+            )
+            outcomes.append((response.get('Location', ''), [str(m) for m in response.wsgi_request._messages]))
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            connection.close()
+
+    def test_no_overselling(self):
+        barrier = threading.Barrier(self.buyers)
+        outcomes, errors = [], []
+        workers = [
+            threading.Thread(target=self.buy, args=(user, barrier, outcomes, errors)) for user in self.users
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(errors, [])
+        self.product.refresh_from_db()
+        sold = sum(OrderItem.objects.values_list('quantity', flat=True))
+        self.assertGreaterEqual(sold, 1)
+        self.assertEqual(sold + self.product.stock, 2)
+        self.assertEqual(Order.objects.count(), sold)
+
+        # Every buyer got an order or a clean "out of stock" / "try again" page
+        order_urls = {reverse('shop:order_detail', args=[pk]) for pk in Order.objects.values_list('pk', flat=True)}
+        placed = [location for location, _ in outcomes if location in order_urls]
+        refused = [messages for location, messages in outcomes if location not in order_urls]
+        self.assertEqual(sorted(placed), sorted(order_urls))
+        self.assertEqual(len(refused), self.buyers - sold)
+        for messages in refused:
+            self.assertTrue(
+                any('Not enough stock' in message or 'Please try again' in message for message in messages),
+                messages,
+            )
+
+
+class OrderHistoryTest(TestCase):
+
+    def setUp(self):
+        category = Category.objects.create(name="Pens", slug="pens")
+        self.products = [
+            Product.objects.create(
+                name=f"Pen {index}", slug=f"pen-{index}", description="A pen.",
+                price=Decimal('2.00') + index, category=category, stock=100,
+            )
+            for index in range(5)
+        ]
+        self.user = User.objects.create_user('writer', password='secret-pass-123')
+        self.client.force_login(self.user)
+
+    def place_orders(self, count):
+        for _ in range(count):
+            order = Order.objects.create(
+                user=self.user, first_name='A', last_name='B', email='a@example.com',
+                address='1 Main St', postal_code='1', city='X',
+            )
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, price=product.price, quantity=2)
+                for product in self.products
+            ])
+        recalculate_order_totals(Order.objects.filter(user=self.user))
+
+    def history_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('shop:order_history'))
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_query_count_is_fixed(self):
+        self.place_orders(1)
+        self.history_queries()  # warm the cached nav categories
+        _, few = self.history_queries()
+        self.place_orders(30)
+        response, many = self.history_queries()
+        self.assertEqual(few, many)
+        self.assertTrue(response.context['orders'].has_other_pages())
+
+    def test_annotated_totals_and_preview(self):
+        self.place_orders(1)
+        response, _ = self.history_queries()
+        order = response.context['orders'][0]
+        self.assertEqual(order.item_count, 5)
+        self.assertEqual(order.subtotal, Decimal('40.00'))
+        self.assertEqual(len(order.preview_items), 3)
+        self.assertContains(response, '+2 more items')
+
+    def test_backfill_command(self):
+        self.place_orders(3)
+        Order.objects.update(subtotal=0, item_count=0)
+        out = StringIO()
+        call_command('backfill_order_totals', '--batch-size', '2', stdout=out)
+        self.assertIn('Backfilled totals for 3 orders', out.getvalue())
+        self.assertEqual(
+            set(Order.objects.values_list('subtotal', 'item_count')), {(Decimal('40.00'), 5)}
+        )
+
+
+class OrderAdminChangelistTest(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('boss', 'boss@example.com', 'secret-pass-123')
+        self.client.force_login(self.admin)
+
+    def make_orders(self, count):
+        Order.objects.bulk_create([
+            Order(
+                first_name='A', last_name='B', email='a@example.com', address='1 Main St',
+                postal_code='1', city='X', subtotal=Decimal(index), item_count=index % 4 + 1,
+            )
+            for index in range(count)
+        ])
+
+    def changelist(self, query=''):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('custom_admin:shop_order_changelist') + query)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_query_count_is_fixed_and_columns_sort(self):
+        self.make_orders(3)
+        _, few = self.changelist()
+        self.make_orders(40)
+        _, many = self.changelist()
+        self.assertEqual(few, many)
+        field = OrderAdmin.list_display.index('subtotal') + 1
+        response, _ = self.changelist(f'?o=-{field}')
+        self.assertEqual(response.context['cl'].result_list[0].subtotal, Decimal('39'))
+
+    def test_estimated_count_for_large_unfiltered_tables(self):
+        self.make_orders(5)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE shop_order')
+        paginator = EstimatedCountPaginator(Order.objects.all(), 25)
+        paginator.estimate_threshold = 1
+        self.assertEqual(estimated_row_count(Order.objects.all()), 5)
+        self.assertEqual(paginator.count, 5)
+        filtered = EstimatedCountPaginator(Order.objects.filter(item_count=1), 25)
+        filtered.estimate_threshold = 1
+        self.assertEqual(filtered.count, 2)
+
+
+class CategoryCountsTest(TestCase):
+
+    def setUp(self):
+        # Fragment invalidation runs on commit, which TestCase only simulates
+        with self.captureOnCommitCallbacks(execute=True):
+            self.categories = [
+                Category.objects.create(name=f"Shelf {index}", slug=f"shelf-{index}") for index in range(3)
+            ]
+            for index, category in enumerate(self.categories):
+                for number in range(index + 1):
+                    Product.objects.create(
+                        name=f"Item {index}-{number}", slug=f"item-{index}-{number}", description="An item.",
+                        price=Decimal('1.00'), category=category, stock=1, is_active=number != 0,
+                    )
+
+    def test_admin_changelist_annotates_counts(self):
+        self.client.force_login(User.objects.create_superuser('boss', 'boss@example.com', 'secret-pass-123'))
+        url = reverse('custom_admin:shop_category_changelist')
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name="Empty", slug="empty")
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url + '?o=-4')
+        self.assertEqual(len(few), len(many))
+        first = response.context['cl'].result_list[0]
+        self.assertEqual((first.slug, first.product_total, first.active_product_count), ('shelf-2', 3, 2))
+        self.assertContains(response, '2 active</a>')
+
+    def test_nav_counts_are_cached_and_invalidated(self):
+        self.client.get(reverse('shop:cart'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('shop:cart'))
+        self.assertFalse([q for q in queries.captured_queries if 'shop_category' in q['sql']])
+        counts = {c['slug']: c['active_product_count'] for c in response.context['nav_categories']}
+        self.assertEqual(counts, {'shelf-0': 0, 'shelf-1': 1, 'shelf-2': 2})
+
+        Product.objects.filter(slug='item-2-0').update(is_active=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get(slug='item-2-0').save()
+        response = self.client.get(reverse('shop:cart'))
+        self.assertEqual(response.context['nav_categories'][2]['active_product_count'], 3)
+
+
+class DashboardStatsTest(TestCase):
+
+    def setUp(self):
+        cache.delete(STATS_CACHE_KEY)
+        category = Category.objects.create(name="Tools", slug="tools")
+        self.products = [
+            Product.objects.create(
+                name=f"Tool {stock}", slug=f"tool-{stock}", description="A tool.",
+                price=Decimal('10.00'), category=category, stock=stock,
+            )
+            for stock in (0, 3, 10, 50)
+        ]
+        self.user = User.objects.create_user('fixer', password='secret-pass-123')
+
+    def checkout(self, quantity):
+        cart = Cart.objects.create(user=self.user)
+        add_item(cart, self.products[3], quantity)
+        place_order(cart, CheckoutTest.details, user=self.user)
+
+    def test_checkout_updates_counters(self):
+        self.checkout(2)
+        self.checkout(1)
+        stats = compute_dashboard_stats()
+        self.assertEqual(stats['total_orders'], 2)
+        self.assertEqual(stats['total_revenue'], Decimal('30.00'))
+        self.assertEqual(stats['total_products'], 4)
+        self.assertEqual(stats['low_stock_count'], 2)
+
+    def test_admin_index_uses_cached_stats(self):
+        self.checkout(1)
+        self.client.force_login(User.objects.create_superuser('boss', 'boss@example.com', 'secret-pass-123'))
+        response = self.client.get(reverse('custom_admin:index'))
+        self.assertEqual(response.context['total_orders'], 1)
+        self.checkout(1)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('custom_admin:index'))
+        self.assertEqual(response.context['total_orders'], 1)
+        self.assertFalse([q for q in queries.captured_queries if 'shop_statcounter' in q['sql']])
+
+    def test_stale_stats_are_served_while_another_request_refreshes(self):
+        cache.set(STATS_CACHE_KEY, {'stats': {'total_orders': 7}, 'expires': 0}, 60)
+        cache.add(STATS_LOCK_KEY, True, 30)
+        try:
+            with self.assertNumQueries(0):
+                self.assertEqual(get_dashboard_stats(), {'total_orders': 7})
+        finally:
+            cache.delete(STATS_LOCK_KEY)
+        self.assertEqual(get_dashboard_stats()['total_orders'], 0)
+
+    def test_cancelling_takes_revenue_off_the_total(self):
+        self.checkout(2)
+        self.checkout(1)
+        first = Order.objects.order_by('id').first()
+        change_order_status(Order.objects.filter(pk=first.pk), 'cancelled')
+        stats = compute_dashboard_stats()
+        self.assertEqual((stats['total_orders'], stats['total_revenue']), (2, Decimal('10.00')))
+        self.assertEqual(stats['total_revenue'], recent_revenue())
+        rebuild_counters()
+        self.assertEqual(counter_values()['revenue'], Decimal('10.00'))
+
+        change_order_status(Order.objects.filter(pk=first.pk), 'processing')
+        self.assertEqual(counter_values()['revenue'], Decimal('30.00'))
+
+    def test_rebuild_counters(self):
+        self.checkout(3)
+        StatCounter.objects.all().delete()
+        rebuild_counters()
+        self.assertEqual(counter_values(), {'orders': Decimal('1'), 'revenue': Decimal('30.00')})
+
+
+class DailySalesRollupTest(TestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(name="Bags", slug="bags")
+        self.tote = Product.objects.create(
+            name="Tote", slug="tote", description="A tote.", price=Decimal('12.00'),
+            category=self.category, stock=100,
+        )
+        self.satchel = Product.objects.create(
+            name="Satchel", slug="satchel", description="A satchel.", price=Decimal('30.00'),
+            category=self.category, stock=100,
+        )
+        self.user = User.objects.create_user('carrier', password='secret-pass-123')
+
+    def checkout(self, *lines):
+        cart = Cart.objects.create(user=self.user)
+        for product, quantity in lines:
+            add_item(cart, product, quantity)
+        order = place_order(cart, CheckoutTest.details, user=self.user)
+        cart.delete()
+        return order
+
+    def rollup(self):
+        return set(DailySales.objects.filter(line_count__gt=0).values_list(
+            'product__slug', 'status', 'quantity', 'revenue', 'line_count'
+        ))
+
+    def test_checkout_and_status_changes_update_rollup(self):
+        first = self.checkout((self.tote, 2), (self.satchel, 1))
+        self.checkout((self.tote, 1))
+        self.assertEqual(self.rollup(), {
+            ('tote', 'pending', 3, Decimal('36.00'), 2),
+            ('satchel', 'pending', 1, Decimal('30.00'), 1),
+        })
+
+        self.client.force_login(User.objects.create_superuser('boss', 'boss@example.com', 'secret-pass-123'))
+        self.client.post(
+            reverse('custom_admin:shop_order_change', args=[first.id]), {'status': 'shipped'}
+        )
+        self.client.post(reverse('custom_admin:shop_order_changelist'), {
+            'action': 'mark_as_cancelled', '_selected_action': [first.id],
+        })
+        first.refresh_from_db()
+        self.assertEqual(first.status, 'cancelled')
+        self.assertEqual(self.rollup(), {
+            ('tote', 'pending', 1, Decimal('12.00'), 1),
+            ('tote', 'cancelled', 2, Decimal('24.00'), 1),
+            ('satchel', 'cancelled', 1, Decimal('30.00'), 1),
+        })
+        today = timezone.localdate()
+        self.assertEqual(sales_by_day(today, today), [
+            {'date': today, 'quantity': 1, 'revenue': Decimal('12.00')},
+        ])
+
+    def test_bulk_change_merges_deltas_from_mixed_statuses(self):
+        pending = self.checkout((self.tote, 1))
+        processing = self.checkout((self.tote, 2))
+        change_order_status(Order.objects.filter(pk=processing.pk), 'processing')
+
+        with mock.patch.object(rollups, '_upsert_rows', wraps=rollups._upsert_rows) as upsert:
+            changed = change_order_status(Order.objects.filter(pk__in=[pending.pk, processing.pk]), 'shipped')
+        self.assertEqual(changed, 2)
+        # One row per (date, product, status): Postgres rejects touching a row twice
+        rows = upsert.call_args.args[0]
+        keys = [(date, product_id, status) for date, product_id, _, status, *_ in rows]
+        self.assertEqual(len(keys), len(set(keys)))
+        self.assertEqual(self.rollup(), {('tote', 'shipped', 3, Decimal('36.00'), 2)})
+
+    def test_rebuild_matches_incremental_rollup(self):
+        order = self.checkout((self.tote, 2), (self.satchel, 1))
+        self.checkout((self.satchel, 4))
+        change_order_status(Order.objects.filter(pk=order.pk), 'delivered')
+        incremental = self.rollup()
+        out = StringIO()
+        call_command('rebuild_daily_sales', '--batch-size', '1', stdout=out)
+        self.assertIn('Rebuilt daily sales from 2 orders', out.getvalue())
+        self.assertEqual(self.rollup(), incremental)
+        top = sales_by_product(timezone.localdate(), timezone.localdate(), limit=1)
+        self.assertEqual(top[0]['product__name'], 'Satchel')
+
+
+class CsvExportTest(TestCase):
+
+    def setUp(self):
+        category = Category.objects.create(name="Hats", slug="hats")
+        for index in range(5):
+            Product.objects.create(
+                name=f"Hat {index}", slug=f"hat-{index}", description="A hat.",
+                price=Decimal('15.00'), category=category, stock=index,
+            )
+        self.client.force_login(User.objects.create_superuser('boss', 'boss@example.com', 'secret-pass-123'))
+
+    def export(self, action):
+        response = self.client.post(reverse('custom_admin:shop_product_changelist'), {
+            'action': action, '_selected_action': list(Product.objects.values_list('id', flat=True)),
+        })
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_admin_action_streams_csv(self):
+        response, body = self.export('export_csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.reader(io.StringIO(body.decode())))
+        self.assertEqual(rows[0][:4], ['id', 'name', 'slug', 'category'])
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[1][1:4], ['Hat 0', 'hat-0', 'Hats'])
+
+    def test_gzip_action_and_command_agree(self):
+        _, body = self.export('export_csv_gzip')
+        with tempfile.NamedTemporaryFile(suffix='.csv') as output:
+            call_command('export_csv', 'products', '--output', output.name, '--chunk-size', '2', stderr=StringIO())
+            self.assertEqual(gzip.decompress(body), output.read())
+
+    def test_export_reads_in_chunks(self):
+        with CaptureQueriesContext(connection) as queries:
+            chunks = list(export_stream(Product.objects.all(), PRODUCT_COLUMNS, chunk_size=2))
+        self.assertEqual(len(b''.join(chunks).splitlines()), 6)
+        self.assertEqual(len([q for q in queries.captured_queries if 'shop_product' in q['sql']]), 1)
+
+
+class ImportProductsTest(TestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(name="Lamps", slug="lamps")
+        self.existing = Product.objects.create(
+            name="Old Lamp", slug="old-lamp", description="Old.", price=Decimal('9.00'),
+            category=self.category, stock=1,
+        )
+
+    def feed(self, suffix, content):
+        handle = tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False)
+        handle.write(content)
+        handle.close()
+        self.addCleanup(os.remove, handle.name)
+        return handle.name
+
+    def run_import(self, *args):
+        out = StringIO()
+        call_command('import_products', *args, stdout=out)
+        return out.getvalue()
+
+    def test_csv_upsert_by_slug(self):
+        path = self.feed('.csv', (
+            'slug,name,price,category,stock,is_active\n'
+            'old-lamp,Old Lamp v2,11.50,lamps,4,true\n'
+            'new-lamp,New Lamp,20,lamps,7,\n'
+            'bad-lamp,Bad Lamp,cheap,lamps,1,\n'
+            'lost-lamp,Lost Lamp,5,nowhere,1,\n'
+        ))
+        output = self.run_import(path, '--batch-size', '1')
+        self.assertIn('Imported 1 new and 1 updated products, skipped 2 invalid', output)
+        self.assertIn("Line 4: invalid price 'cheap'", output)
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.name, self.existing.price, self.existing.stock), ('Old Lamp v2', Decimal('11.50'), 4))
+        self.assertEqual(Product.objects.get(slug='new-lamp').price, Decimal('20.00'))
+        self.assertEqual(search_products(Product.objects.all(), 'new lamp').get().slug, 'new-lamp')
+
+    def test_import_reindexes_only_the_imported_products(self):
+        untouched = Product.objects.create(
+            name="Floor Lamp", slug="floor-lamp", description="Tall.", price=Decimal('40.00'),
+            category=self.category, stock=1,
+        )
+        # Give the untouched product an index row a full rebuild would replace
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE shop_product_fts SET name = 'Sentinel' WHERE rowid = %s", [untouched.pk])
+        path = self.feed('.csv', 'slug,name,price,category\nold-lamp,Brass Lamp,12,lamps\n')
+        self.run_import(path)
+        self.assertEqual(search_products(Product.objects.all(), 'brass').get(), self.existing)
+        self.assertFalse(search_products(Product.objects.all(), 'old').exists())
+        self.assertEqual(search_products(Product.objects.all(), 'sentinel').get(), untouched)
+
+    def test_jsonl_dry_run_writes_nothing(self):
+        path = self.feed('.jsonl', '\n'.join(json.dumps(record) for record in [
+            {'slug': 'desk-lamp', 'name': 'Desk Lamp', 'price': '30', 'category': 'desks'},
+            {'slug': 'old-lamp', 'name': 'Renamed', 'price': '1', 'category': 'lamps'},
+        ]))
+        with CaptureQueriesContext(connection) as queries:
+            output = self.run_import(path, '--dry-run', '--create-categories')
+        self.assertIn('Dry run: 1 to create, 1 to update, 0 invalid', output)
+        self.assertEqual([q['sql'] for q in queries.captured_queries if is_write(q['sql'])], [])
+        self.assertFalse(Category.objects.filter(slug='desks').exists())
+
+    def test_create_categories(self):
+        path = self.feed('.jsonl', json.dumps(
+            {'slug': 'desk-lamp', 'name': 'Desk Lamp', 'price': '30', 'category': 'desk-lighting'}
+        ))
+        self.run_import(path, '--create-categories')
+        self.assertEqual(Product.objects.get(slug='desk-lamp').category.name, 'Desk Lighting')
+
+
+class GenerateDatasetTest(TestCase):
+    SIZES = dict(categories=3, products=50, users=10, carts=6, orders=40, days=30, batch_size=16)
+
+    def generate(self, **options):
+        return DatasetGenerator(end_date=timezone.localdate(), **dict(self.SIZES, **options)).run()
+
+    def fingerprint(self):
+        return list(Order.objects.order_by('id').values_list(
+            'email', 'status', 'subtotal', 'item_count', 'created_at', 'items__product__slug', 'items__quantity'
+        ))
+
+    def test_sizes_totals_and_rollups(self):
+        stats = self.generate()
+        self.assertEqual(
+            (Category.objects.count(), Product.objects.count(), User.objects.count(), Cart.objects.count(), Order.objects.count()),
+            (3, 50, 10, 6, 40),
+        )
+        self.assertEqual(stats.counts['order_items'], OrderItem.objects.count())
+        stored = list(Order.objects.order_by('id').values_list('subtotal', 'item_count'))
+        recalculate_order_totals(Order.objects.all())
+        self.assertEqual(list(Order.objects.order_by('id').values_list('subtotal', 'item_count')), stored)
+        # Orders keep their generated dates and the derived tables were rebuilt
+        self.assertGreater(Order.objects.dates('created_at', 'day').count(), 20)
+        self.assertEqual(StatCounter.objects.filter(name='orders').aggregate(total=Sum('value'))['total'], 40)
+        self.assertEqual(
+            DailySales.objects.aggregate(total=Sum('line_count'))['total'], OrderItem.objects.count()
+        )
+
+    def test_same_seed_same_dataset(self):
+        self.generate(seed=7)
+        first = self.fingerprint()
+        call_command('generate_dataset', '--replace', '--seed', '7', '--end-date', timezone.localdate().isoformat(),
+                     *[f'--{name.replace("_", "-")}={value}' for name, value in self.SIZES.items()], stdout=StringIO())
+        self.assertEqual(self.fingerprint(), first)
+        self.assertFalse(Product.objects.exclude(slug__startswith=SYNTHETIC_PREFIX).exists())
+
+    def test_delete_skips_signals_and_keeps_real_data(self):
+        self.generate()
+        real = Product.objects.create(
+            name="Real Lamp", slug="real-lamp", description="Real.", price=Decimal('5.00'),
+            category=Category.objects.create(name="Real", slug="real"), stock=1,
+        )
+        with mock.patch('shop.signals.get_search_backend') as signal_backend:
+            with CaptureQueriesContext(connection) as queries:
+                with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                    delete_synthetic_data()
+        signal_backend.assert_not_called()
+        self.assertEqual(len(callbacks), 1)
+        # One statement per table, whatever the dataset size
+        self.assertLess(len(queries), 20)
+        self.assertFalse(synthetic_data_exists())
+        self.assertFalse(Order.objects.exists() or OrderItem.objects.exists() or DailySales.objects.exists())
+        self.assertEqual(list(Product.objects.all()), [real])
+        self.assertEqual(list(search_products(Product.objects.all(), 'lamp')), [real])
+
+    def test_popularity_is_skewed(self):
+        self.generate(orders=400)
+        sales = list(OrderItem.objects.values('product').annotate(lines=Count('id')).order_by('-lines').values_list('lines', flat=True))
+        # The best seller outsells the median product many times over
+        self.assertGreater(sales[0], 10 * sales[len(sales) // 2])
+
+    def test_refuses_to_duplicate_without_replace(self):
+        self.generate()
+        with self.assertRaisesMessage(CommandError, '--replace'):
+            call_command('generate_dataset', '--products=5', '--orders=5', stdout=StringIO())
+
+
+class IntegrityCheckTest(TestCase):
+
+    def setUp(self):
+        category = Category.objects.create(name="Tools", slug="tools")
+        self.hammer = Product.objects.create(
+            name="Hammer", slug="hammer", description="Steel.", price=Decimal('12.00'), category=category, stock=3,
+        )
+        self.orders = [Order.objects.create(
+            first_name="Ada", last_name="Lovelace", email="ada@example.com",
+            address="1 Analytical St", postal_code="12345", city="London",
+        ) for _ in range(3)]
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=self.hammer, price=Decimal('12.00'), quantity=2) for order in self.orders
+        ])
+        recalculate_order_totals(Order.objects.all())
+        self.cart = Cart.objects.create(session_key='integrity')
+        add_item(self.cart, self.hammer, 2)
+
+    def run_command(self, *args):
+        out = StringIO()
+        try:
+            call_command(*args, stdout=out)
+        except CommandError as exc:
+            return out.getvalue(), exc
+        return out.getvalue(), None
+
+    def test_fix_order_items_is_set_based_and_chunked(self):
+        broken = OrderItem.objects.filter(order__in=self.orders[:2])
+        broken.update(quantity=0)
+
+        output, _ = self.run_command('fix_order_items', '--dry-run', '--batch-size', '1')
+        self.assertIn('Dry run: 2 items need fixing.', output)
+        self.assertIn(f'Scanned items up to id {OrderItem.objects.order_by("id").first().id} of', output)
+        self.assertEqual(broken.filter(quantity=0).count(), 2)
+
+        # One range scan and, with violations, two UPDATEs plus the totals UPDATE per batch
+        with CaptureQueriesContext(connection) as queries:
+            output, _ = self.run_command('fix_order_items', '--batch-size', '1000')
+        self.assertIn('Fixed 2 items', output)
+        self.assertLessEqual(len(queries), 10)
+        self.assertFalse(OrderItem.objects.filter(quantity=0).exists())
+        self.assertEqual(Order.objects.get(pk=self.orders[0].pk).subtotal, Decimal('12.00'))
+
+    def test_check_integrity_reports_and_repairs(self):
+        Order.objects.filter(pk=self.orders[0].pk).update(subtotal=Decimal('1.00'))
+        Cart.objects.filter(pk=self.cart.pk).update(item_count=7)
+        Product.objects.filter(pk=self.hammer.pk).update(stock=1)
+
+        output, error = self.run_command('check_integrity', '--batch-size', '2')
+        self.assertIn(f'order_totals: 1 orders whose stored totals disagree with their lines (e.g. ids {self.orders[0].pk})', output)
+        self.assertIn('cart_totals: 1 carts', output)
+        self.assertIn('cart_over_stock: 1 cart lines', output)
+        self.assertIn('order_items: OK', output)
+        self.assertIn('3 integrity check(s)', str(error))
+
+        output, error = self.run_command('check_integrity', 'order_totals', 'cart_totals', '--repair')
+        self.assertIsNone(error)
+        self.assertIn('repaired', output)
+        self.assertEqual(Order.objects.get(pk=self.orders[0].pk).subtotal, Decimal('24.00'))
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.item_count, 2)
+
+        _, error = self.run_command('check_integrity', 'no_such_check')
+        self.assertIn('Unknown check(s): no_such_check', str(error))
+
+
+@override_settings(SHOP_PAGE_CACHE_TIMEOUT=0)
+class HomeFragmentCacheTest(TestCase):
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category = Category.objects.create(name="Kites", slug="kites")
+            self.kite = Product.objects.create(
+                name="Box Kite", slug="box-kite", description="Flies.", price=Decimal('15.00'),
+                category=self.category, stock=1, is_featured=True,
+            )
+
+    def catalogue_queries(self, path=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path or reverse('shop:home'))
+        return response, [
+            q['sql'] for q in queries.captured_queries if 'shop_product' in q['sql'] or 'shop_category' in q['sql']
+        ]
+
+    def test_home_renders_without_catalogue_queries_when_warm(self):
+        self.catalogue_queries()
+        response, queries = self.catalogue_queries()
+        self.assertEqual(queries, [])
+        self.assertContains(response, 'Box Kite')
+        self.assertContains(response, 'In Stock')
+
+    def test_signals_and_bulk_admin_actions_move_the_version(self):
+        self.catalogue_queries()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.name = "Stunt Kites"
+            self.category.save()
+        response, queries = self.catalogue_queries()
+        self.assertTrue(queries)
+        self.assertContains(response, 'Stunt Kites')
+
+        self.client.force_login(User.objects.create_superuser('boss', 'boss@example.com', 'secret-pass-123'))
+        version = catalogue_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('custom_admin:shop_product_changelist'), {
+                'action': 'make_unfeatured', '_selected_action': [self.kite.pk],
+            })
+        self.assertGreater(catalogue_version(), version)
+        self.assertNotContains(self.client.get(reverse('shop:home')), 'Box Kite')
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'shop_test_cache'},
+    })
+    def test_a_bump_in_another_worker_retires_this_workers_fragments(self):
+        call_command('createcachetable', verbosity=0)
+        self.catalogue_queries()
+        _, queries = self.catalogue_queries()
+        self.assertEqual(queries, [])
+        # Another worker's own cache connection, as in a separate gunicorn process
+        other_worker = caches.create_connection('default')
+        with mock.patch.object(fragments, 'cache', other_worker):
+            bump_catalogue_version()
+        _, queries = self.catalogue_queries()
+        self.assertTrue(queries)
+
+    def test_selling_out_moves_the_version(self):
+        self.catalogue_queries()
+        cart = Cart.objects.create(session_key='kites')
+        add_item(cart, self.kite, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(cart, CheckoutTest.details)
+        response, _ = self.catalogue_queries()
+        self.assertContains(response, 'Out of Stock')
+
+
+class PageCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            category = Category.objects.create(name="Kites", slug="kites")
+            self.kite = Product.objects.create(
+                name="Box Kite", slug="box-kite", description="Flies.", price=Decimal('15.00'),
+                category=category, stock=5, is_featured=True,
+            )
+
+    def get(self, client, path, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(path, params)
+        return response, [q['sql'] for q in queries.captured_queries if 'shop_product' in q['sql']]
+
+    def test_anonymous_hits_skip_rendering_and_keep_their_own_csrf_token(self):
+        url = self.kite.get_absolute_url()
+        first, _ = self.get(Client(), url)
+        self.assertEqual(first['X-Page-Cache'], 'miss')
+
+        visitor = Client(enforce_csrf_checks=True)
+        response, queries = self.get(visitor, url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        # Only the conditional-GET validator lookup; nothing is rendered
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"updated_at"', queries[0])
+        self.assertNotContains(response, 'page-cache-')
+        token = re.search(rb'name="csrfmiddlewaretoken" value="([^"]+)"', response.content).group(1).decode()
+        added = visitor.post(reverse('shop:add_to_cart'), {
+            'product_id': self.kite.pk, 'quantity': 2, 'csrfmiddlewaretoken': token,
+        })
+        self.assertEqual(added.status_code, 302)
+
+        # Pages bypass the cache while the "added to cart" message is pending
+        self.assertFalse(visitor.get(url).has_header('X-Page-Cache'))
+        # The shared page shows this visitor's cart, and nobody else's
+        mine, _ = self.get(visitor, url)
+        theirs, _ = self.get(Client(), url)
+        self.assertEqual((mine['X-Page-Cache'], theirs['X-Page-Cache']), ('hit', 'hit'))
+        badge = rb'badge rounded-pill bg-danger">\s*(\d+)\s*<'
+        self.assertEqual(re.search(badge, mine.content).group(1), b'2')
+        self.assertEqual(re.search(badge, theirs.content).group(1), b'0')
+
+    def test_key_ignores_param_order_blanks_and_tracking(self):
+        url = reverse('shop:product_list')
+        self.get(Client(), url, sort='price_low', category='kites')
+        response, _ = self.get(Client(), url, category='kites', q='', utm_source='mail', sort='price_low')
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        response, _ = self.get(Client(), url, category='kites')
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+
+    def test_logged_in_users_and_catalogue_changes_bypass_the_cache(self):
+        url = reverse('shop:home')
+        self.get(Client(), url)
+        client = Client()
+        client.force_login(User.objects.create_user('shopper', password='secret-pass-123'))
+        response, _ = self.get(client, url)
+        self.assertFalse(response.has_header('X-Page-Cache'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.kite.name = "Stunt Kite"
+            self.kite.save()
+        response, _ = self.get(Client(), url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Stunt Kite')
+
+
+class ConditionalGetTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name="Kites", slug="kites")
+        self.kite = Product.objects.create(
+            name="Box Kite", slug="box-kite", description="Flies.", price=Decimal('15.00'),
+            category=category, stock=5,
+        )
+        self.url = self.kite.get_absolute_url()
+
+    def revalidate(self, url, response, client=None):
+        return (client or self.client).get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_product_page_returns_304_before_rendering(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response['ETag'].startswith('W/"'))
+        self.assertFalse(response.has_header('Last-Modified'))
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn('private', response['Cache-Control'])
+
+        not_modified = self.revalidate(self.url, response)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.templates, [])
+        self.assertEqual(not_modified.content, b'')
+        # A date cannot vouch for the cart badge or nav: always render
+        since = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=http_date(self.kite.updated_at.timestamp() + 60))
+        self.assertEqual(since.status_code, 200)
+
+        Product.objects.filter(pk=self.kite.pk).update(
+            stock=4, updated_at=self.kite.updated_at + timedelta(seconds=5),
+        )
+        self.assertEqual(self.revalidate(self.url, response).status_code, 200)
+
+    def test_cart_changes_and_pending_messages_defeat_the_etag(self):
+        response = self.client.get(self.url)
+        self.client.post(reverse('shop:add_to_cart'), {'product_id': self.kite.pk, 'quantity': 1})
+        # The "added" flash message is pending: render it, without validators
+        with_message = self.revalidate(self.url, response)
+        self.assertEqual(with_message.status_code, 200)
+        self.assertFalse(with_message.has_header('ETag'))
+        # The badge now reads 1, so the old ETag no longer matches
+        self.assertEqual(self.revalidate(self.url, response).status_code, 200)
+
+    def test_listing_etag_covers_query_and_catalogue_changes(self):
+        url = reverse('shop:product_list')
+        response = self.client.get(url, {'sort': 'price_low'})
+        self.assertEqual(self.client.get(url, {'sort': 'price_low', 'utm_source': 'mail'},
+                                         HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(url, {'sort': 'newest'}, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+        # Bulk admin actions bypass save() but still move updated_at
+        admin = Client()
+        admin.force_login(User.objects.create_superuser('boss', 'boss@example.com', 'secret-pass-123'))
+        admin.post(reverse('custom_admin:shop_product_changelist'), {
+            'action': 'deactivate_products', '_selected_action': [self.kite.pk],
+        })
+        self.assertEqual(self.client.get(url, {'sort': 'price_low'}, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+
+@override_settings(SHOP_PAGE_CACHE_TIMEOUT=0)
+class QueryCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        caches['catalogue'].clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category = Category.objects.create(name="Kites", slug="kites")
+            self.kites = [
+                Product.objects.create(
+                    name=f"Kite {i:02d}", slug=f"kite-{i:02d}", description="Flies.",
+                    price=Decimal('10.00') + i, category=self.category, stock=5,
+                )
+                for i in range(PRODUCTS_PER_PAGE + 3)
+            ]
+
+    def page(self, **params):
+        params = canonical_listing_params(**params)
+        return cached_keyset_page(params, Product.objects.filter(is_active=True), PRODUCTS_PER_PAGE, 'price_low')
+
+    def test_equivalent_requests_share_one_entry(self):
+        url = reverse('shop:product_list')
+        self.client.get(url, {'q': 'Kite', 'min_price': '12', 'category': 'kites', 'sort': 'price_low'})
+        self.client.get(url, {'sort': 'price_low', 'category': ' kites', 'min_price': '12.00', 'q': '  kite!'})
+        # An unparseable price filters nothing, exactly like no price at all
+        self.client.get(url, {'sort': 'price_low', 'min_price': 'cheap'})
+        response = self.client.get(url, {'sort': 'price_low'})
+        self.assertEqual(len(response.context['products'].object_list), PRODUCTS_PER_PAGE)
+
+        stats = query_cache_stats()
+        self.assertEqual((stats['page_misses'], stats['page_hits']), (2, 2))
+        self.assertEqual(stats['page_hit_ratio'], 0.5)
+
+    def test_hits_hydrate_rows_from_the_product_cache(self):
+        first = self.page(sort='price_low')
+        with self.assertNumQueries(0):
+            again = self.page(sort='price_low')
+        self.assertEqual(list(again.object_list), list(first.object_list))
+        self.assertEqual(again.paginator.count, len(self.kites))
+        self.assertEqual(again.next_token, first.next_token)
+
+        # The count is shared by other sort orders of the same filters
+        params = canonical_listing_params(sort='newest')
+        with self.assertNumQueries(1):
+            cached_keyset_page(params, Product.objects.filter(is_active=True), PRODUCTS_PER_PAGE, 'newest')
+
+    def test_catalogue_changes_retire_cached_results(self):
+        self.page(sort='price_low')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.kites[0].is_active = False
+            self.kites[0].save()
+        page = self.page(sort='price_low')
+        self.assertNotIn(self.kites[0], page.object_list)
+        self.assertEqual(page.paginator.count, len(self.kites) - 1)
+        self.assertEqual(query_cache_stats()['page_misses'], 2)
+
+    def test_stats_command_reports_and_resets(self):
+        self.page(sort='price_low')
+        self.page(sort='price_low')
+        out = StringIO()
+        call_command('query_cache_stats', '--reset', stdout=out)
+        self.assertIn('hit ratio 50.0%', out.getvalue())
+        self.assertEqual(query_cache_stats()['page_hits'], 0)
+
+
+@override_settings(SHOP_CATALOGUE_SNAPSHOT=True, SHOP_PAGE_CACHE_TIMEOUT=0)
+class CatalogueSnapshotTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        clear_catalogue_snapshot()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.kites = Category.objects.create(name="Kites", slug="kites")
+            self.yoyos = Category.objects.create(name="Yo-yos", slug="yo-yos")
+            self.products = [
+                Product.objects.create(
+                    name=f"Toy {i % 7}", slug=f"toy-{i:02d}", description="Fun.",
+                    price=Decimal('5.00') + i % 5, category=self.kites if i % 3 else self.yoyos,
+                    stock=i % 4, is_featured=i % 6 == 0, is_active=i != 4,
+                )
+                for i in range(PRODUCTS_PER_PAGE * 2 + 5)
+            ]
+
+    def test_pages_render_without_sql_once_built(self):
+        urls = [
+            reverse('shop:home'),
+            reverse('shop:product_list') + '?sort=price_high&min_price=6&category=kites',
+            self.kites.get_absolute_url(),
+            self.products[1].get_absolute_url(),
+        ]
+        for url in urls:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        for url in urls:
+            with self.assertNumQueries(0):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Toy 1")
+        self.assertEqual(self.client.get(self.products[4].get_absolute_url()).status_code, 404)
+
+    def test_listing_pages_and_cursors_match_the_database(self):
+        snapshot = catalogue_snapshot()
+        for sort in SORT_ORDERINGS:
+            for category, min_price in [(None, None), (self.kites, None), (None, Decimal('6.00'))]:
+                products = Product.objects.filter(is_active=True)
+                if category:
+                    products = products.filter(category=category)
+                if min_price:
+                    products = products.filter(price__gte=min_price)
+                paginator = KeysetPaginator(products, PRODUCTS_PER_PAGE, sort)
+                token = None
+                for step in ['next', 'next', 'prev']:
+                    expected = paginator.get_page(token)
+                    page = snapshot.listing_page(
+                        sort, PRODUCTS_PER_PAGE, token,
+                        category_slug=category and category.slug, min_price=min_price,
+                    )
+                    self.assertEqual([p.pk for p in page], [p.pk for p in expected])
+                    self.assertEqual((page.next_token, page.previous_token),
+                                     (expected.next_token, expected.previous_token))
+                    self.assertEqual(page.paginator.count, products.count())
+                    token = (expected.next_token if step == 'next' else expected.previous_token) or token
+
+    def test_catalogue_changes_swap_in_a_new_snapshot(self):
+        before = catalogue_snapshot()
+        self.assertIs(catalogue_snapshot(), before)
+        with self.captureOnCommitCallbacks(execute=True):
+            product = self.products[1]
+            product.name = "Renamed"
+            product.save()
+        after = catalogue_snapshot()
+        self.assertIsNot(after, before)
+        self.assertEqual(after.product(product.slug).name, "Renamed")
+        # Requests still holding the old snapshot keep a consistent view
+        self.assertEqual(before.product(product.slug).name, "Toy 1")
+
+        with self.settings(SHOP_CATALOGUE_SNAPSHOT_MAX_AGE=0):
+            self.assertIsNot(catalogue_snapshot(), after)
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'shop_test_cache'},
+    })
+    def test_a_write_in_another_worker_swaps_in_a_new_snapshot(self):
+        call_command('createcachetable', verbosity=0)
+        before = catalogue_snapshot()
+        product = self.products[1]
+        # Another worker saves a price change and bumps the shared version
+        Product.objects.filter(pk=product.pk).update(price=Decimal('99.00'))
+        with mock.patch.object(fragments, 'cache', caches.create_connection('default')):
+            bump_catalogue_version()
+        after = catalogue_snapshot()
+        self.assertIsNot(after, before)
+        self.assertEqual(after.product(product.slug).price, Decimal('99.00'))
+
+    def test_memory_report(self):
+        out = StringIO()
+        call_command('catalogue_snapshot', '--compare-orm', stdout=out)
+        self.assertIn(f'{len(self.products) - 1}', out.getvalue())
+        self.assertIn('bytes/product', out.getvalue())
+        self.assertIn('ORM instances', out.getvalue())
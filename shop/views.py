@@ -1,7 +1,6 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
-from django.http import JsonResponse
-from django.db.models import Q
+from django.http import Http404, JsonResponse
 from django.core.paginator import Paginator
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST
@@ -11,91 +10,124 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.forms import AuthenticationForm
 from django.http import HttpResponseRedirect
 from django.urls import reverse
+from django.db.models import Prefetch
 import json
 
 from .models import Product, Category, Cart, CartItem, Order, OrderItem
 from .forms import AddToCartForm, CheckoutForm
+from .fragments import HOME_CATEGORY_LIMIT, HOME_FEATURED_LIMIT, home_categories, home_featured_products
+from .page_cache import cache_anonymous_page
+from .anonymous_cart import CartFull
+from .cart import add_item, get_request_cart, remove_item, set_item_quantity
+from .conditional import (
+    conditional_page, listing_etag, product_etag,
+)
+from .checkout import CheckoutConflict, EmptyCart, InsufficientStock, place_order, replayed_order
+from .pagination import SORT_ORDERINGS
+from .query_cache import cached_keyset_page, cached_numbered_page, canonical_listing_params, clean_price
+from .search import search_products
+from .snapshot import catalogue_snapshot
+
+PRODUCTS_PER_PAGE = 12
+ORDERS_PER_PAGE = 10
+# Lines shown on each order history card
+ORDER_PREVIEW_ITEMS = 3
+RELATED_PRODUCTS_LIMIT = 4
 
 
 def get_or_create_cart(request):
     """Get or create cart for the current user/session"""
-    if request.user.is_authenticated:
-        cart, created = Cart.objects.get_or_create(user=request.user)
-    else:
-        # Ensure session is initialized
-        if not request.session.session_key:
-            request.session.create()
-        
-        cart_id = request.session.get('cart_id')
-        
-        if cart_id:
-            try:
-                cart = Cart.objects.get(id=cart_id)
-            except Cart.DoesNotExist:
-                cart = None
-        else:
-            cart = None
-        
-        if not cart:
-            cart = Cart.objects.create(session_key=request.session.session_key)
-            request.session['cart_id'] = cart.id
-    
-    return cart
+    return get_request_cart(request).get_or_create()
+
+def get_cart(request):
+    """Existing cart for the current user/session, or None
 
+    Read-only pages use this so anonymous visitors get no session or cart
+    row until they first add something.
+    """
+    return get_request_cart(request).get()
+
+def paginate_products(request, products, sort_by, params):
+    """Paginate a product listing by cursor for every keyset-able sort order
+
+    ``params`` are the canonical filters behind ``products``; pages are
+    served from the listing query cache under them.
+    """
+    if sort_by in SORT_ORDERINGS:
+        return cached_keyset_page(params, products, PRODUCTS_PER_PAGE, sort_by, request.GET.get('cursor'))
+    # Relevance-ranked search results are small, so they keep numbered pages
+    return cached_numbered_page(params, products, PRODUCTS_PER_PAGE, request.GET.get('page'))
+
+def pagination_query(request):
+    """Current query string without the pagination parameters"""
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    params.pop('page', None)
+    return params.urlencode()
+
+@cache_anonymous_page
 def home(request):
     """Home page with featured products"""
-    featured_products = Product.objects.filter(is_featured=True, is_active=True)[:6]
-    categories = Category.objects.filter(is_active=True)[:6]
-    
-    context = {
-        'featured_products': featured_products,
-        'categories': categories,
-    }
+    snapshot = catalogue_snapshot()
+    if snapshot is not None:
+        context = {
+            'featured_products': snapshot.featured[:HOME_FEATURED_LIMIT],
+            'categories': snapshot.active_categories[:HOME_CATEGORY_LIMIT],
+        }
+    else:
+        # Both sections come from the versioned fragment cache: no catalogue
+        # queries until an admin edit moves the catalogue version on
+        context = {
+            'featured_products': home_featured_products(),
+            'categories': home_categories(),
+        }
     
     return render(request, 'shop/home.html', context)
 
+@conditional_page(listing_etag)
+@cache_anonymous_page
 def product_list(request):
     """Product list page with search and filtering"""
+    snapshot = catalogue_snapshot()
     products = Product.objects.filter(is_active=True)
-    categories = Category.objects.filter(is_active=True)
+    categories = snapshot.active_categories if snapshot else Category.objects.filter(is_active=True)
     
     # Search functionality
     search_query = request.GET.get('q')
     if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(short_description__icontains=search_query)
-        )
+        products = search_products(products, search_query)
     
     # Category filtering
-    category_slug = request.GET.get('category')
+    category_slug = (request.GET.get('category') or '').strip()
     if category_slug:
         products = products.filter(category__slug=category_slug)
     
-    # Price filtering
-    min_price = request.GET.get('min_price')
-    max_price = request.GET.get('max_price')
-    if min_price:
+    # Price filtering (unparseable prices are ignored)
+    min_price = clean_price(request.GET.get('min_price'))
+    max_price = clean_price(request.GET.get('max_price'))
+    if min_price is not None:
         products = products.filter(price__gte=min_price)
-    if max_price:
+    if max_price is not None:
         products = products.filter(price__lte=max_price)
     
-    # Sorting
-    sort_by = request.GET.get('sort', 'name')
-    if sort_by == 'price_low':
-        products = products.order_by('price')
-    elif sort_by == 'price_high':
-        products = products.order_by('-price')
-    elif sort_by == 'newest':
-        products = products.order_by('-created_at')
+    # Sorting (search results default to relevance)
+    sort_by = request.GET.get('sort') or ('relevance' if search_query else 'name')
+    if sort_by == 'relevance' and search_query:
+        products = products.order_by('-search_rank', 'name', 'id')
+    elif sort_by not in SORT_ORDERINGS:
+        sort_by = 'name'
+    
+    # Pagination (searches rank on the database, everything else can use the snapshot)
+    if snapshot is not None and not search_query:
+        products = snapshot.listing_page(
+            sort_by, PRODUCTS_PER_PAGE, request.GET.get('cursor'),
+            category_slug=category_slug, min_price=min_price, max_price=max_price,
+        )
     else:
-        products = products.order_by('name')
-    
-    # Pagination
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get('page')
-    products = paginator.get_page(page_number)
+        params = canonical_listing_params(
+            q=search_query, category=category_slug, min_price=min_price, max_price=max_price, sort=sort_by,
+        )
+        products = paginate_products(request, products, sort_by, params)
     
     context = {
         'products': products,
@@ -103,17 +135,28 @@ def product_list(request):
         'search_query': search_query,
         'selected_category': category_slug,
         'sort_by': sort_by,
+        'pagination_query': pagination_query(request),
     }
     
     return render(request, 'shop/product_list.html', context)
 
+@conditional_page(product_etag)
+@cache_anonymous_page
 def product_detail(request, slug):
     """Product detail page"""
-    product = get_object_or_404(Product, slug=slug, is_active=True)
-    related_products = Product.objects.filter(
-        category=product.category,
-        is_active=True
-    ).exclude(id=product.id)[:4]
+    # Adding to the cart needs the real row; plain views can use the snapshot
+    snapshot = catalogue_snapshot() if request.method != 'POST' else None
+    if snapshot is not None:
+        product = snapshot.product(slug)
+        if product is None:
+            raise Http404('No Product matches the given query.')
+        related_products = snapshot.related_products(product, RELATED_PRODUCTS_LIMIT)
+    else:
+        product = get_object_or_404(Product, slug=slug, is_active=True)
+        related_products = Product.objects.filter(
+            category=product.category,
+            is_active=True
+        ).exclude(id=product.id)[:RELATED_PRODUCTS_LIMIT]
     
     if request.method == 'POST':
         form = AddToCartForm(request.POST)
@@ -121,15 +164,11 @@ def product_detail(request, slug):
             cart = get_or_create_cart(request)
             quantity = form.cleaned_data['quantity']
             
-            cart_item, created = CartItem.objects.get_or_create(
-                cart=cart,
-                product=product,
-                defaults={'quantity': quantity}
-            )
-            
-            if not created:
-                cart_item.quantity += quantity
-                cart_item.save()
+            try:
+                add_item(cart, product, quantity)
+            except CartFull as exc:
+                messages.error(request, str(exc))
+                return redirect('shop:cart')
             
             messages.success(request, f'{product.name} added to cart!')
             return redirect('shop:cart')
@@ -144,56 +183,56 @@ def product_detail(request, slug):
     
     return render(request, 'shop/product_detail.html', context)
 
-def product_list_by_category(request, slug):
+@conditional_page(listing_etag)
+@cache_anonymous_page
+def product_list_by_category(request, category_slug):
     """Product list filtered by category"""
-    category = get_object_or_404(Category, slug=slug, is_active=True)
-    products = Product.objects.filter(category=category, is_active=True)
+    snapshot = catalogue_snapshot()
+    if snapshot is not None:
+        category = snapshot.category(category_slug)
+        if category is None or not category.is_active:
+            raise Http404('No Category matches the given query.')
+    else:
+        category = get_object_or_404(Category, slug=category_slug, is_active=True)
+    products = Product.objects.filter(category_id=category.id, is_active=True)
     
     # Search within category
     search_query = request.GET.get('q')
+    sort_by = request.GET.get('sort') or ('relevance' if search_query else 'newest')
     if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) |
-            Q(description__icontains=search_query)
-        )
+        products = search_products(products, search_query)
+    if sort_by == 'relevance' and search_query:
+        products = products.order_by('-search_rank', 'name', 'id')
+    elif sort_by not in SORT_ORDERINGS:
+        sort_by = 'newest'
     
     # Pagination
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get('page')
-    products = paginator.get_page(page_number)
+    if snapshot is not None and not search_query:
+        products = snapshot.listing_page(
+            sort_by, PRODUCTS_PER_PAGE, request.GET.get('cursor'), category_slug=category.slug,
+        )
+    else:
+        params = canonical_listing_params(q=search_query, category=category.slug, sort=sort_by)
+        products = paginate_products(request, products, sort_by, params)
     
     context = {
         'products': products,
+        'categories': snapshot.active_categories if snapshot else Category.objects.filter(is_active=True),
         'category': category,
         'search_query': search_query,
+        'sort_by': sort_by,
+        'pagination_query': pagination_query(request),
     }
     
     return render(request, 'shop/product_list.html', context)
 
 def cart(request):
     """Shopping cart page"""
-    cart = get_or_create_cart(request)
-    cart_items = cart.items.all()
-    
-    # Clean up duplicate cart items for the same product
-    products_in_cart = {}
-    items_to_delete = []
-    
-    for item in cart_items:
-        if item.product.id in products_in_cart:
-            # Merge quantities and mark for deletion
-            products_in_cart[item.product.id].quantity += item.quantity
-            products_in_cart[item.product.id].save()
-            items_to_delete.append(item)
-        else:
-            products_in_cart[item.product.id] = item
-    
-    # Delete duplicate items
-    for item in items_to_delete:
-        item.delete()
-    
-    # Refresh cart items after cleanup
-    cart_items = cart.items.all()
+    cart = get_cart(request)
+    if cart:
+        cart_items = cart.items.select_related('product')
+    else:
+        cart_items = CartItem.objects.none()
     
     if request.method == 'POST':
         item_id = request.POST.get('item_id')
@@ -203,13 +242,9 @@ def cart(request):
             cart_item = cart_items.get(id=item_id)
             if action == 'update':
                 quantity = int(request.POST.get('quantity', 1))
-                if quantity > 0:
-                    cart_item.quantity = quantity
-                    cart_item.save()
-                else:
-                    cart_item.delete()
+                set_item_quantity(cart, cart_item, quantity)
             elif action == 'remove':
-                cart_item.delete()
+                remove_item(cart, cart_item)
             
             messages.success(request, 'Cart updated!')
         except CartItem.DoesNotExist:
@@ -218,7 +253,8 @@ def cart(request):
         return redirect('shop:cart')
     
     context = {
-        'cart': cart,
+        # An unsaved Cart renders as an empty cart without touching the DB
+        'cart': cart or Cart(),
         'cart_items': cart_items,
     }
     
@@ -233,14 +269,11 @@ def update_cart(request):
             item_id = data.get('item_id')
             quantity = int(data.get('quantity', 1))
             
-            cart = get_or_create_cart(request)
+            cart = get_cart(request)
+            if cart is None:
+                raise CartItem.DoesNotExist
             cart_item = cart.items.get(id=item_id)
-            
-            if quantity > 0:
-                cart_item.quantity = quantity
-                cart_item.save()
-            else:
-                cart_item.delete()
+            set_item_quantity(cart, cart_item, quantity)
             
             return JsonResponse({
                 'success': True,
@@ -254,8 +287,14 @@ def update_cart(request):
 
 def checkout(request):
     """Checkout page"""
-    cart = get_or_create_cart(request)
-    cart_items = cart.items.all()
+    if request.method == 'POST':
+        # A double-click or retry of a submission that already went through
+        order = replayed_order(request.POST.get('checkout_token'))
+        if order is not None:
+            return redirect('shop:order_detail', order_id=order.id)
+
+    cart = get_cart(request)
+    cart_items = cart.items.select_related('product') if cart else CartItem.objects.none()
     
     if not cart_items.exists():
         messages.warning(request, 'Your cart is empty!')
@@ -264,33 +303,26 @@ def checkout(request):
     if request.method == 'POST':
         form = CheckoutForm(request.POST)
         if form.is_valid():
-            # Create order from form data
-            order = Order.objects.create(
-                first_name=form.cleaned_data['first_name'],
-                last_name=form.cleaned_data['last_name'],
-                email=form.cleaned_data['email'],
-                address=form.cleaned_data['address'],
-                postal_code=form.cleaned_data['postal_code'],
-                city=form.cleaned_data['city'],
-                user=request.user if request.user.is_authenticated else None
-            )
-            
-            # Create order items
-            for cart_item in cart_items:
-                OrderItem.objects.create(
-                    order=order,
-                    product=cart_item.product,
-                    price=cart_item.product.price,
-                    quantity=cart_item.quantity
+            try:
+                order = place_order(
+                    cart, form.cleaned_data,
+                    user=request.user if request.user.is_authenticated else None,
+                    checkout_token=form.cleaned_data['checkout_token'],
                 )
-            
-            # Clear cart
-            cart.items.all().delete()
-            if 'cart_id' in request.session:
-                del request.session['cart_id']
-            
-            messages.success(request, f'Order #{order.id} placed successfully!')
-            return redirect('shop:order_detail', order_id=order.id)
+            except EmptyCart:
+                messages.warning(request, 'Your cart is empty!')
+                return redirect('shop:cart')
+            except InsufficientStock as exc:
+                messages.error(request, f'Not enough stock for: {exc}. Please update your cart.')
+                return redirect('shop:cart')
+            except CheckoutConflict:
+                messages.error(request, 'The shop is busy and your order was not placed. Please try again.')
+            else:
+                if 'cart_id' in request.session:
+                    del request.session['cart_id']
+
+                messages.success(request, f'Order #{order.id} placed successfully!')
+                return redirect('shop:order_detail', order_id=order.id)
     else:
         form = CheckoutForm(user=request.user)
     
@@ -305,10 +337,19 @@ def checkout(request):
 @login_required
 def order_history(request):
     """User's order history"""
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
+    orders = (
+        Order.objects.filter(user=request.user)
+        .prefetch_related(Prefetch(
+            'items',
+            queryset=OrderItem.objects.select_related('product').order_by('id')[:ORDER_PREVIEW_ITEMS],
+            to_attr='preview_items',
+        ))
+        .order_by('-created_at', '-id')
+    )
+    paginator = Paginator(orders, ORDERS_PER_PAGE)
     
     context = {
-        'orders': orders,
+        'orders': paginator.get_page(request.GET.get('page')),
     }
     
     return render(request, 'shop/order_history.html', context)
@@ -358,15 +399,13 @@ def add_to_cart(request):
             product = get_object_or_404(Product, id=product_id, is_active=True)
             cart = get_or_create_cart(request)
             
-            cart_item, created = CartItem.objects.get_or_create(
-                cart=cart,
-                product=product,
-                defaults={'quantity': quantity}
-            )
-            
-            if not created:
-                cart_item.quantity += quantity
-                cart_item.save()
+            try:
+                add_item(cart, product, quantity)
+            except CartFull as exc:
+                if is_ajax or request.content_type == 'application/json':
+                    return JsonResponse({'success': False, 'message': str(exc)})
+                messages.error(request, str(exc))
+                return redirect('shop:cart')
             
             if is_ajax or request.content_type == 'application/json':
                 return JsonResponse({
@@ -401,7 +440,9 @@ def update_cart_item(request, cart_item_id):
             # Check if this is an AJAX request
             is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
             
-            cart = get_or_create_cart(request)
+            cart = get_cart(request)
+            if cart is None:
+                raise CartItem.DoesNotExist
             cart_item = cart.items.get(id=cart_item_id)
             
             # Handle both JSON and form data
@@ -411,16 +452,8 @@ def update_cart_item(request, cart_item_id):
             else:
                 quantity = int(request.POST.get('quantity', 1))
             
-            if quantity > 0:
-                cart_item.quantity = quantity
-                cart_item.save()
-                item_total = cart_item.total_price
-            else:
-                item_total = 0
-                cart_item.delete()
-            
-            # Refresh cart from database to get updated totals
-            cart.refresh_from_db()
+            set_item_quantity(cart, cart_item, quantity)
+            item_total = cart_item.total_price if quantity > 0 else 0
             
             if is_ajax or request.content_type == 'application/json':
                 return JsonResponse({
@@ -457,9 +490,11 @@ def remove_from_cart(request, cart_item_id):
             # Check if this is an AJAX request
             is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
             
-            cart = get_or_create_cart(request)
+            cart = get_cart(request)
+            if cart is None:
+                raise CartItem.DoesNotExist
             cart_item = cart.items.get(id=cart_item_id)
-            cart_item.delete()
+            remove_item(cart, cart_item)
             
             if is_ajax or request.content_type == 'application/json':
                 return JsonResponse({